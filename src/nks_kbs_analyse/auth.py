@@ -5,15 +5,14 @@ sin sesjonshåndtering. Hvis ikke bruker er autentisert prøver vi å åpne en
 nettleser og deretter lese cookies slik at vi kan gjenbruke sessions token.
 """
 
+import asyncio
 import datetime
 import os
+import threading
 import time
-import webbrowser
 from typing import Literal
 
-import browser_cookie3
 import httpx
-from dateutil.parser import parse
 from pydantic import HttpUrl
 
 BrowserType = Literal[
@@ -51,12 +50,19 @@ class BrowserSessionAuthentication:
         self.client = httpx.Client(base_url=self.base_url)
         self.browser_type = browser
         self.profile_path = profile_path
+        # Bare én fornyelse av sesjonen av gangen, både fra tråder og fra
+        # korutiner i hver event loop
+        self._lock = threading.Lock()
+        self._async_locks: dict[asyncio.AbstractEventLoop, asyncio.Lock] = {}
 
     def _load_session(self) -> httpx.Cookies | None:
         """Last inn autentiserings sesjons cookie.
 
         Hvis ingen cookies finnes for `self.base_url` returneres `None`.
         """
+        # 'browser_cookie3' er tung å importere og trengs bare her
+        import browser_cookie3
+
         if self.browser_type and hasattr(browser_cookie3, self.browser_type):
             cookie_method = getattr(browser_cookie3, self.browser_type)
             if self.browser_type == "chrome" and self.profile_path:
@@ -82,20 +88,27 @@ class BrowserSessionAuthentication:
         """Finnes det mellomlagret cookie."""
         return self.ends_at is not None and len(self.client.cookies) > 0
 
+    def _cached_valid(self) -> bool:
+        """Er mellomlagret cookie gyldig 5 minutter frem i tid (uten nettverkskall)."""
+        if not self.cached:
+            return False
+        assert self.ends_at is not None
+        now = datetime.datetime.now(self.ends_at.tzinfo)
+        return self.ends_at - datetime.timedelta(minutes=5) > now
+
     def _check_session(self) -> bool:
         """Sjekk om det finnes en aktiv sesjon eller om bruker må reautentisere."""
-        if self.cached:
-            assert self.ends_at is not None
-            now = datetime.datetime.now(self.ends_at.tzinfo)
-            # Sjekk om mellomlagret cookie er gyldig 5 minutter frem i tid, hvis
-            # ikke så prøver vi å laste inn på nytt med logikken under
-            if self.ends_at - datetime.timedelta(minutes=5) > now:
-                return True
+        # Hvis mellomlagret cookie ikke er gyldig lenge nok prøver vi å laste
+        # inn på nytt med logikken under
+        if self._cached_valid():
+            return True
         self.client.cookies.update(self._load_session())
         # Hvis det ikke finnes noen cookies så avbryter vi tidlig og ber om
         # reautentisering
         if len(self.client.cookies) < 1:
             return False
+        from dateutil.parser import parse
+
         resp = self.client.get("/oauth2/session")
         # Hvis vi får 401 betyr det at det ikke finnes en sesjon eller at den
         # har utløpt, 302 indikerer at siden ønsker å videresende oss til
@@ -124,11 +137,36 @@ class BrowserSessionAuthentication:
 
     def _request_auth(self) -> bool:
         """Få brukeren til å autentisere seg med en browser."""
+        import webbrowser
+
         # Åpne nettleserfane for brukeren og diriger dem til login endepunkt
         return webbrowser.open(str(self.base_url.copy_with(path="/oauth2/login")))
 
     def get_cookie(self) -> httpx.Cookies:
         """Hent sesjons header ved å be bruker om å autentisere med nettleser."""
+        with self._lock:
+            return self._get_cookie()
+
+    async def aget_cookie(self) -> httpx.Cookies:
+        """Som `get_cookie`, men blokkerer ikke event loop.
+
+        Gyldig mellomlagret cookie returneres direkte, ellers fornyes sesjonen
+        i en egen tråd. Samtidige kall venter på samme fornyelse.
+        """
+        if self._cached_valid():
+            return self.client.cookies
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_locks:
+            for old in [old for old in self._async_locks if old.is_closed()]:
+                del self._async_locks[old]
+            self._async_locks[loop] = asyncio.Lock()
+        lock = self._async_locks[loop]
+        async with lock:
+            if self._cached_valid():
+                return self.client.cookies
+            return await asyncio.to_thread(self.get_cookie)
+
+    def _get_cookie(self) -> httpx.Cookies:
         if not self._check_session():
             if not self._request_auth():
                 raise RuntimeError(f"Klarte ikke åpne nettleser {self.browser_type}")
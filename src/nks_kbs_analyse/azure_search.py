@@ -1,83 +1,503 @@
 """Funksjoner for å laste/fjerne dokumenter i Azure Search."""
 
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import cached_property
+from itertools import islice
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    Mapping,
+    Sequence,
+)
+
 from azure.search.documents.indexes.models import (
     SearchableField,
     SearchField,
     SearchFieldDataType,
+    SimpleField,
 )
 from langchain_community.vectorstores.azuresearch import AzureSearch
 from langchain_core.embeddings.embeddings import Embeddings
 from langchain_core.vectorstores import VectorStore
 
 from .embeddings import get_embedding
-from .knowledgebase import METADATA_COLUMNS
-from .settings import settings
+from .index_schema import METADATA_FIELDS, MetadataField, to_datetime, to_index_values
+from .settings import get_settings
+from .vectorstore import ExtendedVectorStore
 
+if TYPE_CHECKING:
+    from azure.search.documents.indexes import SearchIndexClient
 
-class ExtendedVectorStore(VectorStore):
-    """Utvidet VectorStore som støtter ekstra funksjonalitet."""
 
-    def clear(self) -> bool:
-        """Tøm alle dokumenter fra VectorStore.
+_RETRY_STATUS = frozenset({409, 422, 429, 500, 502, 503, 504})
+"""Statuskoder fra Azure AI Search der det er verdt å prøve på nytt"""
 
-        Returns:
-            Indikasjon på at databasen ble tømt
-        """
-        return False
+_MAX_SKIP = 100_000
+"""Azure AI Search kan ikke hoppe over flere resultater enn dette"""
+
+
+@dataclass
+class BatchResult:
+    """Resultat for én batch med dokumenter sendt til Azure AI Search."""
+
+    keys: list[str]
+    """ID til alle dokumentene i batchen"""
+
+    failed: dict[str, str] = field(default_factory=dict)
+    """Feilmelding for dokumenter som feilet etter siste forsøk"""
+
+    attempts: int = 0
+    """Antall forsøk som ble brukt"""
+
+    @property
+    def succeeded(self) -> bool:
+        """Om alle dokumentene i batchen ble behandlet."""
+        return not self.failed
+
+
+def _send_with_retry(
+    send: Callable[[list[dict[str, Any]]], list[Any]],
+    documents: list[dict[str, Any]],
+    max_retries: int = 5,
+    backoff: float = 0.5,
+) -> BatchResult:
+    """Send `documents` og prøv dokumentene som feiler på nytt.
+
+    Bare feil som kan være forbigående (f.eks. 429 og 503, eller
+    nettverksfeil) prøves på nytt, med eksponentielt økende ventetid.
+
+    Args:
+        send:
+            Funksjon som sender dokumentene og returnerer `IndexingResult`
+        documents:
+            Dokumentene, hvert med nøkkel i `id`
+        max_retries:
+            Maksimalt antall nye forsøk
+        backoff:
+            Ventetid (sekunder) før første nye forsøk
+    """
+    from azure.core.exceptions import AzureError
+
+    result = BatchResult(keys=[doc["id"] for doc in documents])
+    pending = documents
+    for attempt in range(max_retries + 1):
+        result.attempts = attempt + 1
+        try:
+            outcome = send(pending)
+        except AzureError as error:
+            status = getattr(error, "status_code", None)
+            if (status is not None and status not in _RETRY_STATUS) or (
+                attempt == max_retries
+            ):
+                result.failed.update({doc["id"]: str(error) for doc in pending})
+                return result
+        else:
+            errors = {item.key: item for item in outcome if not item.succeeded}
+            retry = []
+            for doc in pending:
+                item = errors.get(doc["id"])
+                if item is None:
+                    continue
+                if item.status_code in _RETRY_STATUS and attempt < max_retries:
+                    retry.append(doc)
+                else:
+                    result.failed[doc["id"]] = (
+                        f"{item.status_code}: {item.error_message}"
+                    )
+            if not retry:
+                return result
+            pending = retry
+        time.sleep(min(backoff * 2**attempt, 60) * random.uniform(0.5, 1.5))
+    return result
+
+
+_ODATA_OPERATORS = frozenset({"eq", "ne", "gt", "ge", "lt", "le"})
+"""Sammenligninger som kan brukes i `odata_filter`"""
+
+
+def _odata_literal(name: str, value: Any) -> str:
+    """Verdi i OData filter for feltet `name`."""
+    field = METADATA_FIELDS.get(name)
+    if field is not None and field.type == "datetime":
+        return to_datetime(value).isoformat()
+    value = str(value).replace("'", "''")
+    return f"'{value}'"
+
+
+def odata_filter(filter: Mapping[str, Any]) -> str:
+    """Lag OData filter fra krav til metadata.
+
+    Hvert felt må ha verdien (eller en av verdiene i en liste), f.eks. gir
+    `{"KnowledgeArticleId": ["a", "b"], "ContentColumn": "Article__c"}`
+    `(KnowledgeArticleId eq 'a' or KnowledgeArticleId eq 'b') and ContentColumn eq
+    'Article__c'`. For lister som `DataCategories` må minst én av verdiene
+    finnes i lista.
+
+    Et felt kan også ha en mapping fra sammenligning til verdi, f.eks. gir
+    `{"LastModifiedBQ": {"ge": datetime(2024, 9, 1, tzinfo=UTC)}}`
+    `LastModifiedBQ ge 2024-09-01T00:00:00+00:00`.
+    """
+    clauses: list[str] = []
+    for name, accepted in filter.items():
+        field = METADATA_FIELDS.get(name, MetadataField(name))
+        if isinstance(accepted, Mapping):
+            unknown = set(accepted) - _ODATA_OPERATORS
+            if unknown or not accepted:
+                raise ValueError(f"Ugyldig sammenligning for '{name}': {accepted}")
+            clauses.extend(
+                f"{name} {op} {_odata_literal(name, value)}"
+                for op, value in accepted.items()
+            )
+            continue
+        if not isinstance(accepted, (list, tuple, set, frozenset)):
+            accepted = [accepted]
+        if not accepted:
+            raise ValueError(f"Ingen verdier for '{name}' i filteret")
+        values = [_odata_literal(name, value) for value in accepted]
+        if field.type == "collection":
+            clause = " or ".join(f"c eq {value}" for value in values)
+            clauses.append(f"{name}/any(c: {clause})")
+            continue
+        clause = " or ".join(f"{name} eq {value}" for value in values)
+        clauses.append(f"({clause})" if len(values) > 1 else clause)
+    return " and ".join(clauses)
 
 
-class AzureExtended(AzureSearch, ExtendedVectorStore):  # type: ignore
+class AzureExtended(AzureSearch, ExtendedVectorStore):  # type: ignore[misc, unused-ignore]
     """Azure AI Search vector store med støtte for truncate.
 
     Utvidet fra `AzureSearch`
     """
 
-    def clear(self) -> bool:
-        """Slett innhold fra indeks."""
-        # Azure har ingen innebygd funksjonalitet for å tømme indeksen,
-        # så 'clear' vil i dette tilfellet være å slette den
-        # Trenger da en SearchIndexClient-instans
+    def __init__(
+        self,
+        azure_search_endpoint: str,
+        azure_search_key: str,
+        index_name: str,
+        *args: Any,
+        **kwargs: Any,
+    ):
+        """Koble til indeksen `index_name`, se `AzureSearch` for argumenter."""
+        super().__init__(
+            azure_search_endpoint, azure_search_key, index_name, *args, **kwargs
+        )
+        self.index_name = index_name
 
-        from azure.core.credentials import AzureKeyCredential
-        from azure.search.documents.indexes import SearchIndexClient
+    def add_embeddings(
+        self,
+        text_embeddings: Iterable[tuple[str, list[float]]],
+        metadatas: list[dict[str, Any]] | None = None,
+        *args: Any,
+        **kwargs: Any,
+    ) -> list[str]:
+        """Som `AzureSearch.add_embeddings`, men med typer fra `index_schema`."""
+        if metadatas is not None:
+            metadatas = to_index_values(metadatas)
+        return list(super().add_embeddings(text_embeddings, metadatas, *args, **kwargs))
 
-        assert settings.azure_search_admin_key is not None, (
-            "'AZURE_SEARCH_ADMIN_KEY' må være satt i kjøretidsmiljøet "
-            "for å kunne bruke 'azure_search'!"
-        )
+    def get_chunk_ids(self) -> dict[str, str | None]:
+        """Hent ID-er til alle dokumenter i indeksen.
+
+        Returns:
+            Mapping fra dokument ID til `KnowledgeArticleId`
+        """
+        results = self._search_all(select=["id", "KnowledgeArticleId"])
+        return {result["id"]: result.get("KnowledgeArticleId") for result in results}
 
-        azure_search_endpoint = settings.azure_search_endpoint
-        azure_search_key = settings.azure_search_admin_key.get_secret_value()
-        azure_search_credential = AzureKeyCredential(azure_search_key)
+    @cached_property
+    def _id_pageable(self) -> bool:
+        """Om indeksen kan sorteres og filtreres på `id`.
 
-        index_client = SearchIndexClient(
-            endpoint=azure_search_endpoint, credential=azure_search_credential
+        Eldre indekser ble laget uten dette, og må hentes uten sortering.
+        """
+        index = index_admin_client().get_index(self.index_name)
+        return any(
+            field.name == "id" and field.sortable and field.filterable
+            for field in index.fields
         )
+
+    def _search_all(
+        self, select: list[str], filter: str | None = None, page_size: int = 1000
+    ) -> Iterator[dict[str, Any]]:
+        """Hent alle dokumenter som oppfyller `filter`, sortert på ID.
+
+        Azure AI Search tillater ikke å hoppe over mer enn 100 000 resultater,
+        dokumentene hentes derfor i sider der hver side starter etter siste ID
+        på forrige side (`id gt '<siste>'`). For eldre indekser der `id` ikke
+        kan sorteres og filtreres hentes dokumentene uten sortering, da med
+        feil hvis det er flere enn 100 000 treff.
+        """
+        if not self._id_pageable:
+            results = iter(
+                self.client.search(search_text="*", filter=filter, select=select)
+            )
+            yield from islice(results, _MAX_SKIP)
+            if next(results, None) is not None:
+                raise RuntimeError(
+                    f"Flere enn {_MAX_SKIP} treff i '{self.index_name}', som ikke "
+                    "kan sorteres på 'id'. Lag indeksen på nytt med 'azure rebuild'"
+                )
+            return
+        last: str | None = None
+        while True:
+            clauses = [] if filter is None else [f"({filter})"]
+            if last is not None:
+                escaped = last.replace("'", "''")
+                clauses.append(f"id gt '{escaped}'")
+            page = list(
+                self.client.search(
+                    search_text="*",
+                    filter=" and ".join(clauses) or None,
+                    select=select,
+                    order_by=["id asc"],
+                    top=page_size,
+                )
+            )
+            yield from page
+            if len(page) < page_size:
+                return
+            last = page[-1]["id"]
+
+    def index_documents(
+        self,
+        ids: Sequence[str],
+        texts: Sequence[str],
+        embeddings: Sequence[list[float]],
+        metadatas: Sequence[dict[str, Any]],
+    ) -> list[dict[str, Any]]:
+        """Lag dokumenter slik de lagres i indeksen.
+
+        Metadata lagres både som JSON i `metadata` og i egne felter for
+        kolonnene som finnes i indeksen, konvertert til typene i
+        `index_schema.METADATA_FIELDS`.
+        """
+        field_names = {field.name for field in self.fields}
+        documents = []
+        values = to_index_values(metadatas)
+        for key, text, embedding, metadata in zip(ids, texts, embeddings, values):
+            document = {
+                "id": key,
+                "content": text,
+                "content_vector": embedding,
+                "metadata": json.dumps(metadata),
+            }
+            document |= {k: v for k, v in metadata.items() if k in field_names}
+            documents.append(document)
+        return documents
+
+    def upsert_chunks(
+        self,
+        ids: Sequence[str],
+        texts: Sequence[str],
+        embeddings: Sequence[list[float]],
+        metadatas: Sequence[dict[str, Any]],
+    ) -> list[Any]:
+        """Last opp, eller erstatt, dokumenter med gitte ID-er.
+
+        I motsetning til `add_embeddings` blir ID-ene brukt som de er slik at
+        de kan sammenlignes med ID-ene som allerede finnes i indeksen.
+
+        Returns:
+            Resultat (`IndexingResult`) for hvert dokument
+        """
+        documents = self.index_documents(ids, texts, embeddings, metadatas)
+        return list(self.client.merge_or_upload_documents(documents=documents))
+
+    def upload_batch(
+        self,
+        ids: Sequence[str],
+        texts: Sequence[str],
+        embeddings: Sequence[list[float]],
+        metadatas: Sequence[dict[str, Any]],
+        max_retries: int = 5,
+    ) -> BatchResult:
+        """Som `upsert_chunks`, men dokumenter som feiler prøves på nytt.
+
+        Returns:
+            Resultat for batchen
+        """
+        documents = self.index_documents(ids, texts, embeddings, metadatas)
+
+        def send(batch: list[dict[str, Any]]) -> list[Any]:
+            return list(self.client.merge_or_upload_documents(documents=batch))
+
+        return _send_with_retry(send, documents, max_retries)
+
+    def search_ids(self, filter: str) -> list[str]:
+        """Hent ID-er til alle dokumenter som oppfyller OData `filter`."""
+        return [result["id"] for result in self._search_all(["id"], filter)]
+
+    def delete_by_ids(
+        self,
+        ids: Sequence[str],
+        batch_size: int = 1000,
+        max_concurrency: int | None = None,
+        max_retries: int = 5,
+    ) -> list[BatchResult]:
+        """Slett dokumenter med gitte ID-er i samtidige batcher.
+
+        Dokumenter som ikke finnes regnes som slettet.
+
+        Args:
+            ids:
+                ID-ene som skal slettes
+            batch_size:
+                Antall dokumenter per kall (Azure tillater maksimalt 1000)
+            max_concurrency:
+                Antall samtidige kall, standard er
+                `settings.azure_ai.max_concurrency`
+            max_retries:
+                Maksimalt antall nye forsøk for hver batch
+
+        Returns:
+            Resultat for hver batch
+        """
+        if max_concurrency is None:
+            max_concurrency = get_settings().azure_ai.max_concurrency
+        documents = [{"id": key} for key in dict.fromkeys(ids)]
+        batches = [
+            documents[start : start + batch_size]
+            for start in range(0, len(documents), batch_size)
+        ]
+
+        def send(batch: list[dict[str, Any]]) -> list[Any]:
+            return list(self.client.delete_documents(documents=batch))
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            return list(
+                executor.map(
+                    lambda batch: _send_with_retry(send, batch, max_retries), batches
+                )
+            )
+
+    def delete_by_filter(
+        self, filter: str | Mapping[str, Any], **kwargs: Any
+    ) -> list[BatchResult]:
+        """Slett alle dokumenter som oppfyller `filter`.
+
+        Args:
+            filter:
+                OData filter eller krav til metadata (se `odata_filter`), f.eks.
+                `{"KnowledgeArticleId": "kA0..."}`
+            kwargs:
+                Sendes videre til `delete_by_ids`
+
+        Returns:
+            Resultat for hver batch
+        """
+        if not isinstance(filter, str):
+            filter = odata_filter(filter)
+        return self.delete_by_ids(self.search_ids(filter), **kwargs)
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> bool:
+        """Slett dokumenter med gitte ID-er, se `delete_by_ids`.
+
+        Returns:
+            Om alle dokumentene ble slettet
+        """
+        if not ids:
+            return False
+        return all(result.succeeded for result in self.delete_by_ids(ids, **kwargs))
+
+    def clear(self) -> bool:
+        """Slett innhold fra indeks."""
+        # Azure har ingen innebygd funksjonalitet for å tømme indeksen,
+        # så 'clear' vil i dette tilfellet være å slette den
+        index_client = index_admin_client()
         # finner eksisterende index
-        existing_index = index_client.get_index(name=settings.azure_ai.search_index)
+        existing_index = index_client.get_index(name=self.index_name)
         # sletter indexen
-        index_client.delete_index(settings.azure_ai.search_index)
+        index_client.delete_index(self.index_name)
         # gjenoppretter tom index
         index_client.create_index(existing_index)
 
         return True
 
 
+def _search_field(field: MetadataField) -> SearchField:
+    """Felt i Azure AI Search for metadata-feltet `field`."""
+    if field.type == "datetime":
+        return SimpleField(
+            name=field.name,
+            type=SearchFieldDataType.DateTimeOffset,
+            filterable=field.filterable,
+            facetable=field.facetable,
+            sortable=field.sortable,
+        )
+    if field.type == "collection":
+        return SearchableField(
+            name=field.name,
+            collection=True,
+            filterable=field.filterable,
+            facetable=field.facetable,
+        )
+    return SearchableField(
+        name=field.name,
+        filterable=field.filterable,
+        facetable=field.facetable,
+        sortable=field.sortable,
+    )
+
+
+def index_admin_client() -> "SearchIndexClient":
+    """Klient for å administrere indekser i Azure AI Search."""
+    from azure.core.credentials import AzureKeyCredential
+    from azure.search.documents.indexes import SearchIndexClient
+
+    settings = get_settings()
+    assert settings.azure_search_admin_key is not None, (
+        "'AZURE_SEARCH_ADMIN_KEY' må være satt i kjøretidsmiljøet "
+        "for å kunne bruke 'azure_search'!"
+    )
+    return SearchIndexClient(
+        endpoint=settings.azure_search_endpoint,
+        credential=AzureKeyCredential(
+            settings.azure_search_admin_key.get_secret_value()
+        ),
+    )
+
+
+def active_index_name() -> str:
+    """Navnet på indeksen som skal leses fra.
+
+    Etter `rebuild.rebuild_index` er dette den nyeste godkjente versjonen av
+    `settings.azure_ai.search_index`, ellers er det indeksen i innstillingene.
+    """
+    from .rebuild import IndexPointer
+
+    base = get_settings().azure_ai.search_index
+    return IndexPointer().active(base) or base
+
+
 def create_store(
     embedding: Embeddings | None = None,
+    index_name: str | None = None,
 ) -> VectorStore | ExtendedVectorStore:
     """Lag en ny `langchain_core.vectorstores.VectorStore`.
 
     Args:
         embedding (Optional[langchain_core.embeddings.embeddings.Embeddings]):
             Modellen som brukes for å generere embeddings, hvis ikke oppgitt brukes default for prosjektet
+            (med embeddings lagret på disk og samtidige kall, se `embeddings`)
+        index_name (Optional[str]):
+            Navn på indeksen, hvis ikke oppgitt brukes aktiv indeks for
+            `settings.azure_ai.search_index` (se `rebuild.IndexPointer`)
+
     Returns:
         En `langchain_community.vectorstores.VectorStore` som kan brukes for å
         laste opp dokumenter til backend og søke etter lignende dokumenter.
     """
     if not embedding:
-        embedding = get_embedding()
+        embedding = get_embedding(cache=True, concurrent=True)
 
+    settings = get_settings()
     assert settings.azure_search_admin_key is not None, (
         "'AZURE_SEARCH_ADMIN_KEY' må være satt i kjøretidsmiljøet "
         "for å kunne bruke 'azure_search'!"
@@ -88,12 +508,15 @@ def create_store(
     # spesifiserer derfor hvert felt eksplisitt
 
     # content-fields er default felter som må med
-    CONTENT_FIELDS: list[SearchableField] = [
+    CONTENT_FIELDS: list[SearchField] = [
         SearchableField(
             name="id",
             type=SearchFieldDataType.String,
             key=True,
             searchable=True,
+            # For å hente alle dokumenter sortert på ID (se 'search_ids')
+            filterable=True,
+            sortable=True,
         ),
         SearchableField(
             name="content",
@@ -104,7 +527,7 @@ def create_store(
             name="content_vector",
             type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
             searchable=True,
-            vector_search_dimensions=len(embedding_function("Text")),
+            vector_search_dimensions=settings.azure_ai.embedding_size,
             vector_search_profile_name="myHnswProfile",
         ),
         SearchableField(
@@ -113,27 +536,19 @@ def create_store(
             searchable=True,
         ),
     ]
-    # legger deretter til metadata-feltene
-    METADATA_FIELDS: list[SearchableField] = []
-    for column in METADATA_COLUMNS + [
-        "Section",
-        "Tab",
-        "ContentColumn",
-        "EmbeddingCreation",
-    ]:
-        field_args = {
-            "name": column,
-            "type": SearchFieldDataType.String,
-            "filterable": True,
-        }
-        METADATA_FIELDS.append(SearchableField(**field_args))
-
-    INDEX_FIELDS = CONTENT_FIELDS + METADATA_FIELDS
+    # legger deretter til metadata-feltene med typer fra 'index_schema'
+    METADATA_INDEX_FIELDS: list[SearchField] = [
+        _search_field(field) for field in METADATA_FIELDS.values()
+    ]
+
+    INDEX_FIELDS = CONTENT_FIELDS + METADATA_INDEX_FIELDS
 
     return AzureExtended(
         azure_search_endpoint=settings.azure_search_endpoint,
         azure_search_key=settings.azure_search_admin_key.get_secret_value(),
-        index_name=settings.azure_ai.search_index,
+        index_name=index_name or active_index_name(),
         embedding_function=embedding_function,
         fields=INDEX_FIELDS,
+        # Unngå at 'AzureSearch' embedder en tekst for å finne antall dimensjoner
+        vector_search_dimensions=settings.azure_ai.embedding_size,
     )
@@ -0,0 +1,481 @@
+"""Persistent mellomlagring på disk.
+
+`DiskCache` er en enkel nøkkel-verdi lagring i SQLite med maksimal størrelse
+der de minst nylig brukte verdiene fjernes først (LRU). `ChunkCache` benytter
+denne til å lagre resultatet av `knowledgebase.split_documents` for hver
+artikkel slik at bare endrede artikler må splittes på nytt. `RetrieverCache`
+lagrer søkeresultater fra `retriever.NKSRetriever` i minnet og eventuelt på
+disk.
+
+Eksempel:
+    ```python
+    from nks_kbs_analyse.cache import ChunkCache
+    from nks_kbs_analyse.knowledgebase import load, split_documents
+
+    cache = ChunkCache()
+    chunks = split_documents(load(), chunk_size=1500, clean=True, cache=cache)
+    print(cache.stats())
+    ```
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Mapping, Sequence
+
+from langchain_core.documents import Document
+
+from .settings import get_settings
+
+_MAX_VARIABLES = 500
+"""Maksimalt antall nøkler per spørring mot SQLite"""
+
+
+@dataclass
+class CacheStats:
+    """Statistikk for bruk av en `DiskCache`."""
+
+    hits: int
+    """Antall oppslag som fant en verdi"""
+
+    misses: int
+    """Antall oppslag som ikke fant en verdi"""
+
+    entries: int
+    """Antall verdier lagret"""
+
+    size_bytes: int
+    """Samlet størrelse på lagrede verdier"""
+
+    @property
+    def hit_rate(self) -> float:
+        """Andel oppslag som fant en verdi."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class DiskCache:
+    """Nøkkel-verdi lagring i SQLite med LRU fjerning.
+
+    Antall treff og bom telles for hver instans, mens verdiene deles mellom
+    alle som bruker samme fil.
+    """
+
+    def __init__(self, path: str | os.PathLike[str], max_bytes: int = 2**30):
+        """Åpne (eller opprett) lagring i `path`.
+
+        Args:
+            path:
+                SQLite fil verdiene lagres i
+            max_bytes:
+                Maksimal samlet størrelse på verdier før de minst nylig brukte
+                fjernes
+        """
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+            "size INTEGER NOT NULL, accessed INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)"
+        )
+        (self._size,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()
+        self._clock = 0
+
+    def _tick(self) -> int:
+        """Tidsstempel for bruk som alltid øker."""
+        self._clock = max(time.time_ns(), self._clock + 1)
+        return self._clock
+
+    def get(self, key: str) -> bytes | None:
+        """Hent verdien for `key`, `None` hvis den ikke finnes."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE cache SET accessed = ? WHERE key = ?", (self._tick(), key)
+            )
+            value: bytes = row[0]
+            return value
+
+    def get_many(self, keys: Sequence[str]) -> dict[str, bytes]:
+        """Hent verdiene for `keys` som finnes.
+
+        Returns:
+            Mapping fra nøkkel til verdi for nøklene som finnes
+        """
+        found: dict[str, bytes] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique), _MAX_VARIABLES):
+                batch = unique[start : start + _MAX_VARIABLES]
+                placeholders = ",".join("?" * len(batch))
+                found.update(
+                    self._conn.execute(
+                        f"SELECT key, value FROM cache WHERE key IN ({placeholders})",
+                        batch,
+                    )
+                )
+            accessed = self._tick()
+            self._conn.executemany(
+                "UPDATE cache SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key in found],
+            )
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def set(self, key: str, value: bytes) -> None:
+        """Lagre `value` for `key` og fjern gamle verdier ved behov."""
+        self.set_many({key: value})
+
+    def set_many(self, items: Mapping[str, bytes]) -> None:
+        """Lagre alle verdiene i `items` og fjern gamle verdier ved behov."""
+        with self._lock:
+            # Skriv alt i én transaksjon i stedet for én per verdi
+            self._conn.execute("BEGIN")
+            try:
+                for key, value in items.items():
+                    old = self._conn.execute(
+                        "SELECT size FROM cache WHERE key = ?", (key,)
+                    ).fetchone()
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO cache (key, value, size, accessed) "
+                        "VALUES (?, ?, ?, ?)",
+                        (key, value, len(value), self._tick()),
+                    )
+                    self._size += len(value) - (old[0] if old else 0)
+                self._evict()
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                (self._size,) = self._conn.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM cache"
+                ).fetchone()
+                raise
+            self._conn.execute("COMMIT")
+
+    def _evict(self) -> None:
+        """Fjern minst nylig brukte verdier til størrelsen er under grensen."""
+        if self._size <= self.max_bytes:
+            return
+        evicted: list[str] = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM cache ORDER BY accessed"
+        ):
+            if self._size <= self.max_bytes:
+                break
+            evicted.append(key)
+            self._size -= size
+        self._conn.executemany(
+            "DELETE FROM cache WHERE key = ?", [(key,) for key in evicted]
+        )
+
+    def __contains__(self, key: object) -> bool:
+        """Sjekk om `key` finnes uten å telle som treff eller bom."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        """Antall verdier lagret."""
+        with self._lock:
+            row = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        count: int = row[0]
+        return count
+
+    def clear(self) -> None:
+        """Fjern alle verdier."""
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._size = 0
+
+    def stats(self) -> CacheStats:
+        """Hent statistikk for bruk."""
+        return CacheStats(
+            hits=self.hits,
+            misses=self.misses,
+            entries=len(self),
+            size_bytes=self._size,
+        )
+
+    def close(self) -> None:
+        """Lukk tilkoblingen til SQLite."""
+        self._conn.close()
+
+
+class ChunkCache:
+    """Lagring av oppsplittede dokumenter per artikkel.
+
+    Nøkkelen er en hash av innholdet i artikkelen og innstillingene for
+    splitting, mens metadata fra artikkelen legges til igjen ved oppslag. Det
+    er derfor bare innholdet i hvert oppsplittet dokument og overskriftene det
+    tilhører som lagres.
+    """
+
+    def __init__(
+        self, path: str | os.PathLike[str] | None = None, max_bytes: int = 2**30
+    ):
+        """Åpne lagring for oppsplittede dokumenter.
+
+        Hvis `path` ikke er oppgitt benyttes `chunks.sqlite` under
+        `settings.cache_dir`.
+        """
+        if path is None:
+            path = get_settings().cache_dir / "chunks.sqlite"
+        self.disk = DiskCache(path, max_bytes=max_bytes)
+
+    @staticmethod
+    def key(content: str, config: Sequence[Any]) -> str:
+        """Lag nøkkel for en artikkel med innhold `content`.
+
+        Args:
+            content:
+                Innholdet i artikkelen
+            config:
+                Alle innstillinger som påvirker resultatet av splittingen (må
+                kunne serialiseres som JSON)
+        """
+        digest = hashlib.sha256(json.dumps(config).encode("utf-8"))
+        digest.update(content.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str, metadata: Mapping[str, Any]) -> list[Document] | None:
+        """Hent oppsplittede dokumenter for `key`.
+
+        Args:
+            key:
+                Nøkkel fra `ChunkCache.key`
+            metadata:
+                Metadata fra artikkelen som legges til dokumentene
+
+        Returns:
+            Dokumentene eller `None` hvis de ikke finnes
+        """
+        value = self.disk.get(key)
+        if value is None:
+            return None
+        return [
+            Document(page_content=content, metadata={**metadata, "Headers": headers})
+            for content, headers in json.loads(value)
+        ]
+
+    def set(self, key: str, chunks: Sequence[Document]) -> None:
+        """Lagre oppsplittede dokumenter for `key`."""
+        value = [[chunk.page_content, chunk.metadata["Headers"]] for chunk in chunks]
+        self.disk.set(key, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def stats(self) -> CacheStats:
+        """Hent statistikk for bruk."""
+        return self.disk.stats()
+
+
+class RetrieverCache:
+    """Søkeresultater fra NKS-VDB i minnet (LRU) og eventuelt på disk.
+
+    Resultater er gyldige i `ttl` sekunder, eller til de invalideres med
+    `invalidate` (f.eks. etter `nks-bob vdb reindex`). Nøkkelen inneholder
+    adressen til NKS-VDB og alle søkeparametre. Ved lagring på disk skrives
+    tidspunktet for invalidering til en egen fil ved siden av slik at det også
+    gjelder for andre prosesser som deler samme lagring.
+
+    Eksempel:
+        ```python
+        from nks_kbs_analyse.cache import RetrieverCache
+        from nks_kbs_analyse.retriever import NKSRetriever
+
+        retriever = NKSRetriever(auth=auth, cache=RetrieverCache(disk=True))
+        retriever.invoke("Hva er dagpenger?")
+        print(retriever.cache.stats())
+        ```
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 24 * 60 * 60,
+        disk: "bool | str | os.PathLike[str] | DiskCache" = False,
+    ):
+        """Lag en ny mellomlagring for søkeresultater.
+
+        Args:
+            max_entries:
+                Maksimalt antall resultater i minnet
+            ttl:
+                Antall sekunder et resultat er gyldig
+            disk:
+                Lagre resultater på disk i tillegg. Hvis `True` benyttes
+                `nks_vdb.sqlite` under `settings.cache_dir`, ellers kan man
+                oppgi en fil eller en egen `DiskCache`.
+        """
+        if disk is True:
+            disk = get_settings().cache_dir / "nks_vdb.sqlite"
+        storage: DiskCache | None = None
+        if isinstance(disk, DiskCache):
+            storage = disk
+        elif disk is not False:
+            storage = DiskCache(disk, max_bytes=2**28)
+        self.disk = storage
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, tuple[float, str, list[Any]]] = OrderedDict()
+        self._invalidated: dict[str, float] = {}
+        self._invalidated_mtime: int | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def invalidation_path(self) -> Path | None:
+        """Fil med tidspunkt for invalidering per adresse (bare med disk)."""
+        if self.disk is None:
+            return None
+        return self.disk.path.with_suffix(".invalidated.json")
+
+    def _refresh_invalidated(self) -> None:
+        """Les tidspunkt for invalidering på nytt hvis filen er endret."""
+        path = self.invalidation_path
+        if path is None:
+            return
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._invalidated_mtime:
+            self._invalidated = json.loads(path.read_text(encoding="utf-8"))
+            self._invalidated_mtime = mtime
+
+    def _valid(self, created: float, base_url: str, now: float) -> bool:
+        """Om et resultat laget `created` for `base_url` fortsatt gjelder."""
+        invalidated = max(
+            self._invalidated.get(base_url, 0.0), self._invalidated.get("*", 0.0)
+        )
+        return created > invalidated and created + self.ttl > now
+
+    @staticmethod
+    def key(base_url: str, params: Mapping[str, Any]) -> str:
+        """Lag nøkkel for et søk.
+
+        Args:
+            base_url:
+                Adressen til NKS-VDB
+            params:
+                Alle søkeparametre (spørring, antall og vekting)
+        """
+        config = [_base_url(base_url), sorted((k, str(v)) for k, v in params.items())]
+        return hashlib.sha256(
+            json.dumps(config, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key: str) -> list[Document] | None:
+        """Hent resultatet for `key`, `None` hvis det ikke finnes eller er utløpt."""
+        now = time.time()
+        with self._lock:
+            self._refresh_invalidated()
+            entry = self._memory.get(key)
+            if entry is not None and self._valid(entry[0], entry[1], now):
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return _to_documents(entry[2])
+            self._memory.pop(key, None)
+        if self.disk is not None and (value := self.disk.get(key)) is not None:
+            created, base_url, docs = json.loads(value)
+            with self._lock:
+                valid = self._valid(created, base_url, now)
+                if valid:
+                    self.hits += 1
+            if valid:
+                self._remember(key, created, base_url, docs)
+                return _to_documents(docs)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, base_url: str, documents: Sequence[Document]) -> None:
+        """Lagre resultatet av et søk mot `base_url` for `key`."""
+        created = time.time()
+        base_url = _base_url(base_url)
+        docs = [[doc.page_content, doc.metadata] for doc in documents]
+        self._remember(key, created, base_url, docs)
+        if self.disk is not None:
+            value = json.dumps([created, base_url, docs], ensure_ascii=False)
+            self.disk.set(key, value.encode("utf-8"))
+
+    def _remember(
+        self, key: str, created: float, base_url: str, docs: list[Any]
+    ) -> None:
+        with self._lock:
+            self._memory[key] = (created, base_url, docs)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def invalidate(self, base_url: str | None = None) -> None:
+        """Glem lagrede resultater for `base_url`, eller alle hvis `None`."""
+        if base_url is not None:
+            base_url = _base_url(base_url)
+        with self._lock:
+            self._refresh_invalidated()
+            self._invalidated[base_url or "*"] = time.time()
+            if base_url is None:
+                self._memory.clear()
+            else:
+                for key in [k for k, v in self._memory.items() if v[1] == base_url]:
+                    del self._memory[key]
+            path = self.invalidation_path
+            if path is not None:
+                tmp = path.with_suffix(".tmp")
+                tmp.write_text(json.dumps(self._invalidated), encoding="utf-8")
+                os.replace(tmp, path)
+                self._invalidated_mtime = path.stat().st_mtime_ns
+        if self.disk is not None and base_url is None:
+            self.disk.clear()
+
+    def stats(self) -> CacheStats:
+        """Hent statistikk for bruk."""
+        with self._lock:
+            entries = len(self._memory)
+        return CacheStats(
+            hits=self.hits,
+            misses=self.misses,
+            entries=entries,
+            size_bytes=self.disk.stats().size_bytes if self.disk is not None else 0,
+        )
+
+
+def _base_url(url: str) -> str:
+    """Samme adresse med og uten `/` på slutten."""
+    return url.rstrip("/")
+
+
+def _to_documents(docs: list[Any]) -> list[Document]:
+    """Nye dokumenter hver gang slik at endringer ikke påvirker lagret verdi."""
+    return [
+        Document(page_content=content, metadata=dict(metadata))
+        for content, metadata in docs
+    ]
@@ -1,23 +1,42 @@
-"""Kommandolinjeverktøy for å jobbe med NAVNO VDB, NKS VDB og NKS KBS."""
+"""Kommandolinjeverktøy for å jobbe med NAVNO VDB, NKS VDB og NKS KBS.
+
+Tunge moduler (f.eks. `httpx`, `rich` og autentisering) importeres først når
+en kommando trenger dem slik at oppstart av verktøyet er rask.
+"""
 
 from functools import cache
-from typing import cast
+from typing import TYPE_CHECKING, Any, cast
+
+if TYPE_CHECKING:
+    from rich.console import Console
 
-from rich.console import Console
+    from nks_kbs_analyse.auth import BrowserSessionAuthentication
 
-from nks_kbs_analyse.auth import BrowserSessionAuthentication, BrowserType
 
-console = Console()
-"""Fasiliteter for å printe med Rich"""
+@cache
+def get_console() -> "Console":
+    """Fasiliteter for å printe med Rich."""
+    from rich.console import Console
+
+    return Console()
+
+
+def __getattr__(name: str) -> Any:
+    """Støtt `from nks_kbs_analyse.cli import console` som før."""
+    if name == "console":
+        return get_console()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 @cache
-def get_auth(url: str) -> BrowserSessionAuthentication:
+def get_auth(url: str) -> "BrowserSessionAuthentication":
     """Hjelpemetode for å hente autentiseringsobjekt."""
     import os
 
     from pydantic import HttpUrl
 
+    from nks_kbs_analyse.auth import BrowserSessionAuthentication, BrowserType
+
     return BrowserSessionAuthentication(
         HttpUrl(url),
         browser=cast(BrowserType, os.getenv("BROWSER")),
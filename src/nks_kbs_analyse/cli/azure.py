@@ -0,0 +1,217 @@
+"""Underkommando for Azure AI Search."""
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Annotated, Iterable
+
+import typer
+
+from . import get_console
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+app = typer.Typer(name="azure", help="Last opp til Azure AI Search")
+"""Kommandolinjeverktøy for Azure AI Search"""
+
+
+def _load_chunks(
+    chunk_size: int, overlap: int, clean: bool, snapshot: bool
+) -> list["Document"]:
+    """Les og splitt kunnskapsbasen."""
+    from nks_kbs_analyse.cache import ChunkCache
+    from nks_kbs_analyse.knowledgebase import split_documents
+
+    docs: Iterable[Document]
+    if snapshot:
+        from nks_kbs_analyse.snapshot import KnowledgeBaseSnapshot
+
+        docs = KnowledgeBaseSnapshot().load()
+    else:
+        from nks_kbs_analyse.knowledgebase import load
+
+        docs = load()
+    with get_console().status("Splitter kunnskapsbasen..."):
+        return split_documents(
+            docs,
+            chunk_size=chunk_size,
+            overlap=overlap,
+            clean=clean,
+            cache=ChunkCache(),
+        )
+
+
+@app.command()
+def upload(
+    chunk_size: Annotated[
+        int, typer.Option(min=1, help="Maksimal størrelse ved splitting")
+    ] = 1500,
+    overlap: Annotated[int, typer.Option(min=0, help="Overlapp ved splitting")] = 100,
+    clean: Annotated[bool, typer.Option(help="Rens dokumenter før splitting")] = True,
+    snapshot: Annotated[
+        bool, typer.Option(help="Les fra lokal kopi i stedet for BigQuery")
+    ] = False,
+    index: Annotated[
+        str | None,
+        typer.Option(help="Navn på indeks (standard fra innstillinger)"),
+    ] = None,
+    batch_size: Annotated[
+        int, typer.Option(min=1, max=1000, help="Antall dokumenter per opplasting")
+    ] = 500,
+    max_in_flight: Annotated[
+        int, typer.Option(min=1, help="Antall samtidige opplastinger")
+    ] = 4,
+    checkpoint: Annotated[
+        Path | None,
+        typer.Option(help="Sjekkpunktfil (standard under 'cache_dir')"),
+    ] = None,
+    restart: Annotated[
+        bool, typer.Option(help="Start på nytt i stedet for å fortsette")
+    ] = False,
+) -> None:
+    """Embed og last opp kunnskapsbasen, fortsetter en avbrutt opplasting."""
+    from rich.progress import (
+        BarColumn,
+        MofNCompleteColumn,
+        Progress,
+        TextColumn,
+        TimeRemainingColumn,
+    )
+
+    from nks_kbs_analyse.azure_search import create_store
+    from nks_kbs_analyse.settings import get_settings
+    from nks_kbs_analyse.upload import BulkUploader, UploadCheckpoint, UploadProgress
+
+    console = get_console()
+    settings = get_settings()
+    index = index or settings.azure_ai.search_index
+    if checkpoint is None:
+        checkpoint = settings.cache_dir / "opplasting" / f"{index}.txt"
+    state = UploadCheckpoint(checkpoint)
+    if restart:
+        state.clear()
+
+    chunks = _load_chunks(chunk_size, overlap, clean, snapshot)
+    with Progress(
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TextColumn("{task.fields[rate]:.1f} dok/s"),
+        TimeRemainingColumn(),
+        console=console,
+    ) as bar:
+        task = bar.add_task(f"Laster opp til '{index}'", total=None, rate=0.0)
+
+        def report(progress: UploadProgress) -> None:
+            bar.update(
+                task,
+                total=progress.total,
+                completed=progress.uploaded + progress.failed,
+                rate=progress.docs_per_second,
+            )
+
+        uploader = BulkUploader(
+            create_store(index_name=index),  # type: ignore[arg-type]
+            batch_size=batch_size,
+            max_in_flight=max_in_flight,
+            checkpoint=state,
+            progress=report,
+        )
+        result = uploader.upload(chunks)
+
+    summary = result.progress
+    console.print(
+        f"Lastet opp {summary.uploaded} dokumenter på {summary.elapsed:.0f} sekunder "
+        f"({summary.docs_per_second:.1f} dok/s), {summary.skipped} var lastet opp fra før"
+    )
+    if not result.succeeded:
+        console.print(
+            f"[red]{len(result.failed)} dokumenter feilet, kjør kommandoen på nytt "
+            "for å prøve dem igjen"
+        )
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def rebuild(
+    chunk_size: Annotated[
+        int, typer.Option(min=1, help="Maksimal størrelse ved splitting")
+    ] = 1500,
+    overlap: Annotated[int, typer.Option(min=0, help="Overlapp ved splitting")] = 100,
+    clean: Annotated[bool, typer.Option(help="Rens dokumenter før splitting")] = True,
+    snapshot: Annotated[
+        bool, typer.Option(help="Les fra lokal kopi i stedet for BigQuery")
+    ] = False,
+    index: Annotated[
+        str | None,
+        typer.Option(help="Navn på indeks (standard fra innstillinger)"),
+    ] = None,
+    validation: Annotated[
+        Path | None,
+        typer.Option(
+            exists=True,
+            dir_okay=False,
+            help="JSONL med valideringsspørringer ('query' og 'expected')",
+        ),
+    ] = None,
+    min_hit_rate: Annotated[
+        float,
+        typer.Option(min=0.0, max=1.0, help="Minste andel treff i validering"),
+    ] = 0.9,
+    keep: Annotated[
+        int, typer.Option(min=0, help="Antall tidligere versjoner som beholdes")
+    ] = 1,
+    batch_size: Annotated[
+        int, typer.Option(min=1, max=1000, help="Antall dokumenter per opplasting")
+    ] = 500,
+    max_in_flight: Annotated[
+        int, typer.Option(min=1, help="Antall samtidige opplastinger")
+    ] = 4,
+) -> None:
+    """Bygg en ny versjon av indeksen og bytt til den uten nedetid."""
+    from nks_kbs_analyse.rebuild import load_validation_queries, rebuild_index
+
+    console = get_console()
+    chunks = _load_chunks(chunk_size, overlap, clean, snapshot)
+    with console.status(f"Bygger ny versjon av indeksen med {len(chunks)} dokumenter"):
+        result = rebuild_index(
+            chunks,
+            base=index,
+            validation=load_validation_queries(validation) if validation else (),
+            min_hit_rate=min_hit_rate,
+            keep=keep,
+            batch_size=batch_size,
+            max_in_flight=max_in_flight,
+        )
+    report = result.validation
+    console.print(
+        f"'{result.name}' har {report.documents} dokumenter, "
+        f"{report.hit_rate:.0%} treff på {report.queries} valideringsspørringer"
+    )
+    if not result.switched:
+        console.print(
+            f"[red]Validering feilet ({len(report.empty)} uten treff, "
+            f"{len(report.misses)} uten forventet artikkel), "
+            f"'{result.active}' er fortsatt aktiv"
+        )
+        raise typer.Exit(code=1)
+    console.print(f"[green]'{result.name}' er nå aktiv")
+    for name in result.deleted:
+        console.print(f"Slettet gammel versjon '{name}'")
+
+
+@app.command()
+def rollback(
+    index: Annotated[
+        str | None,
+        typer.Option(help="Navn på indeks (standard fra innstillinger)"),
+    ] = None,
+) -> None:
+    """Gå tilbake til forrige versjon av indeksen."""
+    from nks_kbs_analyse.rebuild import rollback as rollback_index
+
+    try:
+        name = rollback_index(index)
+    except ValueError as error:
+        get_console().print(f"[red]{error}")
+        raise typer.Exit(code=1) from error
+    get_console().print(f"[green]'{name}' er nå aktiv")
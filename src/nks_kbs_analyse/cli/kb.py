@@ -0,0 +1,82 @@
+"""Underkommando for analyse av kunnskapsbasen."""
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Annotated, Iterable
+
+import typer
+
+from . import get_console
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+app = typer.Typer(name="kb", help="Analyser kunnskapsbasen")
+"""Kommandolinjeverktøy for analyse av kunnskapsbasen"""
+
+
+@app.command()
+def profile(
+    chunk_size: Annotated[
+        int, typer.Option(min=1, help="Maksimal størrelse ved splitting")
+    ] = 1500,
+    overlap: Annotated[int, typer.Option(min=0, help="Overlapp ved splitting")] = 100,
+    split: Annotated[
+        bool, typer.Option(help="Profiler lengder etter splitting")
+    ] = True,
+    clean: Annotated[bool, typer.Option(help="Rens dokumenter før splitting")] = False,
+    snapshot: Annotated[
+        bool, typer.Option(help="Les fra lokal kopi i stedet for BigQuery")
+    ] = False,
+    output: Annotated[
+        Path | None, typer.Option(help="Skriv profilen som JSON til denne filen")
+    ] = None,
+) -> None:
+    """Profiler tekstlengder i kunnskapsbasen uten å holde den i minnet."""
+    import json
+
+    from rich.table import Table
+
+    from nks_kbs_analyse.profiling import QUANTILES, profile_corpus
+
+    console = get_console()
+
+    docs: Iterable[Document]
+    if snapshot:
+        from nks_kbs_analyse.snapshot import KnowledgeBaseSnapshot
+
+        docs = KnowledgeBaseSnapshot().load()
+    else:
+        from nks_kbs_analyse.knowledgebase import load
+
+        docs = load()
+    with console.status("Profilerer kunnskapsbasen..."):
+        result = profile_corpus(
+            docs,
+            chunk_size=chunk_size if split else None,
+            overlap=overlap,
+            clean=clean,
+        ).to_dict()
+    if output is not None:
+        output.write_text(json.dumps(result, indent=2), encoding="utf-8")
+        console.print(f"[green]Skrev profil til '{output}'")
+
+    table = Table(title="Antall tegn i kunnskapsbasen")
+    for column in ("Nivå", "Gruppering", "Verdi", "Antall", "Snitt", "Min"):
+        table.add_column(column)
+    for q in QUANTILES:
+        table.add_column(f"p{q * 100:g}")
+    table.add_column("Maks")
+    for level, groups in result.items():
+        for group, values in groups.items():
+            for value, summary in sorted(values.items()):
+                table.add_row(
+                    level,
+                    group,
+                    value,
+                    str(summary["count"]),
+                    f"{summary['mean']:.0f}",
+                    str(summary["min"]),
+                    *(f"{summary['quantiles'][str(q)]:.0f}" for q in QUANTILES),
+                    str(summary["max"]),
+                )
+    console.print(table)
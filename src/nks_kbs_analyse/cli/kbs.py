@@ -1,20 +1,25 @@
 """Underkommando for NKS KBS."""
 
-import json
-from typing import Annotated
+from typing import TYPE_CHECKING, Annotated
 
-import httpx
 import typer
-from rich.live import Live
-from rich.prompt import Prompt
 
-from . import console, get_auth
-from .settings import settings
+from . import get_auth, get_console
+
+if TYPE_CHECKING:
+    import httpx
 
 app = typer.Typer(name="kbs", help="Interager med 'nks_kbs'")
 """Kommandolinjeverktøy for NKS KBS"""
-KBS_URL = httpx.URL(str(settings.kbs_url))
-"""URL til NKS KBS endepunkter"""
+
+
+def kbs_url() -> "httpx.URL":
+    """URL til NKS KBS endepunkter."""
+    import httpx
+
+    from .settings import get_settings
+
+    return httpx.URL(str(get_settings().kbs_url))
 
 
 @app.command()
@@ -24,8 +29,16 @@ def chat(
     ] = 30.0,
 ) -> None:
     """Chat med NKS Bob."""
-    auth = get_auth(str(KBS_URL))
-    client = httpx.Client(cookies=auth.get_cookie(), base_url=KBS_URL)
+    import json
+
+    import httpx
+    from rich.live import Live
+    from rich.prompt import Prompt
+
+    console = get_console()
+    base_url = kbs_url()
+    auth = get_auth(str(base_url))
+    client = httpx.Client(cookies=auth.get_cookie(), base_url=base_url)
     try:
         chat_history: list[dict[str, str]] = []
         while True:
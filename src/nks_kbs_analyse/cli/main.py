@@ -2,6 +2,8 @@
 
 import typer
 
+from .azure import app as azure_app
+from .kb import app as kb_app
 from .kbs import app as kbs_app
 from .navno_vdb import app as navno_vdb_app
 from .vdb import app as vdb_app
@@ -12,6 +14,8 @@ app = typer.Typer()
 app.add_typer(vdb_app, name="vdb")
 app.add_typer(navno_vdb_app, name="navno_vdb")
 app.add_typer(kbs_app, name="kbs")
+app.add_typer(kb_app, name="kb")
+app.add_typer(azure_app, name="azure")
 
 
 if __name__ == "__main__":
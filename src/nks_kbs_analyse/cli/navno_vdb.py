@@ -1,17 +1,25 @@
 """Underkommando for NAVNO VDB."""
 
-from typing import Annotated, Any
+from typing import TYPE_CHECKING, Annotated, Any
 
-import httpx
 import typer
 
-from . import console, get_auth
-from .settings import settings
+from . import get_auth, get_console
+
+if TYPE_CHECKING:
+    import httpx
 
 app = typer.Typer(name="navno_vdb", help="Interager med 'navno-vdb'")
 """Inngang for kommandolinjeverktøy for NAVNO VDB"""
-VDB_URL = httpx.URL(str(settings.navno_vdb_url))
-"""URL til NAVNO VDB endepunkter"""
+
+
+def vdb_url() -> "httpx.URL":
+    """URL til NAVNO VDB endepunkter."""
+    import httpx
+
+    from .settings import get_settings
+
+    return httpx.URL(str(get_settings().navno_vdb_url))
 
 
 @app.command()
@@ -21,15 +29,21 @@ def clear(
     ] = True,
 ) -> None:
     """Tøm vektordatabasen for innhold."""
+    import httpx
+
+    console = get_console()
+    base_url = vdb_url()
     if not dry_run:
         _ = typer.confirm(
             "Er du sikker på at du vil tømme vektordatabasen?",
             abort=True,
         )
-    auth = get_auth(str(VDB_URL))
+    auth = get_auth(str(base_url))
     params = {"dry_run": dry_run}
     __ = httpx.delete(
-        VDB_URL.copy_with(path="/admin/clear"), cookies=auth.get_cookie(), params=params
+        base_url.copy_with(path="/admin/clear"),
+        cookies=auth.get_cookie(),
+        params=params,
     ).raise_for_status()
     if not dry_run:
         console.print("[bold red]Tømte vektordatabasen!")
@@ -50,9 +64,12 @@ def reindex(
     """Indekser vektordatabasen fra navno."""
     import json
 
+    import httpx
     from rich.progress import Progress
 
-    auth = get_auth(str(VDB_URL))
+    console = get_console()
+    base_url = vdb_url()
+    auth = get_auth(str(base_url))
     params = {"dry_run": dry_run}
     if not dry_run:
         _ = typer.confirm(
@@ -60,7 +77,7 @@ def reindex(
         )
     with httpx.stream(
         "PUT",
-        VDB_URL.copy_with(path="/admin/reindex"),
+        base_url.copy_with(path="/admin/reindex"),
         params=params,
         cookies=auth.get_cookie(),
         timeout=timeout,
@@ -1,6 +1,7 @@
 """Innstillinger fra miljøvariabler."""
 
-from typing import Annotated
+from functools import cache
+from typing import Annotated, Any
 
 from pydantic import Field, HttpUrl
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -27,4 +28,14 @@ class Settings(BaseSettings):
     """URL til NKS-KBS tjenesten"""
 
 
-settings = Settings()
+@cache
+def get_settings() -> Settings:
+    """Hent innstillinger for CLI (leses første gang de trengs)."""
+    return Settings()
+
+
+def __getattr__(name: str) -> Any:
+    """Støtt `from nks_kbs_analyse.cli.settings import settings` som før."""
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,17 +1,26 @@
 """Underkommando for NKS VDB."""
 
-from typing import Annotated, Any
+from pathlib import Path
+from typing import TYPE_CHECKING, Annotated, Any
 
-import httpx
 import typer
 
-from . import console, get_auth
-from .settings import settings
+from . import get_auth, get_console
+
+if TYPE_CHECKING:
+    import httpx
 
 app = typer.Typer(name="vdb", help="Interager med 'nks-vdb'")
 """Inngang for kommandolinjeverktøy for NKS VDB"""
-VDB_URL = httpx.URL(str(settings.vdb_url))
-"""URL til NKS VDB endepunkter"""
+
+
+def vdb_url() -> "httpx.URL":
+    """URL til NKS VDB endepunkter."""
+    import httpx
+
+    from .settings import get_settings
+
+    return httpx.URL(str(get_settings().vdb_url))
 
 
 @app.command()
@@ -28,9 +37,11 @@ def search(
     ] = 1.0,
 ) -> None:
     """Søk etter dokumenter i vektordatabasen."""
+    import httpx
     from rich.table import Table
 
-    auth = get_auth(str(VDB_URL))
+    base_url = vdb_url()
+    auth = get_auth(str(base_url))
     params = {
         "query": query,
         "num_results": str(num_results),
@@ -38,7 +49,7 @@ def search(
         "semantic_weight": str(semantic_weight),
     }
     response = httpx.get(
-        VDB_URL.copy_with(path="/api/v1/search"),
+        base_url.copy_with(path="/api/v1/search"),
         params=params,
         cookies=auth.get_cookie(),
     ).raise_for_status()
@@ -58,7 +69,7 @@ def search(
             str(doc["score"]),
             str(doc["semantic_similarity"]),
         )
-    console.print(doc_table)
+    get_console().print(doc_table)
 
 
 @app.command()
@@ -68,15 +79,21 @@ def clear(
     ] = True,
 ) -> None:
     """Tøm vektordatabasen for innhold."""
+    import httpx
+
+    console = get_console()
+    base_url = vdb_url()
     if not dry_run:
         _ = typer.confirm(
             "Er du sikker på at du vil tømme vektordatabasen?",
             abort=True,
         )
-    auth = get_auth(str(VDB_URL))
+    auth = get_auth(str(base_url))
     params = {"dry_run": dry_run}
     __ = httpx.delete(
-        VDB_URL.copy_with(path="/admin/clear"), cookies=auth.get_cookie(), params=params
+        base_url.copy_with(path="/admin/clear"),
+        cookies=auth.get_cookie(),
+        params=params,
     ).raise_for_status()
     if not dry_run:
         console.print("[bold red]Tømte vektordatabasen!")
@@ -96,9 +113,12 @@ def reindex(
     """Indekser vektordatabasen fra BigQuery."""
     import json
 
+    import httpx
     from rich.progress import Progress
 
-    auth = get_auth(str(VDB_URL))
+    console = get_console()
+    base_url = vdb_url()
+    auth = get_auth(str(base_url))
     params = {"dry_run": dry_run}
     if not dry_run:
         _ = typer.confirm(
@@ -106,7 +126,7 @@ def reindex(
         )
     with httpx.stream(
         "PUT",
-        VDB_URL.copy_with(path="/admin/reindex"),
+        base_url.copy_with(path="/admin/reindex"),
         params=params,
         cookies=auth.get_cookie(),
         timeout=timeout,
@@ -128,3 +148,128 @@ def reindex(
                     else:
                         console.print("[green bold]Fullførte indeksering")
                         console.print(data)
+    if not dry_run:
+        from nks_kbs_analyse.cache import RetrieverCache
+
+        # Lagrede søkeresultater gjelder for den gamle indeksen
+        RetrieverCache(disk=True).invalidate(str(base_url))
+
+
+@app.command()
+def evaluate(
+    questions: Annotated[
+        Path,
+        typer.Argument(
+            exists=True, dir_okay=False, help="Spørsmål i JSONL eller CSV ('query')"
+        ),
+    ],
+    output: Annotated[
+        Path, typer.Option(help="Resultater, '.parquet' gir Parquet ellers JSONL")
+    ] = Path("resultater.jsonl"),
+    num_results: Annotated[
+        int, typer.Option(min=1, max=30, help="Antall resultater")
+    ] = 5,
+    fts_weight: Annotated[
+        float, typer.Option(min=0.0, help="Vekting av ordsøket")
+    ] = 1.0,
+    semantic_weight: Annotated[
+        float, typer.Option(min=0.0, help="Vekting av det semantiskesøket")
+    ] = 1.0,
+    concurrency: Annotated[
+        int, typer.Option(min=1, help="Antall samtidige spørringer")
+    ] = 16,
+    rps: Annotated[
+        float | None,
+        typer.Option(min=0.1, help="Maksimalt antall spørringer per sekund"),
+    ] = None,
+    timeout: Annotated[
+        float, typer.Option(help="Hvor lenge, i sekunder, man venter per spørring")
+    ] = 20.0,
+    restart: Annotated[
+        bool, typer.Option(help="Start på nytt i stedet for å fortsette")
+    ] = False,
+    cache: Annotated[
+        bool,
+        typer.Option(help="Gjenbruk søkeresultater lagret på disk (under 'cache_dir')"),
+    ] = False,
+) -> None:
+    """Kjør mange spørsmål mot vektordatabasen og lagre treff og svartid."""
+    from rich.progress import (
+        BarColumn,
+        MofNCompleteColumn,
+        Progress,
+        TextColumn,
+        TimeRemainingColumn,
+    )
+
+    from nks_kbs_analyse.cache import RetrieverCache
+    from nks_kbs_analyse.evaluation import (
+        EvaluationProgress,
+        evaluate,
+        load_queries,
+    )
+    from nks_kbs_analyse.retriever import NKSRetriever
+
+    console = get_console()
+    base_url = vdb_url()
+    retriever = NKSRetriever(
+        auth=get_auth(str(base_url)),
+        base_url=str(base_url),
+        max_connections=concurrency,
+        max_keepalive_connections=concurrency,
+        cache=RetrieverCache(disk=True) if cache else None,
+    )
+    queries = load_queries(questions)
+    with Progress(
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TextColumn("{task.fields[rate]:.1f} spørsmål/s"),
+        TimeRemainingColumn(),
+        console=console,
+    ) as bar:
+        task = bar.add_task("Evaluerer", total=None, rate=0.0)
+
+        def report(progress: EvaluationProgress) -> None:
+            bar.update(
+                task,
+                total=progress.total,
+                completed=progress.completed + progress.failed,
+                rate=progress.queries_per_second,
+            )
+
+        summary = evaluate(
+            retriever,
+            queries,
+            output,
+            max_concurrency=concurrency,
+            requests_per_second=rps,
+            restart=restart,
+            progress=report,
+            k=num_results,
+            fts_weight=fts_weight,
+            semantic_weight=semantic_weight,
+            timeout=timeout,
+        )
+
+    console.print(
+        f"Kjørte {summary.completed} spørsmål på {summary.elapsed:.0f} sekunder "
+        f"({summary.queries_per_second:.1f} spørsmål/s), "
+        f"{summary.skipped} var kjørt fra før"
+    )
+    if retriever.cache is not None:
+        stats = retriever.cache.stats()
+        console.print(
+            f"Fant {stats.hits} av {stats.hits + stats.misses} søk i mellomlagringen"
+        )
+    if summary.latency_p50 is not None and summary.latency_p95 is not None:
+        console.print(
+            f"Svartid: median {summary.latency_p50:.2f} s, "
+            f"95-persentil {summary.latency_p95:.2f} s"
+        )
+    if summary.failed:
+        console.print(
+            f"[red]{summary.failed} spørsmål feilet, kjør kommandoen på nytt "
+            "for å prøve dem igjen"
+        )
+        raise typer.Exit(code=1)
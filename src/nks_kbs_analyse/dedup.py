@@ -0,0 +1,215 @@
+"""Fjerning av nesten like dokumenter før embedding.
+
+Mange kunnskapsartikler deler standardtekster (f.eks. "Slik sender du oppgave"
+og "Hvem gjør hva") som ellers ville blitt embeddet og indeksert mange ganger.
+Vi finner nesten like oppsplittede dokumenter med MinHash signaturer og
+locality-sensitive hashing (LSH). Hvert dokument sammenlignes bare med det
+første dokumentet i hver bøtte det havner i slik at tiden vokser tilnærmet
+lineært med antall dokumenter.
+
+Eksempel:
+    ```python
+    from nks_kbs_analyse.dedup import deduplicate_documents
+    from nks_kbs_analyse.knowledgebase import load, split_documents
+
+    chunks = split_documents(load(), chunk_size=1500, clean=True)
+    unique = deduplicate_documents(chunks, threshold=0.9)
+    ```
+"""
+
+import re
+import zlib
+from typing import TYPE_CHECKING, Iterable, Sequence
+
+from langchain_core.documents import Document
+
+if TYPE_CHECKING:
+    import numpy as np
+
+_WORD = re.compile(r"\w+")
+"""Ord som benyttes for å lage shingles"""
+
+_SHINGLE_MULTIPLIER = 0x100000001B3
+"""Multiplikator for å kombinere hash av ord til hash av shingles"""
+
+
+def _shingle_hashes(text: str, shingle_size: int) -> "np.ndarray":
+    """Hash av alle sekvenser med `shingle_size` ord i `text`."""
+    import numpy as np
+
+    words = _WORD.findall(text.lower()) or [""]
+    hashes = np.fromiter(
+        (zlib.crc32(word.encode("utf-8")) for word in words),
+        dtype=np.uint64,
+        count=len(words),
+    )
+    # Kombiner hash for påfølgende ord (polynom med overflyt modulo 2^64)
+    num_shingles = max(len(words) - shingle_size + 1, 1)
+    shingles = hashes[:num_shingles].copy()
+    for offset in range(1, min(shingle_size, len(words))):
+        shingles *= _SHINGLE_MULTIPLIER
+        shingles += hashes[offset : offset + num_shingles]
+    return shingles
+
+
+def minhash_signatures(
+    texts: Iterable[str],
+    num_perm: int = 128,
+    shingle_size: int = 3,
+    seed: int = 0,
+) -> "np.ndarray":
+    """Beregn MinHash signaturer for `texts`.
+
+    Andelen like verdier i to signaturer er et estimat av Jaccard likheten
+    mellom mengdene av shingles (sekvenser med `shingle_size` ord) i tekstene.
+
+    Args:
+        texts:
+            Tekstene det skal beregnes signatur for
+        num_perm:
+            Antall hash funksjoner (lengden på signaturen)
+        shingle_size:
+            Antall ord i hver shingle
+        seed:
+            Seed for hash funksjonene, signaturer kan bare sammenlignes hvis de
+            er beregnet med samme seed
+
+    Returns:
+        Matrise med én signatur (`uint32`) per rad
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    # Multiply-shift hashing: ((a * x + b) mod 2^64) >> 32 der a er odde
+    a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+    signatures = []
+    for text in texts:
+        shingles = _shingle_hashes(text, shingle_size)
+        hashes = (shingles[:, None] * a + b) >> np.uint64(32)
+        signatures.append(hashes.min(axis=0).astype(np.uint32))
+    if not signatures:
+        return np.empty((0, num_perm), dtype=np.uint32)
+    return np.vstack(signatures)
+
+
+def duplicate_groups(
+    signatures: "np.ndarray",
+    threshold: float = 0.8,
+    bands: int = 16,
+) -> list[list[int]]:
+    """Grupper nesten like signaturer med LSH.
+
+    Signaturene deles i `bands` bånd og to signaturer blir kandidater hvis
+    minst ett bånd er helt likt. En kandidat slås sammen med den første
+    signaturen i bøtta bare hvis estimert Jaccard likhet er minst `threshold`.
+
+    Args:
+        signatures:
+            Signaturer fra `minhash_signatures`
+        threshold:
+            Minste estimerte Jaccard likhet for at to dokumenter er like
+        bands:
+            Antall bånd i LSH, må gå opp i lengden på signaturene. Flere bånd
+            finner flere kandidater, men gir flere sammenligninger.
+
+    Returns:
+        Grupper med indekser (i stigende rekkefølge) for dokumenter som har
+        minst ett nesten likt dokument
+    """
+    num_docs, num_perm = signatures.shape
+    if num_perm % bands != 0:
+        raise ValueError(
+            f"Antall bånd ({bands}) må gå opp i lengden på signaturene ({num_perm})"
+        )
+    rows = num_perm // bands
+    parent = list(range(num_docs))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(bands):
+        band_values = signatures[:, band * rows : (band + 1) * rows]
+        buckets: dict[bytes, int] = {}
+        for i in range(num_docs):
+            first = buckets.setdefault(band_values[i].tobytes(), i)
+            if first == i:
+                continue
+            root_first, root_i = find(first), find(i)
+            if root_first == root_i:
+                continue
+            similarity = (signatures[first] == signatures[i]).mean()
+            if similarity >= threshold:
+                parent[max(root_first, root_i)] = min(root_first, root_i)
+
+    groups: dict[int, list[int]] = {}
+    for i in range(num_docs):
+        groups.setdefault(find(i), []).append(i)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def deduplicate_documents(
+    docs: Sequence[Document],
+    threshold: float = 0.8,
+    num_perm: int = 128,
+    bands: int = 16,
+    shingle_size: int = 3,
+) -> list[Document]:
+    """Fjern nesten like dokumenter.
+
+    Det første dokumentet i hver gruppe med nesten like dokumenter beholdes.
+    `KnowledgeArticleId` for de andre dokumentene i gruppen (som ikke er lik
+    det beholdte dokumentets egen) legges i metadata som
+    `DuplicateArticleIds`.
+
+    Args:
+        docs:
+            Oppsplittede dokumenter, f.eks. fra `knowledgebase.split_documents`
+        threshold:
+            Minste estimerte Jaccard likhet for at to dokumenter er like
+        num_perm:
+            Lengden på MinHash signaturene
+        bands:
+            Antall bånd i LSH (se `duplicate_groups`)
+        shingle_size:
+            Antall ord i hver shingle
+
+    Returns:
+        Dokumentene uten duplikater i samme rekkefølge som `docs`
+    """
+    signatures = minhash_signatures(
+        (doc.page_content for doc in docs),
+        num_perm=num_perm,
+        shingle_size=shingle_size,
+    )
+    canonical: dict[int, list[int]] = {}
+    removed: set[int] = set()
+    for group in duplicate_groups(signatures, threshold=threshold, bands=bands):
+        canonical[group[0]] = group[1:]
+        removed.update(group[1:])
+
+    result: list[Document] = []
+    for i, doc in enumerate(docs):
+        if i in removed:
+            continue
+        if i in canonical:
+            own_id = doc.metadata.get("KnowledgeArticleId")
+            duplicate_ids = {
+                docs[j].metadata.get("KnowledgeArticleId") for j in canonical[i]
+            }
+            doc = Document(
+                page_content=doc.page_content,
+                metadata={
+                    **doc.metadata,
+                    "DuplicateArticleIds": sorted(
+                        article_id
+                        for article_id in duplicate_ids
+                        if article_id is not None and article_id != own_id
+                    ),
+                },
+            )
+        result.append(doc)
+    return result
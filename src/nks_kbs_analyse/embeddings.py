@@ -1,17 +1,459 @@
 """Oppsett for å sette opp embedding funksjonalitet gjennom LangChain."""
 
+import asyncio
+import hashlib
+import threading
+import time
+from array import array
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Coroutine, TypeVar
+
 from langchain_core.embeddings import Embeddings
 
-from .settings import settings
+from .settings import get_settings
+
+if TYPE_CHECKING:
+    from .cache import CacheStats, DiskCache
+
+T = TypeVar("T")
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings som lagres på disk og bare beregnes for nye tekster.
+
+    Vektorene lagres som `float32` i en `DiskCache` med en nøkkel basert på
+    `namespace` (modell, deployment og antall dimensjoner) og en hash av
+    teksten. Samme tekst embeddes dermed aldri mer enn én gang per modell.
+
+    Eksempel:
+        ```python
+        embedding = get_embedding(cache=True)
+        vectors = embedding.embed_documents(texts)
+        print(embedding.stats())
+        ```
+    """
+
+    def __init__(self, embedding: Embeddings, cache: "DiskCache", namespace: str):
+        """Lag embeddings som lagres i `cache`.
+
+        Args:
+            embedding:
+                Modellen som benyttes for tekster som ikke er lagret
+            cache:
+                Lagring for vektorene
+            namespace:
+                Identifiserer modellen slik at vektorer fra ulike modeller
+                ikke blandes
+        """
+        self.embedding = embedding
+        self.cache = cache
+        self.namespace = namespace
+
+    def key(self, text: str) -> str:
+        """Nøkkel for `text` i lagringen."""
+        digest = hashlib.sha256(self.namespace.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def _encode(vector: list[float]) -> bytes:
+        """Lagre vektor kompakt som `float32`."""
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _decode(value: bytes) -> list[float]:
+        """Les vektor lagret med `_encode`."""
+        vector = array("f")
+        vector.frombytes(value)
+        return vector.tolist()
+
+    def _lookup(
+        self, texts: list[str]
+    ) -> tuple[list[str], dict[str, bytes], list[str]]:
+        """Slå opp `texts` og finn unike tekster som mangler."""
+        keys = [self.key(text) for text in texts]
+        found = self.cache.get_many(keys)
+        missing = list(
+            dict.fromkeys(text for text, key in zip(texts, keys) if key not in found)
+        )
+        return keys, found, missing
+
+    def _store(
+        self, found: dict[str, bytes], texts: list[str], vectors: list[list[float]]
+    ) -> None:
+        """Lagre nye vektorer og legg dem til i `found`."""
+        new = {
+            self.key(text): self._encode(vector) for text, vector in zip(texts, vectors)
+        }
+        self.cache.set_many(new)
+        found.update(new)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed tekster, bare tekster som ikke er lagret sendes til modellen."""
+        keys, found, missing = self._lookup(texts)
+        if missing:
+            self._store(found, missing, self.embedding.embed_documents(missing))
+        return [self._decode(found[key]) for key in keys]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed tekster asynkront, se `embed_documents`."""
+        keys, found, missing = self._lookup(texts)
+        if missing:
+            vectors = await self.embedding.aembed_documents(missing)
+            self._store(found, missing, vectors)
+        return [self._decode(found[key]) for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed en tekst (lagres som for dokumenter)."""
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        """Embed en tekst asynkront."""
+        return (await self.aembed_documents([text]))[0]
+
+    def stats(self) -> "CacheStats":
+        """Hent statistikk for bruk av lagringen."""
+        return self.cache.stats()
+
+
+def estimate_tokens(text: str) -> int:
+    """Enkelt (og konservativt) estimat av antall tokens i `text`.
+
+    Norsk tekst gir typisk litt over tre tegn per token med modellene vi bruker.
+    """
+    return len(text) // 3 + 1
+
+
+_TRANSIENT_ERRORS = frozenset({"APIConnectionError", "APITimeoutError"})
+"""Feil fra `openai` ved tidsavbrudd og brudd i forbindelsen"""
+
+
+def _status_code(error: BaseException) -> int | None:
+    """HTTP status for `error`, hvis den kommer fra et svar."""
+    response = getattr(error, "response", None)
+    status_code: int | None = getattr(error, "status_code", None) or getattr(
+        response, "status_code", None
+    )
+    return status_code
+
+
+def _is_transient(error: BaseException) -> bool:
+    """Finn ut om `error` er midlertidig (tidsavbrudd, forbindelse eller 5xx).
+
+    Sjekker navnet på feiltypene slik at `openai` ikke må importeres.
+    """
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if any(cls.__name__ in _TRANSIENT_ERRORS for cls in type(error).__mro__):
+        return True
+    status_code = _status_code(error)
+    return status_code is not None and status_code >= 500
+
+
+def _retry_after(error: BaseException) -> float | None:
+    """Finn ut om `error` er 429 (for mange kall) og hvor lenge man skal vente.
+
+    Returns:
+        `None` hvis feilen ikke er 429, ellers antall sekunder fra
+        `Retry-After` (0 hvis headeren mangler)
+    """
+    if _status_code(error) != 429:
+        return None
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        return float(headers.get("retry-after", 0))
+    except ValueError:
+        return 0.0
+
+
+@dataclass
+class EmbeddingStats:
+    """Statistikk for `ConcurrentEmbeddings`."""
 
+    tokens: int = 0
+    """Estimert antall tokens embeddet"""
 
-def get_embedding() -> Embeddings:
+    requests: int = 0
+    """Antall vellykkede kall mot modellen"""
+
+    rate_limited: int = 0
+    """Antall kall som fikk 429 (for mange kall)"""
+
+    retried: int = 0
+    """Antall kall som feilet midlertidig og ble prøvd på nytt"""
+
+    seconds: float = 0.0
+    """Samlet tid brukt på å embedde"""
+
+    @property
+    def tokens_per_second(self) -> float:
+        """Oppnådd gjennomstrømning."""
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+
+class _AdaptiveLimit:
+    """Begrensning av antall samtidige kall med AIMD.
+
+    Grensen økes med omtrent én for hver runde med vellykkede kall (additiv
+    økning) og halveres ved 429 (multiplikativ reduksjon). Ved 429 venter alle
+    kall til tidspunktet gitt av `Retry-After`.
+    """
+
+    def __init__(self, initial: int, maximum: int):
+        """Start med `initial` samtidige kall og øk til maksimalt `maximum`."""
+        self.limit = float(min(initial, maximum))
+        self.maximum = maximum
+        self.in_flight = 0
+        self.resume_at = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        """Vent til et nytt kall kan startes."""
+        while True:
+            delay = self.resume_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            async with self._condition:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                await self._condition.wait()
+
+    async def release(
+        self, retry_after: float | None = None, failed: bool = False
+    ) -> None:
+        """Registrer at et kall er ferdig.
+
+        `retry_after` er satt ved 429, `failed` ved andre feil (som ikke
+        endrer grensen).
+        """
+        async with self._condition:
+            self.in_flight -= 1
+            if retry_after is not None:
+                self.limit = max(1.0, self.limit / 2)
+                self.resume_at = max(self.resume_at, time.monotonic() + retry_after)
+            elif not failed:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class ConcurrentEmbeddings(Embeddings):
+    """Embeddings med flere samtidige kall og tilpasset rate.
+
+    Tekstene pakkes i batcher begrenset av både antall tekster og estimert
+    antall tokens. Flere batcher sendes samtidig, der antall samtidige kall
+    tilpasses automatisk etter 429 svar fra modellen. Midlertidige feil
+    (tidsavbrudd, brudd i forbindelsen og 5xx) prøves på nytt med eksponentielt
+    økende ventetid. Vektorene returneres i samme rekkefølge som tekstene.
+
+    Alle asynkrone kall mot modellen kjøres i én event loop i en egen tråd som
+    lever like lenge som objektet. Den asynkrone klienten til modellen (f.eks.
+    `httpx` i `openai`) er bundet til event loopen den først ble brukt i, og
+    kan dermed gjenbrukes på tvers av kall. Kall `close` for å stoppe tråden.
+
+    Den underliggende modellen bør ikke selv prøve på nytt (f.eks.
+    `max_retries=0` for `AzureOpenAIEmbeddings`), slik at det er denne
+    klassen som styrer raten.
+
+    Eksempel:
+        ```python
+        embedding = get_embedding(concurrent=True)
+        vectors = embedding.embed_documents(texts)
+        print(embedding.stats.tokens_per_second)
+        ```
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        max_batch_size: int = 1024,
+        max_batch_tokens: int = 100_000,
+        max_concurrency: int = 8,
+        initial_concurrency: int = 2,
+        max_retries: int = 8,
+        backoff: float = 1.0,
+        token_counter: Callable[[str], int] = estimate_tokens,
+    ):
+        """Lag embeddings med samtidige kall mot `embedding`.
+
+        Args:
+            embedding:
+                Modellen som benyttes
+            max_batch_size:
+                Maksimalt antall tekster per kall
+            max_batch_tokens:
+                Maksimalt estimert antall tokens per kall
+            max_concurrency:
+                Maksimalt antall samtidige kall
+            initial_concurrency:
+                Antall samtidige kall ved start
+            max_retries:
+                Antall ganger en batch prøves på nytt etter 429 eller
+                midlertidige feil
+            backoff:
+                Sekunder å vente før første nye forsøk etter en midlertidig
+                feil (eller 429 uten `Retry-After`), dobles for hvert forsøk
+            token_counter:
+                Funksjon som estimerer antall tokens i en tekst
+        """
+        self.embedding = embedding
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrency = max_concurrency
+        self.initial_concurrency = initial_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.token_counter = token_counter
+        self.stats = EmbeddingStats()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def _submit(self, coro: Coroutine[None, None, T]) -> Future[T]:
+        """Kjør `coro` i event loopen til dette objektet, start den ved behov."""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name="ConcurrentEmbeddings",
+                    daemon=True,
+                )
+                self._thread.start()
+            return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    async def _await(self, coro: Coroutine[None, None, T]) -> T:
+        """Vent asynkront på `coro` som kjøres i event loopen til objektet."""
+        if asyncio.get_running_loop() is self._loop:
+            return await coro
+        return await asyncio.wrap_future(self._submit(coro))
+
+    def close(self) -> None:
+        """Stopp event loopen og tråden den kjører i."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None or thread is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    def batches(self, texts: list[str]) -> list[tuple[int, int, int]]:
+        """Del `texts` i batcher.
+
+        Returns:
+            Start, slutt og estimert antall tokens for hver batch
+        """
+        batches: list[tuple[int, int, int]] = []
+        start = tokens = 0
+        for i, text in enumerate(texts):
+            text_tokens = self.token_counter(text)
+            if i > start and (
+                i - start >= self.max_batch_size
+                or tokens + text_tokens > self.max_batch_tokens
+            ):
+                batches.append((start, i, tokens))
+                start, tokens = i, 0
+            tokens += text_tokens
+        if start < len(texts):
+            batches.append((start, len(texts), tokens))
+        return batches
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed tekster med flere samtidige kall."""
+        return await self._await(self._embed(texts))
+
+    async def _embed(self, texts: list[str]) -> list[list[float]]:
+        """Embed tekster med flere samtidige kall i event loopen til objektet."""
+        started = time.perf_counter()
+        limit = _AdaptiveLimit(self.initial_concurrency, self.max_concurrency)
+        results: list[list[float]] = [[] for _ in texts]
+
+        async def embed_batch(start: int, end: int, tokens: int) -> None:
+            for attempt in range(self.max_retries + 1):
+                delay = min(self.backoff * 2.0**attempt, 60.0)
+                await limit.acquire()
+                try:
+                    vectors = await self.embedding.aembed_documents(texts[start:end])
+                except Exception as error:
+                    retry_after = _retry_after(error)
+                    if attempt == self.max_retries or (
+                        retry_after is None and not _is_transient(error)
+                    ):
+                        await limit.release(failed=True)
+                        raise
+                    if retry_after is not None:
+                        self.stats.rate_limited += 1
+                        await limit.release(retry_after or delay)
+                    else:
+                        self.stats.retried += 1
+                        await limit.release(failed=True)
+                        await asyncio.sleep(delay)
+                    continue
+                await limit.release()
+                if len(vectors) != end - start:
+                    raise ValueError(
+                        f"Modellen returnerte {len(vectors)} vektorer "
+                        f"for {end - start} tekster"
+                    )
+                results[start:end] = vectors
+                self.stats.requests += 1
+                self.stats.tokens += tokens
+                return
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                for batch in self.batches(texts):
+                    group.create_task(embed_batch(*batch))
+        except ExceptionGroup as errors:
+            # Gi videre feilen fra modellen i stedet for en gruppe med feil
+            raise errors.exceptions[0]
+        finally:
+            self.stats.seconds += time.perf_counter() - started
+        return results
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed tekster med flere samtidige kall."""
+        return self._submit(self._embed(texts)).result()
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed en tekst."""
+        return self.embedding.embed_query(text)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        """Embed en tekst asynkront."""
+        return await self._await(self.embedding.aembed_query(text))
+
+
+def get_embedding(
+    cache: "bool | DiskCache" = False, concurrent: bool = False
+) -> Embeddings:
     """Hjelpemetode som konfigurerer riktig embedding modell.
 
     Basert på innstillinger for prosjektet.
+
+    Args:
+        cache:
+            Lagre embeddings på disk (se `CachedEmbeddings`). Hvis `True`
+            benyttes `embeddings.sqlite` under `settings.cache_dir`, ellers
+            kan man oppgi en egen `DiskCache`.
+        concurrent:
+            Send flere batcher samtidig med tilpasset rate (se
+            `ConcurrentEmbeddings`)
     """
     from langchain_openai import AzureOpenAIEmbeddings
 
+    settings = get_settings()
+    assert settings.azure_api_key is not None, (
+        "'AZURE_OPENAI_API_KEY' må være satt i kjøretidsmiljøet "
+        "for å kunne bruke embeddings!"
+    )
     embedding: Embeddings = AzureOpenAIEmbeddings(
         dimensions=settings.azure_ai.embedding_size,
         api_key=settings.azure_api_key.get_secret_value(),
@@ -20,5 +462,30 @@ def get_embedding() -> Embeddings:
         azure_endpoint=str(settings.azure_endpoint),
         chunk_size=settings.azure_ai.chunk_size,
         model=settings.azure_ai.embedding_model,
+        # Ved samtidige kall håndteres 429 og midlertidige feil av
+        # 'ConcurrentEmbeddings'
+        max_retries=0 if concurrent else 2,
+    )
+    if concurrent:
+        embedding = ConcurrentEmbeddings(
+            embedding,
+            max_batch_size=settings.azure_ai.chunk_size,
+            max_concurrency=settings.azure_ai.max_concurrency,
+        )
+    if cache is False:
+        return embedding
+    if cache is True:
+        from .cache import DiskCache
+
+        cache = DiskCache(
+            settings.cache_dir / "embeddings.sqlite",
+            max_bytes=settings.embedding_cache_size,
+        )
+    namespace = ":".join(
+        [
+            settings.azure_ai.embedding_model,
+            settings.azure_ai.embedding_deployment,
+            str(settings.azure_ai.embedding_size),
+        ]
     )
-    return embedding
+    return CachedEmbeddings(embedding, cache, namespace)
@@ -0,0 +1,431 @@
+"""Evaluering av søk med mange spørsmål samtidig.
+
+Spørsmål leses fra JSONL eller CSV (kolonnen `query`, eventuelt `id` og andre
+kolonner som tas med i resultatet) og sendes til en retriever med et begrenset
+antall samtidige kall og maksimalt antall kall per sekund. Resultatene skrives
+fortløpende til JSONL eller Parquet slik at en avbrutt kjøring kan fortsette
+der den stoppet.
+
+Eksempel:
+    ```python
+    from nks_kbs_analyse.evaluation import evaluate, load_queries
+
+    summary = evaluate(
+        retriever,
+        load_queries("spørsmål.csv"),
+        "resultater.jsonl",
+        max_concurrency=16,
+        requests_per_second=20,
+    )
+    print(summary.latency_p50, summary.latency_p95)
+    ```
+
+I Jupyter (som allerede har en event loop) brukes `await aevaluate(...)`.
+"""
+
+import asyncio
+import csv
+import json
+import os
+import statistics
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Protocol
+
+from langchain_core.documents import Document
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+    from langchain_core.retrievers import BaseRetriever
+
+RESULT_METADATA = ["KnowledgeArticleId", "Title", "Section", "Tab"]
+"""Metadata fra hvert dokument som tas med i resultatet"""
+
+
+@dataclass
+class EvaluationQuery:
+    """Ett spørsmål i et evalueringssett."""
+
+    id: str
+    """Unik ID, brukes for å fortsette en avbrutt kjøring"""
+
+    query: str
+    """Spørsmålet"""
+
+    extra: dict[str, Any] = field(default_factory=dict)
+    """Andre kolonner (f.eks. forventet artikkel) som kopieres til resultatet"""
+
+
+def load_queries(path: str | os.PathLike[str]) -> list[EvaluationQuery]:
+    """Les spørsmål fra JSONL eller CSV.
+
+    Hver rad må ha `query`. Rader uten `id` får radnummeret som ID, rekkefølgen
+    må da være den samme hvis en avbrutt kjøring skal fortsette.
+    """
+    path = Path(path)
+    with path.open(encoding="utf-8", newline="") as fp:
+        if path.suffix.lower() == ".csv":
+            rows: list[dict[str, Any]] = list(csv.DictReader(fp))
+        else:
+            rows = [json.loads(line) for line in fp if line.strip()]
+    queries = []
+    for i, row in enumerate(rows):
+        if not row.get("query"):
+            raise ValueError(f"Rad {i} i '{path}' mangler 'query'")
+        query = row.pop("query")
+        key = row.pop("id", None)
+        queries.append(
+            EvaluationQuery(str(i if key in (None, "") else key), query, row)
+        )
+    return queries
+
+
+class ResultWriter(Protocol):
+    """Felles grensesnitt for skriving av resultater."""
+
+    def completed(self) -> set[str]:
+        """ID-er til spørsmål som har et vellykket resultat."""
+        ...
+
+    def write(self, record: dict[str, Any]) -> None:
+        """Skriv resultatet for ett spørsmål."""
+        ...
+
+    def close(self) -> None:
+        """Skriv resultater som venter."""
+        ...
+
+    def clear(self) -> None:
+        """Fjern tidligere resultater."""
+        ...
+
+
+class JsonlResults:
+    """Resultater i JSONL, én linje per spørsmål skrives med en gang."""
+
+    def __init__(self, path: str | os.PathLike[str]):
+        """Skriv resultater til `path`."""
+        self.path = Path(path)
+        self._fp: Any = None
+
+    def completed(self) -> set[str]:
+        """ID-er til spørsmål som har et vellykket resultat."""
+        if not self.path.exists():
+            return set()
+        done = set()
+        with self.path.open(encoding="utf-8") as fp:
+            for line in fp:
+                # Siste linje kan være ufullstendig hvis kjøringen ble avbrutt
+                if not line.endswith("\n"):
+                    break
+                record = json.loads(line)
+                if record.get("error") is None:
+                    done.add(record["id"])
+        return done
+
+    def write(self, record: dict[str, Any]) -> None:
+        """Skriv resultatet for ett spørsmål."""
+        if self._fp is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._truncate_partial()
+            self._fp = self.path.open("a", encoding="utf-8")
+        self._fp.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._fp.flush()
+
+    def _truncate_partial(self) -> None:
+        """Fjern ufullstendig siste linje fra en avbrutt kjøring."""
+        if not self.path.exists():
+            return
+        data = self.path.read_bytes()
+        if data and not data.endswith(b"\n"):
+            with self.path.open("r+b") as fp:
+                fp.truncate(data.rfind(b"\n") + 1)
+
+    def close(self) -> None:
+        """Lukk filen."""
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def clear(self) -> None:
+        """Fjern tidligere resultater."""
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+
+def _parquet_schema(inferred: "pa.Schema") -> "pa.Schema":
+    """Faste typer slik at alle delfilene har samme skjema.
+
+    Kolonner der alle verdiene i en delfil er `None` (f.eks. `error`) får
+    ellers typen `null`.
+    """
+    import pyarrow as pa
+
+    document = pa.struct(
+        [(name, pa.string()) for name in RESULT_METADATA]
+        + [
+            ("Score", pa.float64()),
+            ("SemanticSimilarity", pa.float64()),
+            ("Content", pa.string()),
+        ]
+    )
+    known = {
+        "id": pa.string(),
+        "query": pa.string(),
+        "latency": pa.float64(),
+        "error": pa.string(),
+        "documents": pa.list_(document),
+    }
+    return pa.schema(
+        [
+            (
+                field.name,
+                known.get(
+                    field.name,
+                    pa.string() if pa.types.is_null(field.type) else field.type,
+                ),
+            )
+            for field in inferred
+        ]
+    )
+
+
+class ParquetResults:
+    """Resultater i Parquet, skrevet som en katalog med delfiler.
+
+    En Parquet fil kan ikke utvides etter at den er skrevet, resultatene
+    skrives derfor til en ny delfil for hver `batch_size` spørsmål. Katalogen
+    kan leses med `pandas.read_parquet(path)`.
+    """
+
+    def __init__(self, path: str | os.PathLike[str], batch_size: int = 500):
+        """Skriv resultater til katalogen `path`."""
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self._pending: list[dict[str, Any]] = []
+
+    def _parts(self) -> list[Path]:
+        return sorted(self.path.glob("part-*.parquet"))
+
+    def completed(self) -> set[str]:
+        """ID-er til spørsmål som har et vellykket resultat."""
+        import pyarrow.parquet as pq
+
+        done = set()
+        for part in self._parts():
+            table = pq.read_table(part, columns=["id", "error"])
+            for key, error in zip(table["id"].to_pylist(), table["error"].to_pylist()):
+                if error is None:
+                    done.add(key)
+        return done
+
+    def write(self, record: dict[str, Any]) -> None:
+        """Legg til resultatet, skrives når det er nok til en delfil."""
+        self._pending.append(record)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Skriv resultater som venter til en ny delfil."""
+        if not self._pending:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        parts = self._parts()
+        number = int(parts[-1].stem.split("-")[-1]) + 1 if parts else 0
+        part = self.path / f"part-{number:05d}.parquet"
+        tmp = part.with_suffix(".tmp")
+        table = pa.Table.from_pylist(self._pending)
+        pq.write_table(table.cast(_parquet_schema(table.schema)), tmp)
+        os.replace(tmp, part)
+        self._pending = []
+
+    def close(self) -> None:
+        """Skriv resultater som venter."""
+        self.flush()
+
+    def clear(self) -> None:
+        """Fjern tidligere resultater."""
+        self._pending = []
+        for part in self._parts():
+            part.unlink()
+
+
+def open_results(path: str | os.PathLike[str]) -> ResultWriter:
+    """Velg format for resultater fra filendelsen (`.parquet` eller JSONL)."""
+    if Path(path).suffix.lower() == ".parquet":
+        return ParquetResults(path)
+    return JsonlResults(path)
+
+
+class RateLimiter:
+    """Begrens antall kall per sekund ved å spre dem jevnt utover."""
+
+    def __init__(self, requests_per_second: float):
+        """Tillat `requests_per_second` kall per sekund."""
+        self.interval = 1.0 / requests_per_second
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        """Vent til neste kall kan gjøres."""
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+@dataclass
+class EvaluationProgress:
+    """Status for en pågående evaluering."""
+
+    total: int
+    """Antall spørsmål som skal kjøres i denne kjøringen"""
+
+    completed: int = 0
+    """Antall spørsmål med svar"""
+
+    failed: int = 0
+    """Antall spørsmål som feilet"""
+
+    skipped: int = 0
+    """Antall spørsmål med resultat fra en tidligere kjøring"""
+
+    elapsed: float = 0.0
+    """Sekunder siden evalueringen startet"""
+
+    latencies: list[float] = field(default_factory=list, repr=False)
+    """Svartid (sekunder) for hvert spørsmål med svar"""
+
+    @property
+    def queries_per_second(self) -> float:
+        """Antall spørsmål behandlet per sekund."""
+        done = self.completed + self.failed
+        return done / self.elapsed if self.elapsed > 0 else 0.0
+
+    def _latency(self, quantile: int) -> float | None:
+        if len(self.latencies) < 2:
+            return self.latencies[0] if self.latencies else None
+        return statistics.quantiles(self.latencies, n=100)[quantile - 1]
+
+    @property
+    def latency_p50(self) -> float | None:
+        """Median svartid i sekunder."""
+        return self._latency(50)
+
+    @property
+    def latency_p95(self) -> float | None:
+        """95-persentil av svartid i sekunder."""
+        return self._latency(95)
+
+
+def _document_record(doc: Document) -> dict[str, Any]:
+    """Dokument fra retriever slik det lagres i resultatet."""
+    metadata = doc.metadata
+    record = {name: metadata.get(name) for name in RESULT_METADATA}
+    record["Score"] = metadata.get("Score")
+    record["SemanticSimilarity"] = metadata.get("SemanticSimilarity")
+    record["Content"] = doc.page_content
+    return record
+
+
+async def aevaluate(
+    retriever: "BaseRetriever",
+    queries: Iterable[EvaluationQuery],
+    output: str | os.PathLike[str] | ResultWriter,
+    max_concurrency: int = 16,
+    requests_per_second: float | None = None,
+    restart: bool = False,
+    progress: Callable[[EvaluationProgress], None] | None = None,
+    **search_kwargs: Any,
+) -> EvaluationProgress:
+    """Kjør `queries` mot `retriever` og skriv resultatene til `output`.
+
+    Spørsmål som allerede har et vellykket resultat i `output` hoppes over,
+    spørsmål som feilet kjøres på nytt (siste resultat for en ID gjelder).
+
+    Args:
+        retriever:
+            Retriever som søkes i, f.eks. `retriever.NKSRetriever`
+        queries:
+            Spørsmålene, se `load_queries`
+        output:
+            Fil for resultater, `.parquet` gir Parquet ellers JSONL
+        max_concurrency:
+            Maksimalt antall samtidige kall
+        requests_per_second:
+            Maksimalt antall kall per sekund, `None` for ingen grense
+        restart:
+            Fjern tidligere resultater i stedet for å fortsette
+        progress:
+            Kalles med status etter hvert spørsmål
+        search_kwargs:
+            Sendes til `retriever.ainvoke`, f.eks. `k` og `fts_weight`
+
+    Returns:
+        Status da evalueringen var ferdig
+    """
+    writer = open_results(output) if isinstance(output, (str, os.PathLike)) else output
+    if restart:
+        writer.clear()
+    done = writer.completed()
+    queries = list(queries)
+    pending = [item for item in queries if item.id not in done]
+    state = EvaluationProgress(total=len(pending), skipped=len(queries) - len(pending))
+    limiter = RateLimiter(requests_per_second) if requests_per_second else None
+    started = time.monotonic()
+    iterator = iter(pending)
+
+    async def worker() -> None:
+        # Iteratoren deles av alle arbeiderne, det er trygt siden de kjører i
+        # samme tråd
+        for item in iterator:
+            if limiter is not None:
+                await limiter.wait()
+            start = time.perf_counter()
+            error = None
+            docs: list[Document] = []
+            try:
+                docs = await retriever.ainvoke(item.query, **search_kwargs)
+            except Exception as exc:
+                error = f"{type(exc).__name__}: {exc}"
+            latency = time.perf_counter() - start
+            writer.write(
+                {"id": item.id, "query": item.query}
+                | item.extra
+                | {
+                    "latency": latency,
+                    "error": error,
+                    "documents": [_document_record(doc) for doc in docs],
+                }
+            )
+            if error is None:
+                state.completed += 1
+                state.latencies.append(latency)
+            else:
+                state.failed += 1
+            state.elapsed = time.monotonic() - started
+            if progress is not None:
+                progress(state)
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(max_concurrency)))
+    finally:
+        writer.close()
+    state.elapsed = time.monotonic() - started
+    return state
+
+
+def evaluate(
+    retriever: "BaseRetriever",
+    queries: Iterable[EvaluationQuery],
+    output: str | os.PathLike[str] | ResultWriter,
+    **kwargs: Any,
+) -> EvaluationProgress:
+    """Som `aevaluate`, men for kode uten event loop."""
+    return asyncio.run(aevaluate(retriever, queries, output, **kwargs))
@@ -0,0 +1,318 @@
+"""Lokalt hybrid søk med BM25 og embeddings.
+
+`HybridRetriever` kombinerer et ordsøk (BM25 over stammede norske ord) med
+cosinus likhet fra en `vectorstore.LocalVectorStore` på samme måte som
+NKS-VDB kombinerer ordsøk og semantisk søk:
+
+    Score = fts_weight * ordsøk + semantic_weight * SemanticSimilarity
+
+der ordsøket er BM25 skalert slik at beste dokument for spørringen får 1.
+Resultatet har samme metadata (`Score` og `SemanticSimilarity`) og tar imot
+de samme argumentene som `retriever.NKSRetriever`, slik at vektingen kan
+utforskes uten nettverk.
+
+Eksempel:
+    ```python
+    from nks_kbs_analyse.embeddings import get_embedding
+    from nks_kbs_analyse.hybrid import HybridRetriever
+    from nks_kbs_analyse.vectorstore import LocalVectorStore
+
+    store = LocalVectorStore.load("vektorer", get_embedding(cache=True))
+    retriever = HybridRetriever(store=store)
+    docs = retriever.invoke("Hva er dagpenger?", fts_weight=0.5)
+    ```
+"""
+
+import re
+import unicodedata
+from array import array
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Iterable, Sequence
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
+
+from .vectorstore import LocalVectorStore, MetadataFilter, _merge_top_k, _normalize
+
+if TYPE_CHECKING:
+    import numpy as np
+
+_WORD = re.compile(r"\w+")
+"""Ord i en tekst"""
+
+_VOWELS = frozenset("aeiouyæøå")
+"""Vokaler i norsk (Snowball)"""
+
+_S_ENDING = frozenset("bcdfghjlmnoprtvyz")
+"""Bokstaver som kan stå foran en `s` som fjernes"""
+
+_STEP1_SUFFIXES = sorted(
+    (
+        "a e ede ande ende ane ene hetene en heten ar er heter as es edes endes "
+        "enes hetenes ens hetens ers ets et het ast erte ert s"
+    ).split(),
+    key=len,
+    reverse=True,
+)
+"""Endelser som fjernes (eller erstattes) i første steg, lengste først"""
+
+_STEP3_SUFFIXES = sorted(
+    "leg eleg ig eig lig elig els lov elov slov hetslov".split(),
+    key=len,
+    reverse=True,
+)
+"""Endelser som fjernes i siste steg, lengste først"""
+
+STOPWORDS = frozenset(
+    (
+        "og i jeg det at en et den til er som på de med han av ikke ikkje der "
+        "så var meg seg men ett har om vi min mitt ha hadde hun nå over da ved "
+        "fra du ut sin dem oss opp man kan hans hvor eller hva skal selv sjøl "
+        "her alle vil bli ble blei blitt kunne inn når være kom noen noe ville "
+        "dere deres kun ja etter ned skulle denne for deg si sine sitt mot å "
+        "meget hvorfor dette disse uten hvordan ingen din ditt blir samme "
+        "hvilken hvilke sånn inni mellom vår hver hvem vors hvis både bare enn "
+        "fordi før mange også slik vært båe begge siden henne hennar hennes"
+    ).split()
+)
+"""Norske stoppord som ikke indekseres (samme liste som Snowball)"""
+
+
+def _r1(word: str) -> int:
+    """Start på region R1 i `word` (minst tre bokstaver inn)."""
+    for i in range(1, len(word)):
+        if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+            return max(i + 1, 3)
+    return len(word)
+
+
+@lru_cache(maxsize=2**16)
+def stem(word: str) -> str:
+    """Finn stammen til et norsk ord med Snowball algoritmen for norsk.
+
+    Dette er samme algoritme som `to_tsvector('norwegian', ...)` i PostgreSQL
+    benytter.
+    """
+    r1 = _r1(word)
+    # Steg 1: bøyningsendelser, bare den lengste endelsen i R1 vurderes
+    for suffix in _STEP1_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= r1:
+            stripped = word[: -len(suffix)]
+            if suffix in ("erte", "ert"):
+                word = stripped + "er"
+            elif suffix != "s":
+                word = stripped
+            elif stripped[-1] in _S_ENDING or (
+                stripped[-1] == "k" and stripped[-2:-1] not in _VOWELS
+            ):
+                word = stripped
+            break
+    # Steg 2: 'dt' og 'vt' blir 'd' og 'v'
+    if word.endswith(("dt", "vt")) and len(word) - 2 >= r1:
+        word = word[:-1]
+    # Steg 3: avledningsendelser
+    for suffix in _STEP3_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= r1:
+            word = word[: -len(suffix)]
+            break
+    return word
+
+
+def tokenize(text: str) -> list[str]:
+    """Del `text` i stammede ord uten stoppord."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return [stem(word) for word in _WORD.findall(text) if word not in STOPWORDS]
+
+
+class BM25Index:
+    """Invertert indeks med BM25 vekter.
+
+    Vekten til hvert par av (ord, dokument) beregnes ved oppbygging slik at
+    et søk bare summerer vektene for ordene i spørringen.
+    """
+
+    def __init__(self, texts: Iterable[str], k1: float = 1.2, b: float = 0.75):
+        """Indekser `texts` (rekkefølgen gir dokumentnummer).
+
+        Args:
+            texts:
+                Teksten til hvert dokument
+            k1:
+                Hvor raskt vekten flater ut med antall forekomster
+            b:
+                Hvor mye vekten normaliseres for lengden på dokumentet
+        """
+        import numpy as np
+
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: dict[str, int] = {}
+        term_ids = array("q")
+        lengths = array("q")
+        for text in texts:
+            tokens = tokenize(text)
+            term_ids.extend(
+                [
+                    self.vocabulary.setdefault(token, len(self.vocabulary))
+                    for token in tokens
+                ]
+            )
+            lengths.append(len(tokens))
+        self.size = len(lengths)
+        n = max(self.size, 1)
+        doc_lengths = np.frombuffer(lengths, dtype=np.int64)
+        # Tell forekomster av hvert par (ord, dokument), sortert etter ord
+        doc_of_token = np.repeat(np.arange(self.size), doc_lengths)
+        pairs = np.frombuffer(term_ids, dtype=np.int64) * n + doc_of_token
+        pairs, counts = np.unique(pairs, return_counts=True)
+        terms, docs = np.divmod(pairs, n)
+        self.indptr = np.searchsorted(terms, np.arange(len(self.vocabulary) + 1))
+        frequency = np.diff(self.indptr)
+        idf = np.log(1 + (self.size - frequency + 0.5) / (frequency + 0.5))
+        average = max(float(doc_lengths.mean()) if self.size else 0.0, 1e-9)
+        norm = k1 * (1 - b + b * doc_lengths[docs] / average)
+        self.doc_ids = docs.astype(np.int32)
+        self.weights = (idf[terms] * counts * (k1 + 1) / (counts + norm)).astype(
+            np.float32
+        )
+
+    def __len__(self) -> int:
+        """Antall dokumenter."""
+        return self.size
+
+    def scores(self, queries: Sequence[str]) -> "np.ndarray":
+        """BM25 for alle dokumenter med form `(antall spørringer, antall dokumenter)`."""
+        import numpy as np
+
+        result = np.zeros((len(queries), self.size), dtype=np.float32)
+        for row, query in enumerate(queries):
+            for term in set(tokenize(query)):
+                term_id = self.vocabulary.get(term)
+                if term_id is not None:
+                    start, end = self.indptr[term_id], self.indptr[term_id + 1]
+                    # Hvert dokument forekommer bare én gang per ord
+                    result[row, self.doc_ids[start:end]] += self.weights[start:end]
+        return result
+
+
+class HybridRetriever(BaseRetriever):
+    """Lokalt hybrid søk som etterligner NKS-VDB.
+
+    Se modulen for hvordan ordsøk og semantisk søk vektes.
+    """
+
+    store: LocalVectorStore
+    """Dokumenter og embeddings som det søkes i"""
+
+    k: int = 5
+    """Antall dokumenter å hente per spørring"""
+
+    fts_weight: float = 1.0
+    """Standard vekting av ordsøket"""
+
+    semantic_weight: float = 1.0
+    """Standard vekting av det semantiske søket"""
+
+    batch_size: int = 256
+    """Antall spørringer som behandles samtidig i `batch_search`"""
+
+    bm25: BM25Index | None = None
+    """Indeks for ordsøk, bygges fra `store` ved første søk"""
+
+    _bm25_version: int | None = PrivateAttr(default=None)
+
+    def _bm25(self) -> BM25Index:
+        """Indeks for ordsøk som stemmer med dokumentene i `store`."""
+        if self.bm25 is None or self._bm25_version != self.store.version:
+            self.bm25 = BM25Index(doc.page_content for doc in self.store.documents)
+            self._bm25_version = self.store.version
+        return self.bm25
+
+    def batch_search(
+        self,
+        queries: Sequence[str],
+        k: int | None = None,
+        fts_weight: float | None = None,
+        semantic_weight: float | None = None,
+        filter: MetadataFilter | None = None,
+    ) -> list[list[Document]]:
+        """Søk etter mange spørringer samtidig.
+
+        Args:
+            queries:
+                Spørringene
+            k:
+                Antall dokumenter per spørring
+            fts_weight:
+                Vekting av ordsøket
+            semantic_weight:
+                Vekting av det semantiske søket
+            filter:
+                Krav til metadata, se `LocalVectorStore.similarity_search`
+
+        Returns:
+            Dokumenter med `Score` og `SemanticSimilarity` for hver spørring,
+            sortert etter `Score`
+        """
+        import numpy as np
+
+        k = self.k if k is None else k
+        fts_weight = self.fts_weight if fts_weight is None else fts_weight
+        semantic_weight = (
+            self.semantic_weight if semantic_weight is None else semantic_weight
+        )
+        vectors = self.store.vectors
+        if not queries or vectors is None or len(vectors) == 0:
+            return [[] for _ in queries]
+        bm25 = self._bm25()
+        rows = self.store.filter_rows(filter)
+        columns = slice(None) if rows is None else rows
+        embeddings = self.store.embedding.embed_documents(list(queries))
+        results: list[list[Document]] = []
+        for start in range(0, len(queries), self.batch_size):
+            batch = queries[start : start + self.batch_size]
+            q = _normalize(
+                embeddings[start : start + self.batch_size], vectors.dimensions
+            )
+            semantic = vectors.scores(q, columns)
+            fts = bm25.scores(batch)[:, columns]
+            best = fts.max(axis=1, keepdims=True)
+            fts /= np.where(best > 0, best, 1)
+            score = fts_weight * fts + semantic_weight * semantic
+            candidates = np.broadcast_to(np.arange(score.shape[1]), score.shape)
+            top, top_scores = _merge_top_k(candidates, score, min(k, score.shape[1]))
+            similarity = np.take_along_axis(semantic, top, axis=1)
+            if rows is not None:
+                top = rows[top]
+            results.extend(
+                [
+                    Document(
+                        id=self.store.documents[i].id,
+                        page_content=self.store.documents[i].page_content,
+                        metadata=self.store.documents[i].metadata
+                        | {
+                            "SemanticSimilarity": float(sim),
+                            "Score": float(total),
+                        },
+                    )
+                    for i, sim, total in zip(row_top, row_sim, row_scores, strict=True)
+                ]
+                for row_top, row_sim, row_scores in zip(
+                    top, similarity, top_scores, strict=True
+                )
+            )
+        return results
+
+    def _get_relevant_documents(self, query: str, **kwargs: Any) -> list[Document]:
+        """Søk lokalt med samme argumenter som `NKSRetriever`.
+
+        `timeout` godtas, men benyttes ikke.
+        """
+        return self.batch_search(
+            [query],
+            k=kwargs.get("k"),
+            fts_weight=kwargs.get("fts_weight"),
+            semantic_weight=kwargs.get("semantic_weight"),
+            filter=kwargs.get("filter"),
+        )[0]
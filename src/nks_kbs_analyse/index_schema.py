@@ -0,0 +1,137 @@
+"""Typer for metadata-feltene i søkeindeksen.
+
+Feltene utledes fra `knowledgebase.METADATA_COLUMNS` og metadata i
+`knowledgebase.METADATA_MAPPING`, i tillegg til metadata som legges til ved
+splitting og opplasting. Tidspunkter lagres som `DateTimeOffset` og
+`DataCategories` som en liste slik at man kan filtrere på serveren, f.eks.
+artikler endret etter en dato:
+
+    ```python
+    from nks_kbs_analyse.azure_search import odata_filter
+
+    odata_filter({"LastModifiedBQ": {"ge": datetime(2024, 9, 1, tzinfo=UTC)}})
+    # "LastModifiedBQ ge 2024-09-01T00:00:00+00:00"
+    ```
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Iterable, Literal, Mapping
+
+from .knowledgebase import METADATA_COLUMNS, METADATA_MAPPING
+
+FieldType = Literal["string", "datetime", "collection"]
+"""Typer metadata kan ha i indeksen"""
+
+
+@dataclass(frozen=True)
+class MetadataField:
+    """Beskrivelse av ett metadata-felt i indeksen."""
+
+    name: str
+    """Navn på feltet (samme som nøkkelen i metadata)"""
+
+    type: FieldType = "string"
+    """Type i indeksen"""
+
+    filterable: bool = True
+    """Om feltet kan brukes i filter"""
+
+    facetable: bool = False
+    """Om man kan telle dokumenter per verdi"""
+
+    sortable: bool = False
+    """Om resultater kan sorteres på feltet"""
+
+
+_FIELD_TYPES: dict[str, FieldType] = {
+    "LastModifiedBQ": "datetime",
+    "EmbeddingCreation": "datetime",
+    "DataCategories": "collection",
+}
+"""Felter som ikke er tekst"""
+
+_FACETABLE = frozenset({"ArticleType", "DataCategories", "Section", "Tab"})
+"""Felter med få ulike verdier"""
+
+_SORTABLE = frozenset({"LastModifiedBQ", "EmbeddingCreation", "Title"})
+"""Felter det er naturlig å sortere på"""
+
+
+def _metadata_names() -> list[str]:
+    """Navn på all metadata et oppsplittet dokument kan ha."""
+    names = list(METADATA_COLUMNS)
+    for extra in METADATA_MAPPING.values():
+        names.extend(name for name in extra if name not in names)
+    for name in ["Section", "Tab", "Fragment", "ContentColumn", "EmbeddingCreation"]:
+        if name not in names:
+            names.append(name)
+    return names
+
+
+METADATA_FIELDS: dict[str, MetadataField] = {
+    name: MetadataField(
+        name,
+        type=_FIELD_TYPES.get(name, "string"),
+        facetable=name in _FACETABLE,
+        sortable=name in _SORTABLE,
+    )
+    for name in _metadata_names()
+}
+"""Metadata-feltene i indeksen"""
+
+
+def to_datetime(value: datetime | str) -> datetime:
+    """Tidspunkt med tidssone, tidspunkt uten tidssone tolkes som lokal tid."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value if value.tzinfo is not None else value.astimezone()
+
+
+def _to_datetime(value: Any) -> str | None:
+    return None if value is None else to_datetime(value).isoformat()
+
+
+def _to_collection(value: Any) -> list[str]:
+    """Liste av tekst, `DataCategories` kommer som kommaseparert tekst."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(",") if item.strip()]
+    return [str(item) for item in value]
+
+
+def _to_string(value: Any) -> str | None:
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _to_json(value: Any) -> Any:
+    """Metadata som ikke er felter i indeksen må bare kunne lagres som JSON."""
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+_CONVERTERS: dict[FieldType, Callable[[Any], Any]] = {
+    "string": _to_string,
+    "datetime": _to_datetime,
+    "collection": _to_collection,
+}
+
+
+def to_index_values(metadatas: Iterable[Mapping[str, Any]]) -> list[dict[str, Any]]:
+    """Konverter metadata til verdier med typene i `METADATA_FIELDS`.
+
+    Konverteringen gjøres kolonne for kolonne for hele batchen slik at typen
+    bare slås opp én gang per felt.
+    """
+    rows = [dict(metadata) for metadata in metadatas]
+    for name in set().union(*rows):
+        field = METADATA_FIELDS.get(name)
+        convert = _CONVERTERS[field.type] if field is not None else _to_json
+        for row in rows:
+            if name in row:
+                row[name] = convert(row[name])
+    return rows
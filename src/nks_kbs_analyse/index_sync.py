@@ -0,0 +1,202 @@
+"""Inkrementell synkronisering av oppsplittede dokumenter mot Azure AI Search.
+
+Hvert oppsplittet dokument får en stabil ID basert på artikkel, innholdskolonne,
+posisjon og en hash av innholdet. Ved å sammenligne disse ID-ene med ID-ene som
+allerede finnes i indeksen kan vi bare laste opp nye eller endrede dokumenter
+og slette dokumenter som ikke lenger finnes.
+
+Eksempel:
+    ```python
+    from nks_kbs_analyse.azure_search import create_store
+    from nks_kbs_analyse.index_sync import sync_index
+    from nks_kbs_analyse.knowledgebase import (
+        clean_documents,
+        get_active_article_ids,
+        load,
+        split_documents,
+    )
+
+    chunks = split_documents(clean_documents(load()), chunk_size=1500)
+    plan = sync_index(create_store(), chunks, get_active_article_ids())
+    ```
+"""
+
+import hashlib
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import TYPE_CHECKING, Collection, Iterable, Mapping
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+if TYPE_CHECKING:
+    from .azure_search import AzureExtended
+
+_INVALID_KEY_CHARS = re.compile(r"[^A-Za-z0-9_\-=]")
+"""Tegn som ikke er lov i nøkler i Azure AI Search"""
+
+
+def chunk_id(article_id: str, content_column: str, position: int, content: str) -> str:
+    """Lag en stabil ID for et oppsplittet dokument.
+
+    Args:
+        article_id:
+            `KnowledgeArticleId` til artikkelen dokumentet kommer fra
+        content_column:
+            Innholdskolonnen dokumentet kommer fra
+        position:
+            Posisjonen til dokumentet blant dokumentene fra samme artikkel og
+            innholdskolonne
+        content:
+            Innholdet i dokumentet
+    """
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+    key = f"{article_id}_{content_column}_{position}_{digest}"
+    return _INVALID_KEY_CHARS.sub("-", key)
+
+
+def assign_chunk_ids(chunks: Iterable[Document]) -> dict[str, Document]:
+    """Gi hvert oppsplittet dokument en stabil ID.
+
+    Dokumentene må komme i samme rekkefølge som fra
+    `knowledgebase.split_documents` slik at posisjonen er stabil.
+
+    Returns:
+        Mapping fra ID til dokument (i samme rekkefølge som `chunks`)
+    """
+    positions: dict[tuple[str, str], int] = defaultdict(int)
+    result: dict[str, Document] = {}
+    for chunk in chunks:
+        article_id = chunk.metadata["KnowledgeArticleId"]
+        column = chunk.metadata["ContentColumn"]
+        position = positions[(article_id, column)]
+        positions[(article_id, column)] += 1
+        result[chunk_id(article_id, column, position, chunk.page_content)] = chunk
+    return result
+
+
+@dataclass
+class SyncPlan:
+    """Endringer som må til for at indeksen skal samsvare med dokumentene."""
+
+    upsert: dict[str, Document] = field(default_factory=dict)
+    """Dokumenter som er nye eller endret og må lastes opp"""
+
+    delete: list[str] = field(default_factory=list)
+    """ID-er til dokumenter som skal slettes fra indeksen"""
+
+    unchanged: int = 0
+    """Antall dokumenter som allerede finnes i indeksen"""
+
+
+def plan_sync(
+    chunks: Mapping[str, Document],
+    existing: Mapping[str, str | None],
+    active_ids: Collection[str] | None = None,
+) -> SyncPlan:
+    """Finn hvilke dokumenter som må lastes opp og slettes.
+
+    Dokumenter i indeksen som ikke lenger finnes blant `chunks` slettes bare
+    hvis artikkelen deres er med i `chunks` eller ikke lenger er aktiv. Dette
+    gjør at man kan synkronisere et utvalg av artikler, f.eks. bare de som er
+    endret siden forrige gang, uten å slette resten.
+
+    Args:
+        chunks:
+            Ønskede dokumenter med ID fra `assign_chunk_ids`
+        existing:
+            Mapping fra ID til `KnowledgeArticleId` for dokumenter i indeksen
+        active_ids:
+            `KnowledgeArticleId` for aktive artikler, dokumenter fra artikler
+            som ikke er med slettes. Hvis `None` slettes ingen artikler på
+            grunn av status.
+    """
+    plan = SyncPlan()
+    for key, chunk in chunks.items():
+        if key in existing:
+            plan.unchanged += 1
+        else:
+            plan.upsert[key] = chunk
+    touched = {chunk.metadata["KnowledgeArticleId"] for chunk in chunks.values()}
+    for key, article_id in existing.items():
+        if key in chunks:
+            continue
+        if article_id in touched or (
+            active_ids is not None and article_id not in active_ids
+        ):
+            plan.delete.append(key)
+    return plan
+
+
+def sync_index(
+    store: "AzureExtended",
+    chunks: Iterable[Document],
+    active_ids: Collection[str] | None = None,
+    embedding: Embeddings | None = None,
+    batch_size: int = 500,
+    dry_run: bool = False,
+) -> SyncPlan:
+    """Synkroniser indeksen med oppsplittede dokumenter.
+
+    Bare nye eller endrede dokumenter blir embeddet og lastet opp, og
+    dokumenter som ikke lenger finnes (eller tilhører inaktive artikler)
+    slettes. Se `plan_sync` for detaljer.
+
+    Args:
+        store:
+            Indeksen som skal synkroniseres
+        chunks:
+            Oppsplittede dokumenter fra `knowledgebase.split_documents`
+        active_ids:
+            `KnowledgeArticleId` for aktive artikler (se
+            `knowledgebase.get_active_article_ids`)
+        embedding:
+            Embedding modell, hvis ikke oppgitt brukes default for prosjektet
+            med embeddings lagret på disk og samtidige kall
+        batch_size:
+            Antall dokumenter som embeddes og lastes opp om gangen
+        dry_run:
+            Bare beregn endringer uten å endre indeksen
+
+    Returns:
+        Endringene som ble (eller ville blitt) utført
+    """
+    plan = plan_sync(assign_chunk_ids(chunks), store.get_chunk_ids(), active_ids)
+    if dry_run:
+        return plan
+    if embedding is None:
+        from .embeddings import get_embedding
+
+        embedding = get_embedding(cache=True, concurrent=True)
+    created = datetime.now().isoformat()
+    upserts = list(plan.upsert.items())
+    for start in range(0, len(upserts), batch_size):
+        batch = upserts[start : start + batch_size]
+        texts = [chunk.page_content for _, chunk in batch]
+        results = store.upsert_chunks(
+            ids=[key for key, _ in batch],
+            texts=texts,
+            embeddings=embedding.embed_documents(texts),
+            metadatas=[
+                chunk.metadata | {"EmbeddingCreation": created} for _, chunk in batch
+            ],
+        )
+        failed = [result.key for result in results if not result.succeeded]
+        if failed:
+            raise RuntimeError(
+                f"Klarte ikke å laste opp {len(failed)} dokumenter: {failed}"
+            )
+    if plan.delete:
+        not_deleted = {
+            key: error
+            for result in store.delete_by_ids(plan.delete)
+            for key, error in result.failed.items()
+        }
+        if not_deleted:
+            raise RuntimeError(
+                f"Klarte ikke å slette {len(not_deleted)} dokumenter: "
+                f"{list(not_deleted)}"
+            )
+    return plan
@@ -4,13 +4,34 @@ Vi benytter kunnskapsbasen på BigQuery som er gjengitt i
 [Quarto](https://data.ansatt.nav.no/quarto/e7b3e02a-0c45-4b5c-92a2-a6d364120dfb/index.html)
 """
 
+import os
 import re
+import statistics
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Iterable, Tuple, Union
+from itertools import islice
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Iterable,
+    Iterator,
+    Mapping,
+    NamedTuple,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 from langchain_core.documents import Document
 
-from .settings import settings
+from .settings import get_settings
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+    from .cache import ChunkCache
+
+T = TypeVar("T")
 
 METADATA_COLUMNS: list[str] = [
     "ArticleType",
@@ -145,18 +166,86 @@ def __format_query(
     )
 
 
-def load(last_modified: datetime | None = None) -> Iterable[Document]:
+def __format_unpivot_query(
+    min_length: int = 30, last_modified: datetime | None = None
+) -> str:
+    """Intern metode som formaterer én spørring som henter alle innholdskolonner.
+
+    Alle kolonnene i `CONTENT_COLUMNS` blir snudd (`UNPIVOT`) til rader med
+    `ContentColumn` og `Content` slik at hele kunnskapsbasen kan hentes med én
+    jobb i BigQuery. Filtrering skjer på samme måte som i `__format_query`.
+
+    Args:
+        min_length:
+            Det må minst være `min_length` antall tegn i innholdet for at det
+            skal regnes som et dokument.
+        last_modified:
+            Valgbar tidspunkt for å filtrere kolonner som er eldre enn
+            `last_modified`
+
+    Returns:
+        SQL spørring for å hente ut alle innholdskolonner som dokumenter
+    """
+    metadata_columns = ", ".join(METADATA_COLUMNS)
+    content_columns = ", ".join(CONTENT_COLUMNS)
+    # 'UNPIVOT' hopper over NULL verdier slik at vi ikke trenger å filtrere
+    # disse eksplisitt
+    sql = (
+        "SELECT {metadata_columns}, ContentColumn, Content"
+        " FROM `kunnskapsbase.kunnskapsartikler`"
+        " UNPIVOT (Content FOR ContentColumn IN ({content_columns}))"
+        " WHERE PublishStatus = 'Online'"
+        " AND Content != ''"
+        " AND CHAR_LENGTH(Content) >= {min_length}"
+    )
+    if last_modified:
+        sql += f" AND LastModifiedBQ > '{last_modified.isoformat()}'"
+    return sql.format(
+        metadata_columns=metadata_columns,
+        content_columns=content_columns,
+        min_length=min_length,
+    )
+
+
+def _row_to_document(row: Mapping[str, Any], column: str) -> Document:
+    """Lag et dokument av en rad fra kunnskapsbasen.
+
+    Args:
+        row:
+            Rad med metadata og innhold (`Content`)
+        column:
+            Innholdskolonnen raden kommer fra
+    """
+    metadata = {k: v for k, v in row.items() if k in METADATA_COLUMNS}
+    metadata |= get_column_metadata(column, row["ArticleType"], row["Title"])
+    metadata["ContentColumn"] = column
+    return Document(page_content=row["Content"], metadata=metadata)
+
+
+def load(
+    last_modified: datetime | None = None, single_query: bool = False
+) -> Iterable[Document]:
     """Last inn kunnskapsbasen fra BigQuery og produser LangChain dokumenter.
 
     Args:
         last_modified (valgbar):
             Bare last inn dokumenter nyere enn `last_modified`
+        single_query:
+            Hent alle innholdskolonnene med én spørring i stedet for én
+            spørring per kolonne. Dette gir færre jobber i BigQuery, men
+            rekkefølgen på dokumentene er ikke lenger gruppert på kolonne.
+
     Returns:
         Generator som produserer dokumenter
     """
     from google.cloud import bigquery
 
-    client = bigquery.Client(project=settings.gcp.prosjekt)
+    client = bigquery.Client(project=get_settings().gcp.prosjekt)
+    if single_query:
+        query = __format_unpivot_query(last_modified=last_modified)
+        for row in client.query(query).result():
+            yield _row_to_document(row, row["ContentColumn"])
+        return
     # Vi itererer gjennom alle innholdkolonnene for å minimere minnebruk ved å
     # ikke hente ut alle kunnskapsartikler på en gang
     for column in CONTENT_COLUMNS:
@@ -165,11 +254,104 @@ def load(last_modified: datetime | None = None) -> Iterable[Document]:
         # For hver rad (mao. hver artikkel) henter vi ut innhold og metadata som
         # tilsammen produserer et dokument
         for row in raw_results:
-            metadata = {k: v for k, v in row.items() if k in METADATA_COLUMNS}
-            metadata |= get_column_metadata(column, row["ArticleType"], row["Title"])
-            metadata["ContentColumn"] = column
-            content = row["Content"]
-            yield Document(page_content=content, metadata=metadata)
+            yield _row_to_document(row, column)
+
+
+def load_batches(
+    last_modified: datetime | None = None, page_size: int = 10_000
+) -> Iterator["pa.RecordBatch"]:
+    """Last inn kunnskapsbasen fra BigQuery som en strøm av Arrow batcher.
+
+    Alle innholdskolonner hentes med én spørring (se `load(single_query=True)`)
+    og hver side med resultater fra BigQuery blir en `pyarrow.RecordBatch`.
+
+    Args:
+        last_modified (valgbar):
+            Bare last inn rader nyere enn `last_modified`
+        page_size:
+            Antall rader per side (og dermed per batch) som hentes fra BigQuery
+
+    Returns:
+        Generator som produserer Arrow batcher
+    """
+    from google.cloud import bigquery
+
+    client = bigquery.Client(project=get_settings().gcp.prosjekt)
+    query = __format_unpivot_query(last_modified=last_modified)
+    rows = client.query(query).result(page_size=page_size)
+    yield from rows.to_arrow_iterable()
+
+
+def load_table(last_modified: datetime | None = None) -> "pa.Table":
+    """Last inn alle innholdskolonner fra kunnskapsbasen som en Arrow tabell.
+
+    Tabellen har én rad per innholdskolonne per artikkel, med kolonnene i
+    `METADATA_COLUMNS` i tillegg til `ContentColumn` og `Content`.
+
+    Args:
+        last_modified (valgbar):
+            Bare last inn rader nyere enn `last_modified`
+
+    Returns:
+        Arrow tabell med rader fra kunnskapsbasen
+    """
+    from google.cloud import bigquery
+
+    client = bigquery.Client(project=get_settings().gcp.prosjekt)
+    query = __format_unpivot_query(last_modified=last_modified)
+    return client.query(query).result().to_arrow()
+
+
+def documents_from_batch(batch: "pa.RecordBatch") -> Iterator[Document]:
+    """Lag dokumenter direkte fra kolonnene i en Arrow batch.
+
+    Produserer de samme dokumentene som `load`, men uten å gå via en rad per
+    artikkel. Metadata for innholdskolonnen gjenbrukes mellom rader som gir
+    samme resultat fra `get_column_metadata`.
+
+    Args:
+        batch:
+            Batch med kolonnene fra `load_table`/`load_batches`
+    """
+    metadata_values = [batch.column(name).to_pylist() for name in METADATA_COLUMNS]
+    content_columns = batch.column("ContentColumn").to_pylist()
+    contents = batch.column("Content").to_pylist()
+    article_types = batch.column("ArticleType").to_pylist()
+    titles = batch.column("Title").to_pylist()
+    # 'get_column_metadata' ser bare på om tittelen inneholder "Felles", så vi
+    # kan gjenbruke resultatet for alle rader med samme nøkkel
+    column_metadata: dict[tuple[str, str, bool], dict[str, str]] = {}
+    for values, column, content, article_type, title in zip(
+        zip(*metadata_values), content_columns, contents, article_types, titles
+    ):
+        key = (column, article_type, "Felles" in title)
+        if key not in column_metadata:
+            column_metadata[key] = get_column_metadata(column, article_type, title)
+        metadata = dict(zip(METADATA_COLUMNS, values))
+        metadata |= column_metadata[key]
+        metadata["ContentColumn"] = column
+        yield Document(page_content=content, metadata=metadata)
+
+
+def load_arrow(
+    last_modified: datetime | None = None, page_size: int = 10_000
+) -> Iterator[Document]:
+    """Last inn kunnskapsbasen via Arrow og produser LangChain dokumenter.
+
+    Gir de samme dokumentene som `load(single_query=True)`, men bygger dem fra
+    Arrow kolonner side for side slik at bare én side holdes i minnet.
+
+    Args:
+        last_modified (valgbar):
+            Bare last inn dokumenter nyere enn `last_modified`
+        page_size:
+            Antall rader som hentes fra BigQuery per side
+
+    Returns:
+        Generator som produserer dokumenter
+    """
+    for batch in load_batches(last_modified=last_modified, page_size=page_size):
+        yield from documents_from_batch(batch)
 
 
 def get_active_article_ids() -> set[str]:
@@ -180,7 +362,7 @@ def get_active_article_ids() -> set[str]:
     """
     from google.cloud import bigquery
 
-    client = bigquery.Client(project=settings.gcp.prosjekt)
+    client = bigquery.Client(project=get_settings().gcp.prosjekt)
     query = (
         "SELECT KnowledgeArticleId"
         " FROM `kunnskapsbase.kunnskapsartikler`"
@@ -190,23 +372,84 @@ def get_active_article_ids() -> set[str]:
     return set(row["KnowledgeArticleId"] for row in raw_results)
 
 
+CLEANING_VERSION = 1
+"""Versjon av reglene for rensing, må økes når `_clean_document` endres slik at
+lagrede resultat fra `split_documents` ikke blir brukt"""
+
+# MERK: Regex-ene under gir samme resultat som de opprinnelige
+# `re.sub(r"(#{1,6}.*\n)\n+", ...)`, `re.sub(r"(\n\n)\s+", ...)` og
+# `re.sub(r"^#{1,6}\s*\n", ..., flags=re.MULTILINE)`, men er skrevet slik at de
+# starter med et fast tegn og ikke trenger å gå tilbake i teksten. Å slå dem
+# sammen til én regex med alternativer er tregere fordi man da mister søket
+# etter fast prefiks.
+_HEADER_NEWLINES = re.compile(r"(#[^\n]*+\n)\n+")
+"""Finner for mange newline etter overskrift"""
+
+_EXTRA_NEWLINES = re.compile(r"\n\n\s+")
+"""Finner 3 eller flere newlines (eller 2 newlines etterfulgt av whitespace)"""
+
+_EMPTY_HEADERS = re.compile(r"#(?<![^\n]#)#{0,5}\s*\n")
+"""Finner tomme markdown overskrifter (i starten av en linje)"""
+
+
 def _clean_document(doc: Document) -> Document:
     """Prøv å rense kunnskapsartikkel (`doc`) med enkle regex-er."""
-    import re
-
-    new_content = doc.page_content
     # Fjerne for mange newline etter overskrift
-    new_content = re.sub(r"(#{1,6}.*\n)\n+", r"\1", new_content)
+    new_content = _HEADER_NEWLINES.sub(r"\1", doc.page_content)
     # Bytter 3 eller flere newlines med 2 newlines
-    new_content = re.sub(r"(\n\n)\s+", r"\1", new_content)
+    new_content = _EXTRA_NEWLINES.sub("\n\n", new_content)
     # Fjerne tomme markdown overskrifter
-    new_content = re.sub(r"^#{1,6}\s*\n", "", new_content, flags=re.MULTILINE)
+    new_content = _EMPTY_HEADERS.sub("", new_content)
     return Document(page_content=new_content, metadata=doc.metadata)
 
 
+def iter_clean_documents(docs: Iterable[Document]) -> Iterator[Document]:
+    """Rens kunnskapsartikler (`docs`) etter hvert som de produseres.
+
+    Til forskjell fra `clean_documents` holdes ikke alle dokumentene i minnet
+    samtidig slik at man kan koble rensing direkte mellom `load` og
+    `split_documents`:
+
+    ```python
+    splits = split_documents(iter_clean_documents(load()), chunk_size=1500)
+    ```
+    """
+    for doc in docs:
+        yield _clean_document(doc)
+
+
 def clean_documents(docs: Iterable[Document]) -> list[Document]:
     """Prøv å rense kunnskapsartikler (`docs`) med enkle regex-er."""
-    return [_clean_document(doc) for doc in docs]
+    return list(iter_clean_documents(docs))
+
+
+_LINE_BREAKS = "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+"""Tegn som `str.splitlines` regner som linjeskift"""
+
+_HEADER_LINE = re.compile(
+    rf"(#(?<![^{_LINE_BREAKS}]#)#{{0,5}}) ([^{_LINE_BREAKS}]*)(\r\n|[{_LINE_BREAKS}])?"
+)
+"""Finner markdownoverskrifter i starten av en linje, inkludert linjeskiftet"""
+
+_NON_WHITESPACE = re.compile(r"\S")
+"""Brukes for å sjekke om en del av en tekst bare består av whitespace"""
+
+
+class HeaderSpan(NamedTuple):
+    """Del av en tekst mellom to markdownoverskrifter."""
+
+    start: int
+    """Indeks til starten av delen i originalteksten"""
+
+    end: int
+    """Indeks til slutten (eksklusiv) av delen i originalteksten"""
+
+    headers: tuple[tuple[int, str], ...]
+    """Overskriftene (dybde og tekst) som gjelder for delen"""
+
+    def text(self, source: str) -> str:
+        """Hent ut teksten til delen fra originalteksten `source`."""
+        return source[self.start : self.end]
 
 
 class CustomMarkdownHeaderSplitter:
@@ -226,9 +469,6 @@ class CustomMarkdownHeaderSplitter:
         strip_headers: bool = True,
     ):
         """Setter opp en CustomMarkdownHeaderSplitter."""
-        self.chunks: list[Document] = []
-        self.current_chunk = Document(page_content="")
-        self.current_header_stack: list[Tuple[int, str]] = []
         self.strip_headers = strip_headers
         if headers_to_split_on:
             self.splittable_headers = dict(headers_to_split_on)
@@ -246,53 +486,64 @@ class CustomMarkdownHeaderSplitter:
         av implementasjonen i ExperimentalMarkdownSyntaxTextSplitter i langchain.
 
         """
-        raw_lines = text.splitlines(keepends=True)
-
-        while raw_lines:
-            raw_line = raw_lines.pop(0)
-            header_match = self._match_header(raw_line)
-            if header_match:
-                self._complete_chunk_doc()
-
-                if not self.strip_headers:
-                    self.current_chunk.page_content += raw_line
-
-                # Add the header to the stack
-                header_depth = len(header_match.group(1))
-                header_text = header_match.group(2)
-                self._resolve_header_stack(header_depth, header_text)
-            else:
-                self.current_chunk.page_content += raw_line
-
-        self._complete_chunk_doc()
-        return self.chunks
-
-    def _resolve_header_stack(self, header_depth: int, header_text: str) -> None:
-        for i, (depth, _) in enumerate(self.current_header_stack):
+        return [
+            Document(page_content=span.text(text), metadata=self.header_metadata(span))
+            for span in self.split_spans(text)
+        ]
+
+    def header_metadata(self, span: HeaderSpan) -> dict[str, str]:
+        """Lag metadata med overskriftene til `span`."""
+        return {
+            self.splittable_headers["#" * depth]: value for depth, value in span.headers
+        }
+
+    def split_spans(self, text: str) -> list[HeaderSpan]:
+        """Finn delene av `text` mellom markdownoverskrifter.
+
+        Teksten gås gjennom én gang og bare posisjoner og overskrifter tas vare
+        på, selve teksten til hver del hentes med `HeaderSpan.text`. Linjer og
+        overskrifter tolkes på samme måte som `str.splitlines` og
+        `re.match(r"^(#{1,6}) (.*)", line)` ville gjort for hver linje.
+        """
+        spans: list[HeaderSpan] = []
+        header_stack: list[tuple[int, str]] = []
+        chunk_start = 0
+        for match in _HEADER_LINE.finditer(text):
+            hashes, header_text, line_break = match.groups()
+            # Bare konfigurerte overskrifter fører til splitt
+            if hashes not in self.splittable_headers:
+                continue
+            self._complete_span(spans, text, chunk_start, match.start(), header_stack)
+            chunk_start = match.end() if self.strip_headers else match.start()
+            # Linjeskift (utenom '\n') er en del av overskriftsteksten
+            if line_break:
+                header_text += line_break.rstrip("\n")
+            self._resolve_header_stack(header_stack, len(hashes), header_text)
+        self._complete_span(spans, text, chunk_start, len(text), header_stack)
+        return spans
+
+    @staticmethod
+    def _resolve_header_stack(
+        header_stack: list[tuple[int, str]], header_depth: int, header_text: str
+    ) -> None:
+        for i, (depth, _) in enumerate(header_stack):
             if depth == header_depth:
-                self.current_header_stack[i] = (header_depth, header_text)
-                self.current_header_stack = self.current_header_stack[: i + 1]
+                header_stack[i] = (header_depth, header_text)
+                del header_stack[i + 1 :]
                 return
-        self.current_header_stack.append((header_depth, header_text))
-
-    def _complete_chunk_doc(self) -> None:
-        chunk_content = self.current_chunk.page_content
+        header_stack.append((header_depth, header_text))
+
+    @staticmethod
+    def _complete_span(
+        spans: list[HeaderSpan],
+        text: str,
+        start: int,
+        end: int,
+        header_stack: list[tuple[int, str]],
+    ) -> None:
         # Discard any empty documents
-        if chunk_content and not chunk_content.isspace():
-            # Apply the header stack as metadata
-            for depth, value in self.current_header_stack:
-                header_key = self.splittable_headers.get("#" * depth)
-                self.current_chunk.metadata[header_key] = value
-            self.chunks.append(self.current_chunk)
-        # Reset the current chunk
-        self.current_chunk = Document(page_content="")
-
-    def _match_header(self, line: str) -> Union[re.Match[str], None]:
-        match = re.match(r"^(#{1,6}) (.*)", line)
-        # Only matches on the configured headers
-        if match and match.group(1) in self.splittable_headers:
-            return match
-        return None
+        if _NON_WHITESPACE.search(text, start, end):
+            spans.append(HeaderSpan(start, end, tuple(header_stack)))
 
 
 def _split_documents_on_headers(
@@ -303,24 +554,27 @@ def _split_documents_on_headers(
 
     Returner de splittede dokumentene med overskriftene som ekstra metadata.
     """
+    markdown_header_splitter = CustomMarkdownHeaderSplitter(
+        headers_to_split_on=headers_to_split_on, strip_headers=True
+    )
     split_docs: list[Document] = []
     for document in documents:
-        markdown_header_splitter = CustomMarkdownHeaderSplitter(
-            headers_to_split_on=headers_to_split_on, strip_headers=True
-        )
-        fragments = markdown_header_splitter.split_text(document.page_content)
+        text = document.page_content
         doc_metadata = document.metadata.copy()
         split_docs.extend(
             Document(
-                page_content=fragment.page_content,
-                metadata={**doc_metadata, "Headers": fragment.metadata.copy()},
+                page_content=span.text(text),
+                metadata={
+                    **doc_metadata,
+                    "Headers": markdown_header_splitter.header_metadata(span),
+                },
             )
-            for fragment in fragments
+            for span in markdown_header_splitter.split_spans(text)
         )
     return split_docs
 
 
-def _combine_headers_and_content(documents: list[Document]) -> list[Document]:
+def _combine_headers_and_content(documents: Iterable[Document]) -> list[Document]:
     """Legg til kontekst fra metadata i page_content for dokumenter.
 
     Args:
@@ -346,11 +600,111 @@ def _combine_headers_and_content(documents: list[Document]) -> list[Document]:
     return combined_docs
 
 
+class _DocumentSplitter:
+    """Splitter for `split_documents` som kan gjenbrukes for mange dokumenter."""
+
+    def __init__(
+        self,
+        chunk_size: int,
+        overlap: int,
+        headers_to_split_on: Union[list[Tuple[str, str]], None],
+        clean: bool = False,
+    ):
+        """Sett opp splitter med gitte innstillinger."""
+        from langchain_text_splitters import Language, RecursiveCharacterTextSplitter
+
+        self.text_splitter = RecursiveCharacterTextSplitter.from_language(
+            language=Language.MARKDOWN, chunk_size=chunk_size, chunk_overlap=overlap
+        )
+        self.headers_to_split_on = headers_to_split_on
+        self.clean = clean
+
+    def split(self, docs: Iterable[Document]) -> list[Document]:
+        """Splitt dokumenter, se `split_documents`."""
+        if self.clean:
+            docs = iter_clean_documents(docs)
+
+        # Først splitt dokumentene basert på markdown headers
+        header_split_docs = _split_documents_on_headers(docs, self.headers_to_split_on)
+
+        # Deretter splitt basert på antall tegn
+        recursive_split_docs = self.text_splitter.transform_documents(header_split_docs)
+
+        # Legg til markdown headers som metadata i de splittede dokumentene
+        return _combine_headers_and_content(recursive_split_docs)
+
+    def split_each(self, docs: Iterable[Document]) -> list[list[Document]]:
+        """Splitt hvert dokument for seg og returner resultatet per dokument."""
+        return [self.split([doc]) for doc in docs]
+
+
+_worker_splitter: _DocumentSplitter | None = None
+"""Splitter for hver prosess når `split_documents` kjøres i parallell"""
+
+
+def _init_split_worker(
+    chunk_size: int,
+    overlap: int,
+    headers_to_split_on: Union[list[Tuple[str, str]], None],
+    clean: bool,
+) -> None:
+    """Sett opp splitter én gang når en ny prosess startes."""
+    global _worker_splitter
+    _worker_splitter = _DocumentSplitter(
+        chunk_size, overlap, headers_to_split_on, clean
+    )
+
+
+def _split_in_worker(docs: list[Document]) -> list[list[Document]]:
+    """Splitt en batch med dokumenter i en prosess satt opp av `_init_split_worker`."""
+    assert _worker_splitter is not None, "Prosessen er ikke satt opp for splitting"
+    return _worker_splitter.split_each(docs)
+
+
+def _batched(items: Iterable[T], size: int) -> Iterator[list[T]]:
+    """Del opp `items` i lister med `size` elementer (siste kan være kortere)."""
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _split_each(
+    docs: Iterable[Document],
+    options: tuple[int, int, Union[list[Tuple[str, str]], None], bool],
+    num_workers: int,
+    batch_size: int,
+) -> Iterator[list[Document]]:
+    """Splitt hvert dokument (eventuelt i parallell) og produser resultatet.
+
+    `options` er argumentene til `_DocumentSplitter`.
+    """
+    if num_workers <= 1:
+        splitter = _DocumentSplitter(*options)
+        for doc in docs:
+            yield splitter.split([doc])
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        initializer=_init_split_worker,
+        initargs=options,
+    ) as executor:
+        # 'map' returnerer resultatene i samme rekkefølge som batchene
+        for result in executor.map(_split_in_worker, _batched(docs, batch_size)):
+            yield from result
+
+
 def split_documents(
     docs: Iterable[Document],
     chunk_size: int = 1000,
     overlap: int = 100,
     headers_to_split_on: Union[list[Tuple[str, str]], None] = None,
+    num_workers: int | None = 1,
+    batch_size: int = 100,
+    clean: bool = False,
+    cache: Union["ChunkCache", None] = None,
 ) -> list[Document]:
     """Splitt dokumenter ned til mindre dokumenter.
 
@@ -370,24 +724,165 @@ def split_documents(
         headers_to_split_on:
             Hvilke overskriftsnivå som skal splittes på.
             (Default er #, ## og ###)
+        num_workers:
+            Antall prosesser som splitter dokumenter i parallell. Hvis `None`
+            brukes én prosess per CPU kjerne.
+        batch_size:
+            Antall dokumenter som sendes til en prosess om gangen når
+            `num_workers` er større enn 1
+        clean:
+            Rens dokumentene (se `clean_documents`) før de splittes
+        cache:
+            Lagring av tidligere resultat, bare dokumenter som ikke finnes i
+            lagringen blir renset og splittet
 
     Returns:
         De originale dokumentene potensielt splittet i mindre dokumenter med
-        kontekst fra headers lagt til
+        kontekst fra headers lagt til (i samme rekkefølge som `docs`)
     """
-    from langchain_text_splitters import Language, RecursiveCharacterTextSplitter
-
-    text_splitter = RecursiveCharacterTextSplitter.from_language(
-        language=Language.MARKDOWN, chunk_size=chunk_size, chunk_overlap=overlap
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    options = (chunk_size, overlap, headers_to_split_on, clean)
+    if cache is None:
+        if num_workers <= 1:
+            return _DocumentSplitter(*options).split(docs)
+        return [
+            chunk
+            for chunks in _split_each(docs, options, num_workers, batch_size)
+            for chunk in chunks
+        ]
+
+    docs = list(docs)
+    config = (CLEANING_VERSION if clean else None, *options[:3])
+    keys = [cache.key(doc.page_content, config) for doc in docs]
+    results = [cache.get(key, doc.metadata) for key, doc in zip(keys, docs)]
+    missing = [i for i, chunks in enumerate(results) if chunks is None]
+    split_missing = _split_each(
+        (docs[i] for i in missing), options, num_workers, batch_size
     )
+    for i, chunks in zip(missing, split_missing):
+        cache.set(keys[i], chunks)
+        results[i] = chunks
+    return [chunk for chunks in results if chunks is not None for chunk in chunks]
+
+
+@dataclass
+class ChunkStats:
+    """Oppsummering av oppsplittede dokumenter."""
+
+    count: int
+    """Antall dokumenter"""
+
+    mean_length: float
+    """Gjennomsnittlig antall tegn"""
+
+    min_length: int
+    """Minste antall tegn"""
+
+    median_length: float
+    """Median antall tegn"""
+
+    p95_length: float
+    """95-persentil for antall tegn"""
+
+    max_length: int
+    """Største antall tegn"""
+
+    @classmethod
+    def from_documents(cls, docs: Iterable[Document]) -> "ChunkStats":
+        """Beregn statistikk for `docs`."""
+        lengths = sorted(len(doc.page_content) for doc in docs)
+        if not lengths:
+            return cls(0, 0.0, 0, 0.0, 0.0, 0)
+        return cls(
+            count=len(lengths),
+            mean_length=statistics.fmean(lengths),
+            min_length=lengths[0],
+            median_length=statistics.median(lengths),
+            p95_length=(
+                statistics.quantiles(lengths, n=20)[-1]
+                if len(lengths) > 1
+                else lengths[0]
+            ),
+            max_length=lengths[-1],
+        )
 
-    # Først splitt dokumentene basert på markdown headers
-    header_split_docs = _split_documents_on_headers(docs, headers_to_split_on)
 
-    # Deretter splitt basert på antall tegn
-    recursive_split_docs = text_splitter.transform_documents(header_split_docs)
+@dataclass
+class SweepResult:
+    """Resultat av splitting med én konfigurasjon i `sweep_split_documents`."""
+
+    chunk_size: int
+    """Maksimal størrelse på dokumentene"""
+
+    overlap: int
+    """Overlapp mellom dokumentene"""
+
+    chunks: list[Document]
+    """Oppsplittede dokumenter, samme som fra `split_documents`"""
 
-    # Legg til markdown headers som metadata i de splittede dokumentene
-    split_docs_with_context = _combine_headers_and_content(recursive_split_docs)
+    stats: ChunkStats
+    """Statistikk for `chunks`"""
 
-    return split_docs_with_context
+    @property
+    def name(self) -> str:
+        """Navn på konfigurasjonen, unikt for hver kombinasjon i en sweep."""
+        return f"chunk_size_{self.chunk_size}_overlap_{self.overlap}"
+
+
+def sweep_split_documents(
+    docs: Iterable[Document],
+    configs: Iterable[Tuple[int, int]],
+    headers_to_split_on: Union[list[Tuple[str, str]], None] = None,
+    clean: bool = False,
+) -> dict[Tuple[int, int], SweepResult]:
+    """Splitt dokumenter med flere konfigurasjoner samtidig.
+
+    Rensing og splitting på markdown headers avhenger ikke av `chunk_size`
+    og gjøres derfor bare én gang, mens splitting basert på antall tegn gjøres
+    for hver konfigurasjon. Resultatet for hver konfigurasjon er det samme som
+    `split_documents` gir.
+
+    Eksempel:
+        ```python
+        results = sweep_split_documents(load(), [(1500, 100), (4000, 200)])
+        for result in results.values():
+            print(result.name, result.stats)
+        ```
+
+    Args:
+        docs:
+            Dokumentene som skal splittes
+        configs:
+            Par med `chunk_size` og `overlap` (se `split_documents`)
+        headers_to_split_on:
+            Hvilke overskriftsnivå som skal splittes på.
+            (Default er #, ## og ###)
+        clean:
+            Rens dokumentene (se `clean_documents`) før de splittes
+
+    Returns:
+        Resultat for hver konfigurasjon med `(chunk_size, overlap)` som nøkkel
+    """
+    from langchain_text_splitters import Language, RecursiveCharacterTextSplitter
+
+    if clean:
+        docs = iter_clean_documents(docs)
+    header_split_docs = _split_documents_on_headers(docs, headers_to_split_on)
+    results: dict[Tuple[int, int], SweepResult] = {}
+    for chunk_size, overlap in configs:
+        if (chunk_size, overlap) in results:
+            continue
+        text_splitter = RecursiveCharacterTextSplitter.from_language(
+            language=Language.MARKDOWN, chunk_size=chunk_size, chunk_overlap=overlap
+        )
+        chunks = _combine_headers_and_content(
+            text_splitter.transform_documents(header_split_docs)
+        )
+        results[(chunk_size, overlap)] = SweepResult(
+            chunk_size=chunk_size,
+            overlap=overlap,
+            chunks=chunks,
+            stats=ChunkStats.from_documents(chunks),
+        )
+    return results
@@ -0,0 +1,231 @@
+"""Strømmende profilering av tekstlengder i kunnskapsbasen.
+
+I stedet for å holde hele kunnskapsbasen i minnet (f.eks. i en pandas
+DataFrame) bygger vi histogram med logaritmiske bøtter for lengdene.
+Histogrammene kan slås sammen og gir omtrentlige kvantiler med en relativ feil
+på maksimalt `LengthSketch.relative_accuracy`.
+
+Eksempel:
+    ```python
+    from nks_kbs_analyse.knowledgebase import load
+    from nks_kbs_analyse.profiling import profile_corpus
+
+    profile = profile_corpus(load(), chunk_size=1500, overlap=100)
+    print(profile.to_dict()["article"]["Alle"]["Alle"]["quantiles"])
+    ```
+"""
+
+import math
+from collections import defaultdict
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Iterable
+
+from langchain_core.documents import Document
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+"""Kvantiler som rapporteres"""
+
+ALL = "Alle"
+"""Gruppe som inneholder alle verdier"""
+
+
+class LengthSketch:
+    """Histogram med logaritmiske bøtter som kan slås sammen.
+
+    En lengde `x > 0` havner i bøtte `ceil(log(x) / log(gamma))` der
+    `gamma = (1 + a) / (1 - a)` og `a` er ønsket relativ nøyaktighet. Antall
+    bøtter vokser dermed bare logaritmisk med største lengde.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        """Lag et tomt histogram med gitt relativ nøyaktighet for kvantiler."""
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets: dict[int, int] = defaultdict(int)
+        self.zeros = 0
+        self.count = 0
+        self.total = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, length: int) -> None:
+        """Legg til en lengde."""
+        self.count += 1
+        self.total += length
+        self.min = min(self.min, length)
+        self.max = max(self.max, length)
+        if length <= 0:
+            self.zeros += 1
+        else:
+            self.buckets[math.ceil(math.log(length) / self._log_gamma)] += 1
+
+    def merge(self, other: "LengthSketch") -> None:
+        """Slå sammen med et annet histogram med samme nøyaktighet."""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Kan bare slå sammen histogram med lik nøyaktighet")
+        for index, count in other.buckets.items():
+            self.buckets[index] += count
+        self.zeros += other.zeros
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def _value(self, index: int) -> float:
+        """Representativ verdi for bøtte `index`."""
+        return 2 * self._gamma**index / (self._gamma + 1)
+
+    def quantile(self, q: float) -> float:
+        """Omtrentlig kvantil `q` (mellom 0 og 1)."""
+        if self.count == 0:
+            return math.nan
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return min(max(self._value(index), self.min), self.max)
+        return float(self.max)
+
+    @property
+    def mean(self) -> float:
+        """Gjennomsnittlig lengde."""
+        return self.total / self.count if self.count else math.nan
+
+    def histogram(self) -> list[tuple[float, int]]:
+        """Histogram som par av (øvre grense, antall) i stigende rekkefølge."""
+        result = [(0.0, self.zeros)] if self.zeros else []
+        result.extend(
+            (self._gamma**index, self.buckets[index]) for index in sorted(self.buckets)
+        )
+        return result
+
+    def ecdf(self) -> list[tuple[float, float]]:
+        """Kumulativ fordeling som par av (øvre grense, andel) per bøtte."""
+        result = []
+        seen = 0
+        for upper, count in self.histogram():
+            seen += count
+            result.append((upper, seen / self.count))
+        return result
+
+    def to_dict(self) -> dict[str, Any]:
+        """Oppsummering som kan serialiseres til JSON."""
+        return {
+            "count": self.count,
+            "mean": self.mean if self.count else None,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "quantiles": {str(q): self.quantile(q) for q in QUANTILES}
+            if self.count
+            else {},
+            "histogram": [
+                [round(upper, 2), count] for upper, count in self.histogram()
+            ],
+        }
+
+
+@dataclass
+class CorpusProfile:
+    """Histogram for lengder gruppert etter nivå og metadata.
+
+    `sketches[nivå][gruppering][verdi]` der nivå er `section` (en
+    innholdskolonne i en artikkel), `article` (summen av alle seksjonene i en
+    artikkel) eller `chunk` (etter `knowledgebase.split_documents`).
+    """
+
+    relative_accuracy: float = 0.01
+    """Relativ nøyaktighet for kvantiler"""
+
+    sketches: dict[str, dict[str, dict[str, LengthSketch]]] = field(
+        default_factory=dict
+    )
+    """Histogram per nivå, gruppering og verdi"""
+
+    def sketch(self, level: str, group: str, value: str) -> LengthSketch:
+        """Hent (eller lag) histogram for et nivå, en gruppering og en verdi."""
+        groups = self.sketches.setdefault(level, {}).setdefault(group, {})
+        if value not in groups:
+            groups[value] = LengthSketch(self.relative_accuracy)
+        return groups[value]
+
+    def add(self, level: str, length: int, metadata: dict[str, Any]) -> None:
+        """Legg til en lengde i alle grupperinger for `level`."""
+        self.sketch(level, ALL, ALL).add(length)
+        for group in ("ContentColumn", "ArticleType"):
+            if metadata.get(group) is not None:
+                self.sketch(level, group, str(metadata[group])).add(length)
+
+    def merge(self, other: "CorpusProfile") -> None:
+        """Slå sammen med en annen profil."""
+        for level, groups in other.sketches.items():
+            for group, values in groups.items():
+                for value, sketch in values.items():
+                    self.sketch(level, group, value).merge(sketch)
+
+    def to_dict(self) -> dict[str, Any]:
+        """Profilen som kan serialiseres til JSON."""
+        return {
+            level: {
+                group: {value: sketch.to_dict() for value, sketch in values.items()}
+                for group, values in groups.items()
+            }
+            for level, groups in self.sketches.items()
+        }
+
+
+def profile_corpus(
+    docs: Iterable[Document],
+    chunk_size: int | None = 1500,
+    overlap: int = 100,
+    clean: bool = False,
+    batch_size: int = 100,
+    relative_accuracy: float = 0.01,
+) -> CorpusProfile:
+    """Profiler lengder i kunnskapsbasen i én gjennomgang.
+
+    Bare lengden på hver artikkel (og artikkeltypen) holdes i minnet frem til
+    alle dokumentene er lest, innholdet slippes etter hver batch.
+
+    Args:
+        docs:
+            Dokumenter fra f.eks. `knowledgebase.load`
+        chunk_size:
+            `chunk_size` for `knowledgebase.split_documents`, hvis `None`
+            profileres ikke lengder etter splitting
+        overlap:
+            Overlapp for `knowledgebase.split_documents`
+        clean:
+            Rens dokumentene før splitting
+        batch_size:
+            Antall dokumenter som splittes om gangen
+        relative_accuracy:
+            Relativ nøyaktighet for kvantiler
+    """
+    from .knowledgebase import split_documents
+
+    profile = CorpusProfile(relative_accuracy=relative_accuracy)
+    articles: dict[str, list[Any]] = {}
+    iterator = iter(docs)
+    while batch := list(islice(iterator, batch_size)):
+        for doc in batch:
+            length = len(doc.page_content)
+            profile.add("section", length, doc.metadata)
+            article_id = doc.metadata.get("KnowledgeArticleId")
+            if article_id is not None:
+                article = articles.setdefault(
+                    article_id, [0, doc.metadata.get("ArticleType")]
+                )
+                article[0] += length
+        if chunk_size is not None:
+            for chunk in split_documents(
+                batch, chunk_size=chunk_size, overlap=overlap, clean=clean
+            ):
+                profile.add("chunk", len(chunk.page_content), chunk.metadata)
+    for length, article_type in articles.values():
+        profile.add("article", length, {"ArticleType": article_type})
+    return profile
@@ -0,0 +1,371 @@
+"""Bygg indeksen på nytt uten nedetid (blå/grønn).
+
+En ny versjon av indeksen bygges under et eget navn (f.eks.
+`chunk-size-1500-v20241017T1200`) mens den gamle fortsatt brukes. Når den nye
+er lastet opp og har bestått et sett med valideringsspørringer flyttes
+pekeren i `IndexPointer` slik at `azure_search.create_store` leser fra den nye
+versjonen. Forrige versjon beholdes slik at man kan gå tilbake med
+`rollback`. Gamle versjoner slettes bare når pekeren ligger på et delt område
+(`settings.index_pointer`), og bare versjoner som er laget her.
+
+Versjonen av `azure-search-documents` vi benytter har ikke støtte for alias i
+Azure AI Search, pekeren lagres derfor i en JSON fil (se
+`settings.index_pointer`).
+
+Eksempel:
+    ```python
+    from nks_kbs_analyse.knowledgebase import clean_documents, load, split_documents
+    from nks_kbs_analyse.rebuild import load_validation_queries, rebuild_index
+
+    chunks = split_documents(clean_documents(load()), chunk_size=1500)
+    result = rebuild_index(chunks, validation=load_validation_queries("sjekk.jsonl"))
+    print(result.active, result.validation.hit_rate)
+    ```
+"""
+
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterable, Sequence, cast
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from .settings import get_settings
+
+if TYPE_CHECKING:
+    from langchain_core.vectorstores import VectorStore
+
+_INVALID_NAME_CHARS = re.compile(r"[^a-z0-9-]+")
+"""Tegn som ikke er lov i navn på indekser i Azure AI Search"""
+
+
+def versioned_index_name(base: str, now: datetime | None = None) -> str:
+    """Lag navn på en ny versjon av indeksen `base`.
+
+    Navnet består bare av små bokstaver, tall og bindestrek slik Azure AI
+    Search krever.
+    """
+    now = now or datetime.now()
+    return f"{_normalized_name(base)}-v{now:%Y%m%dt%H%M%S}"
+
+
+def is_versioned_index_name(base: str, name: str) -> bool:
+    """Om `name` er en versjon av `base` laget med `versioned_index_name`."""
+    pattern = rf"{re.escape(_normalized_name(base))}-v\d{{8}}t\d{{6}}"
+    return re.fullmatch(pattern, name) is not None
+
+
+def _normalized_name(base: str) -> str:
+    return _INVALID_NAME_CHARS.sub("-", base.lower()).strip("-")
+
+
+class IndexPointer:
+    """Peker til aktiv versjon av hver indeks, lagret som JSON.
+
+    Filen har formen `{"<indeks>": {"active": ..., "previous": [...],
+    "rolled_back": [...]}}` der `previous` er tidligere aktive versjoner med
+    den sist brukte først og `rolled_back` er versjoner man har gått tilbake
+    fra. Før første ombygging er `<indeks>` selv aktiv versjon.
+
+    Pekeren regnes som delt (`shared`) hvis filen er oppgitt eksplisitt,
+    enten som `path` eller i `settings.index_pointer`. En peker i `cache_dir`
+    er lokal, og andre kan da lese fra versjoner den ikke kjenner til.
+    """
+
+    def __init__(self, path: str | os.PathLike[str] | None = None):
+        """Bruk pekerfilen `path`, standard er `settings.index_pointer`."""
+        self.shared = True
+        if path is None:
+            settings = get_settings()
+            path = settings.index_pointer
+            if path is None:
+                path = settings.cache_dir / "indekser.json"
+                self.shared = False
+        self.path = Path(path)
+
+    def _read(self) -> dict[str, dict[str, Any]]:
+        if not self.path.exists():
+            return {}
+        return cast(
+            dict[str, dict[str, Any]],
+            json.loads(self.path.read_text(encoding="utf-8")),
+        )
+
+    def _write(self, state: dict[str, dict[str, Any]]) -> None:
+        """Skriv pekerne slik at en avbrutt skriving ikke ødelegger filen."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state, indent=2), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def active(self, base: str) -> str | None:
+        """Aktiv versjon av `base`, `None` hvis den ikke er bygget på nytt."""
+        return self._read().get(base, {}).get("active")
+
+    def previous(self, base: str) -> list[str]:
+        """Tidligere aktive versjoner av `base`, sist brukte først."""
+        return list(self._read().get(base, {}).get("previous", []))
+
+    def rolled_back(self, base: str) -> list[str]:
+        """Versjoner av `base` man har gått tilbake fra, nyeste først."""
+        return list(self._read().get(base, {}).get("rolled_back", []))
+
+    def switch(self, base: str, name: str) -> str:
+        """Gjør `name` til aktiv versjon av `base`.
+
+        `name` kan også være en versjon man har gått tilbake fra.
+
+        Returns:
+            Versjonen som var aktiv før
+        """
+        state = self._read()
+        entry = state.setdefault(base, {})
+        old: str = entry.get("active") or base
+        previous = [n for n in entry.get("previous", []) if n not in (old, name)]
+        entry["previous"] = previous if old == name else [old, *previous]
+        entry["rolled_back"] = [n for n in entry.get("rolled_back", []) if n != name]
+        entry["active"] = name
+        entry["switched"] = datetime.now().isoformat()
+        self._write(state)
+        return old
+
+    def rollback(self, base: str) -> str:
+        """Gjør forrige versjon av `base` aktiv igjen.
+
+        Versjonen man går tilbake fra legges i `rolled_back`.
+
+        Returns:
+            Versjonen som nå er aktiv
+        """
+        state = self._read()
+        entry = state.get(base, {})
+        if not entry.get("previous"):
+            raise ValueError(f"Ingen tidligere versjon av '{base}' å gå tilbake til")
+        name: str = entry["previous"].pop(0)
+        left = entry.get("active") or base
+        entry["rolled_back"] = [left] + [
+            n for n in entry.get("rolled_back", []) if n != left
+        ]
+        entry["active"] = name
+        entry["switched"] = datetime.now().isoformat()
+        self._write(state)
+        return name
+
+    def forget(self, base: str, names: Iterable[str]) -> None:
+        """Fjern `names` fra tidligere versjoner av `base`."""
+        state = self._read()
+        if base in state:
+            removed = set(names)
+            for key in ("previous", "rolled_back"):
+                state[base][key] = [
+                    n for n in state[base].get(key, []) if n not in removed
+                ]
+            self._write(state)
+
+
+@dataclass
+class ValidationQuery:
+    """Spørring som en ny indeks må svare på før den tas i bruk."""
+
+    query: str
+    """Spørsmålet"""
+
+    expected: list[str] = field(default_factory=list)
+    """`KnowledgeArticleId` der minst én bør være blant treffene"""
+
+
+@dataclass
+class ValidationReport:
+    """Resultat av valideringsspørringer mot en indeks."""
+
+    documents: int
+    """Antall dokumenter i indeksen"""
+
+    queries: int = 0
+    """Antall spørringer som ble kjørt"""
+
+    empty: list[str] = field(default_factory=list)
+    """Spørringer som ikke ga noen treff"""
+
+    checked: int = 0
+    """Antall spørringer med forventede artikler som ga treff"""
+
+    misses: list[str] = field(default_factory=list)
+    """Spørringer med forventede artikler der ingen var blant treffene"""
+
+    @property
+    def hit_rate(self) -> float:
+        """Andel spørringer med forventede artikler som fant minst én av dem."""
+        return 1.0 if self.checked == 0 else 1 - len(self.misses) / self.checked
+
+
+def load_validation_queries(path: str | os.PathLike[str]) -> list[ValidationQuery]:
+    """Les valideringsspørringer fra JSONL.
+
+    Hver linje har `query` og eventuelt `expected` (liste med
+    `KnowledgeArticleId`).
+    """
+    with Path(path).open(encoding="utf-8") as fp:
+        return [
+            ValidationQuery(row["query"], list(row.get("expected", [])))
+            for row in map(json.loads, fp)
+        ]
+
+
+def validate_store(
+    store: "VectorStore",
+    queries: Sequence[ValidationQuery],
+    documents: int,
+    k: int = 10,
+) -> ValidationReport:
+    """Kjør `queries` mot `store` og sjekk treffene.
+
+    Args:
+        store:
+            Indeksen som valideres
+        queries:
+            Valideringsspørringer
+        documents:
+            Antall dokumenter i indeksen
+        k:
+            Antall treff per spørring
+    """
+    report = ValidationReport(documents=documents, queries=len(queries))
+    for item in queries:
+        docs = store.similarity_search(item.query, k=k)
+        if not docs:
+            report.empty.append(item.query)
+        elif item.expected:
+            report.checked += 1
+            found = {doc.metadata.get("KnowledgeArticleId") for doc in docs}
+            if found.isdisjoint(item.expected):
+                report.misses.append(item.query)
+    return report
+
+
+@dataclass
+class RebuildResult:
+    """Oppsummering av en ny versjon av indeksen."""
+
+    name: str
+    """Navnet på den nye versjonen"""
+
+    validation: ValidationReport
+    """Resultat av validering av den nye versjonen"""
+
+    switched: bool
+    """Om den nye versjonen ble tatt i bruk"""
+
+    active: str | None
+    """Versjonen som er aktiv etter ombyggingen"""
+
+    deleted: list[str] = field(default_factory=list)
+    """Gamle versjoner som ble slettet"""
+
+
+def rebuild_index(
+    chunks: Iterable[Document],
+    base: str | None = None,
+    validation: Sequence[ValidationQuery] = (),
+    min_hit_rate: float = 0.9,
+    min_documents: float = 0.9,
+    keep: int = 1,
+    pointer: IndexPointer | None = None,
+    embedding: Embeddings | None = None,
+    **upload_options: Any,
+) -> RebuildResult:
+    """Bygg en ny versjon av indeksen og ta den i bruk hvis den er god nok.
+
+    Den nye versjonen får samme felter som `azure_search.create_store` lager.
+    Aktiv versjon er urørt til den nye er lastet opp og validert, en avbrutt
+    eller underkjent ombygging påvirker derfor ikke de som leser fra indeksen.
+
+    Args:
+        chunks:
+            Oppsplittede dokumenter som skal lastes opp
+        base:
+            Navn på indeksen, standard er `settings.azure_ai.search_index`
+        validation:
+            Spørringer som må gi treff i den nye versjonen
+        min_hit_rate:
+            Minste andel spørringer med forventede artikler som må finne minst
+            én av dem
+        min_documents:
+            Minste antall dokumenter i ny versjon relativt til aktiv versjon
+        keep:
+            Antall tidligere versjoner som beholdes for å kunne gå tilbake,
+            versjoner man har gått tilbake fra slettes alltid. Bare versjoner
+            laget med `versioned_index_name` slettes, aldri `base` selv
+        pointer:
+            Pekere til aktive versjoner, ingenting slettes hvis pekeren ikke
+            er delt (se `IndexPointer`)
+        embedding:
+            Embedding modell, se `azure_search.create_store`
+        upload_options:
+            Sendes videre til `upload.BulkUploader`
+
+    Returns:
+        Oppsummering, `switched` er `False` hvis valideringen feilet (den nye
+        versjonen beholdes da slik at den kan undersøkes)
+    """
+    from azure.core.exceptions import ResourceNotFoundError
+
+    from .azure_search import create_store, index_admin_client
+    from .upload import BulkUploader
+
+    base = base or get_settings().azure_ai.search_index
+    pointer = pointer or IndexPointer()
+    name = versioned_index_name(base)
+    store: Any = create_store(embedding, index_name=name)
+    result = BulkUploader(store, embedding, **upload_options).upload(chunks)
+    if not result.succeeded:
+        raise RuntimeError(
+            f"Klarte ikke å laste opp {len(result.failed)} dokumenter til '{name}'"
+        )
+
+    index_client = index_admin_client()
+    active = pointer.active(base) or base
+    try:
+        active_documents = index_client.get_index_statistics(active)["document_count"]
+    except ResourceNotFoundError:
+        # Første ombygging av en indeks som ikke finnes
+        active_documents = 0
+    report = validate_store(
+        store, validation, documents=store.client.get_document_count()
+    )
+    if (
+        report.empty
+        or report.hit_rate < min_hit_rate
+        or report.documents < min_documents * active_documents
+    ):
+        return RebuildResult(name, report, switched=False, active=pointer.active(base))
+
+    pointer.switch(base, name)
+    deleted = []
+    # Med en lokal peker kan andre fortsatt lese fra gamle versjoner
+    obsolete = pointer.previous(base)[keep:] + pointer.rolled_back(base)
+    for old in obsolete if pointer.shared else []:
+        if not is_versioned_index_name(base, old):
+            # `base` og indekser laget på andre måter slettes aldri
+            continue
+        try:
+            index_client.delete_index(old)
+        except ResourceNotFoundError:
+            pass
+        deleted.append(old)
+    pointer.forget(base, deleted)
+    return RebuildResult(name, report, switched=True, active=name, deleted=deleted)
+
+
+def rollback(base: str | None = None, pointer: IndexPointer | None = None) -> str:
+    """Gå tilbake til forrige versjon av indeksen.
+
+    Returns:
+        Versjonen som nå er aktiv
+    """
+    base = base or get_settings().azure_ai.search_index
+    return (pointer or IndexPointer()).rollback(base)
@@ -1,12 +1,15 @@
 """LangChain integrasjon til NKS-VDB."""
 
-from typing import Any, ClassVar
+import asyncio
+from typing import Any
 
 import httpx
 from langchain_core.documents import Document
 from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
 
 from .auth import BrowserSessionAuthentication
+from .cache import RetrieverCache
 
 
 def _convert_response_docs(response: list[dict[str, Any]]) -> list[Document]:
@@ -37,24 +40,129 @@ class NKSRetriever(BaseRetriever):
     auth: BrowserSessionAuthentication
     """Objekt for å hente autentisering"""
 
-    conn: ClassVar[httpx.Client] = httpx.Client(
-        base_url="https://nks-vdb.ansatt.dev.nav.no"
+    base_url: str = "https://nks-vdb.ansatt.dev.nav.no"
+    """Adressen til NKS-VDB"""
+
+    max_connections: int = 100
+    """Maksimalt antall samtidige tilkoblinger til NKS-VDB"""
+
+    max_keepalive_connections: int = 20
+    """Antall tilkoblinger som holdes åpne mellom kall"""
+
+    keepalive_expiry: float = 30.0
+    """Sekunder en ubrukt tilkobling holdes åpen"""
+
+    cache: RetrieverCache | None = None
+    """Mellomlagring av søkeresultater, `None` for å alltid spørre NKS-VDB"""
+
+    _conn: httpx.Client | None = PrivateAttr(default=None)
+    _aconns: dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = PrivateAttr(
+        default_factory=dict
     )
 
-    def _get_relevant_documents(self, query: str, **kwargs: Any) -> list[Document]:
-        """Hent dokumenter fra NKS VDB."""
-        self.conn.cookies = self.auth.get_cookie()
-        # Bygg spørring til NKS-VDB
-        params = {
+    @property
+    def limits(self) -> httpx.Limits:
+        """Grenser for tilkoblinger til NKS-VDB."""
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    @property
+    def conn(self) -> httpx.Client:
+        """HTTP klient mot NKS-VDB (opprettes ved første bruk)."""
+        if self._conn is None:
+            self._conn = httpx.Client(base_url=self.base_url, limits=self.limits)
+        return self._conn
+
+    @property
+    def aconn(self) -> httpx.AsyncClient:
+        """Asynkron HTTP klient mot NKS-VDB for event loop som kjører.
+
+        En `httpx.AsyncClient` kan bare brukes fra event loop den ble laget i,
+        det lages derfor én klient per event loop som deles av alle kall.
+        """
+        loop = asyncio.get_running_loop()
+        client = self._aconns.get(loop)
+        if client is None or client.is_closed:
+            # Glem klienter for event loops som er avsluttet (f.eks. etter
+            # 'asyncio.run')
+            for old in [old for old in self._aconns if old.is_closed()]:
+                del self._aconns[old]
+            client = httpx.AsyncClient(base_url=self.base_url, limits=self.limits)
+            self._aconns[loop] = client
+        return client
+
+    async def aclose(self) -> None:
+        """Lukk asynkron HTTP klient for event loop som kjører."""
+        client = self._aconns.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def _params(self, query: str, kwargs: dict[str, Any]) -> dict[str, str]:
+        """Bygg spørring til NKS-VDB."""
+        return {
             "query": query,
             "num_results": str(kwargs.get("k", self.k)),
             "fts_weight": str(kwargs.get("fts_weight", 1.0)),
             "semantic_weight": str(kwargs.get("semantic_weight", 1.0)),
         }
+
+    def _cached(self, params: dict[str, str]) -> list[Document] | None:
+        """Hent lagret resultat for søket fra `cache`."""
+        if self.cache is None:
+            return None
+        return self.cache.get(self.cache.key(self.base_url, params))
+
+    def _remember(self, params: dict[str, str], docs: list[Document]) -> None:
+        """Lagre resultatet av søket i `cache`."""
+        if self.cache is not None:
+            self.cache.set(self.cache.key(self.base_url, params), self.base_url, docs)
+
+    async def _acached(self, params: dict[str, str]) -> list[Document] | None:
+        """Som `_cached`, men slår opp på disk i en egen tråd."""
+        if self.cache is None or self.cache.disk is None:
+            return self._cached(params)
+        return await asyncio.to_thread(self._cached, params)
+
+    async def _aremember(self, params: dict[str, str], docs: list[Document]) -> None:
+        """Som `_remember`, men lagrer på disk i en egen tråd."""
+        if self.cache is None or self.cache.disk is None:
+            self._remember(params, docs)
+        else:
+            await asyncio.to_thread(self._remember, params, docs)
+
+    def _get_relevant_documents(self, query: str, **kwargs: Any) -> list[Document]:
+        """Hent dokumenter fra NKS VDB."""
+        params = self._params(query, kwargs)
+        if (docs := self._cached(params)) is not None:
+            return docs
+        self.conn.cookies = self.auth.get_cookie()
         # Kjør spørring
         response = self.conn.get(
             url="/api/v1/search",
             params=params,
             timeout=kwargs.get("timeout", 20.0),
         ).raise_for_status()
-        return _convert_response_docs(response.json())
+        docs = _convert_response_docs(response.json())
+        self._remember(params, docs)
+        return docs
+
+    async def _aget_relevant_documents(
+        self, query: str, **kwargs: Any
+    ) -> list[Document]:
+        """Hent dokumenter fra NKS VDB uten å blokkere event loop."""
+        params = self._params(query, kwargs)
+        if (docs := await self._acached(params)) is not None:
+            return docs
+        conn = self.aconn
+        conn.cookies = await self.auth.aget_cookie()
+        response = await conn.get(
+            url="/api/v1/search",
+            params=params,
+            timeout=kwargs.get("timeout", 20.0),
+        )
+        docs = _convert_response_docs(response.raise_for_status().json())
+        await self._aremember(params, docs)
+        return docs
@@ -4,6 +4,10 @@ Noen innstillinger er ment å settes med miljøvariabler. For eksempel kan man
 benytte '.env' filer
 """
 
+from functools import cache
+from pathlib import Path
+from typing import Any
+
 from pydantic import AliasChoices, AnyHttpUrl, BaseModel, Field, SecretStr
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -29,6 +33,9 @@ class AzureConfig(BaseModel):
     chunk_size: int = 1024
     """Antall dokumenter som kan sendes samtidig"""
 
+    max_concurrency: int = 8
+    """Maksimalt antall samtidige kall for embedding"""
+
     search_index: str = "chunk_size_1500"
     """Navn på Azure Search index"""
 
@@ -55,7 +62,8 @@ class Settings(BaseSettings):
 
     # Følgende felter kan ikke plasseres i under modeller fordi man trenger at
     # 'validation_alias' fungerer uten prefix
-    azure_api_key: SecretStr = Field(
+    azure_api_key: SecretStr | None = Field(
+        default=None,
         validation_alias=AliasChoices("azure_openai_api_key", "openai_api_key"),
     )
     """Azure OpenAI API nøkkel - brukes for autentisering mot språkmodellen"""
@@ -88,9 +96,30 @@ class Settings(BaseSettings):
     gcp: GCPConfig = GCPConfig()
     """Innstillinger for GCP."""
 
+    cache_dir: Path = Path.home() / ".cache" / "nks_kbs_analyse"
+    """Katalog for lokale kopier og mellomlagring"""
+
+    embedding_cache_size: int = 4 * 2**30
+    """Maksimal størrelse (bytes) på lagrede embeddings i `cache_dir`"""
+
+    index_pointer: Path | None = None
+    """Fil med aktiv versjon av hver indeks, standard er `indekser.json` i
+    `cache_dir` (bør ligge på et delt område hvis flere skal lese fra samme
+    indeks)"""
+
+
+@cache
+def get_settings() -> Settings:
+    """Hent innstillinger for prosjektet.
+
+    Innstillingene (og eventuelle '.env' filer) leses først når de trengs og
+    gjenbrukes deretter.
+    """
+    return Settings()
 
-# MERK: Vi ignorerer 'call-arg' for mypy ved instansiering på grunn av følgende
-# bug: https://github.com/pydantic/pydantic/issues/6713
 
-settings = Settings()
-"""Instansiering av konfigurasjon som burde benyttes for å hente innstillinger."""
+def __getattr__(name: str) -> Any:
+    """Støtt `from nks_kbs_analyse.settings import settings` som før."""
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,181 @@
+"""Lokal kopi av kunnskapsbasen lagret som Parquet.
+
+Kopien inneholder de samme radene som `knowledgebase.load_table` produserer
+og gjør det mulig å iterere over kunnskapsbasen uten nettverk. Ved oppdatering
+hentes bare rader som er endret etter det nyeste `LastModifiedBQ` tidspunktet
+vi har sett (vannmerket), i tillegg til at artikler som ikke lenger er aktive
+fjernes.
+"""
+
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator
+
+from langchain_core.documents import Document
+
+from . import knowledgebase
+from .settings import get_settings
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+
+@dataclass
+class SnapshotRefresh:
+    """Oppsummering av en oppdatering av den lokale kopien."""
+
+    fetched: int
+    """Antall rader hentet fra BigQuery"""
+
+    removed: int
+    """Antall rader fjernet fordi artikkelen ikke lenger er aktiv"""
+
+    total: int
+    """Antall rader i kopien etter oppdatering"""
+
+    watermark: datetime | None
+    """Nyeste `LastModifiedBQ` i kopien"""
+
+
+class KnowledgeBaseSnapshot:
+    """Lokal kopi av kunnskapsbasen med inkrementell oppdatering.
+
+    Eksempel:
+        ```python
+        snapshot = KnowledgeBaseSnapshot()
+        snapshot.refresh()
+        docs = list(snapshot.load())
+        ```
+    """
+
+    TABLE_FILE = "kunnskapsartikler.parquet"
+    """Filnavn for radene i kopien"""
+
+    STATE_FILE = "snapshot.json"
+    """Filnavn for tilstand (vannmerke og tidspunkt for oppdatering)"""
+
+    def __init__(self, directory: str | os.PathLike[str] | None = None):
+        """Lag en ny kopi som lagres i `directory`.
+
+        Hvis `directory` ikke er oppgitt benyttes `kunnskapsbase` under
+        `settings.cache_dir`.
+        """
+        if directory is None:
+            directory = get_settings().cache_dir / "kunnskapsbase"
+        self.directory = Path(directory)
+
+    @property
+    def table_path(self) -> Path:
+        """Sti til Parquet filen med rader."""
+        return self.directory / self.TABLE_FILE
+
+    @property
+    def state_path(self) -> Path:
+        """Sti til tilstandsfilen."""
+        return self.directory / self.STATE_FILE
+
+    def exists(self) -> bool:
+        """Finnes det en lokal kopi på disk."""
+        return self.table_path.exists() and self.state_path.exists()
+
+    @property
+    def watermark(self) -> datetime | None:
+        """Nyeste `LastModifiedBQ` i kopien, `None` hvis kopien er tom."""
+        if not self.state_path.exists():
+            return None
+        state = json.loads(self.state_path.read_text(encoding="utf-8"))
+        if state.get("watermark") is None:
+            return None
+        return datetime.fromisoformat(state["watermark"])
+
+    def read_table(self) -> "pa.Table":
+        """Les hele kopien som en Arrow tabell."""
+        import pyarrow.parquet as pq
+
+        return pq.read_table(self.table_path)
+
+    def load(self, batch_size: int = 1024) -> Iterator[Document]:
+        """Produser dokumenter fra den lokale kopien.
+
+        Dokumentene er de samme som `knowledgebase.load` produserer.
+
+        Args:
+            batch_size:
+                Antall rader som leses fra disk om gangen
+        """
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(self.table_path)
+        for batch in parquet_file.iter_batches(batch_size=batch_size):
+            yield from knowledgebase.documents_from_batch(batch)
+
+    def refresh(self, full: bool = False) -> SnapshotRefresh:
+        """Oppdater kopien fra BigQuery.
+
+        Rader for artikler som er endret etter vannmerket erstatter alle
+        eksisterende rader for de samme artiklene. Artikler som ikke finnes i
+        `knowledgebase.get_active_article_ids` fjernes.
+
+        MERK: En artikkel der alle innholdskolonner blir kortere enn
+        minstelengden vil ikke returneres fra BigQuery og beholder dermed sine
+        gamle rader frem til neste `refresh(full=True)`.
+
+        Args:
+            full:
+                Hent hele kunnskapsbasen på nytt i stedet for bare endringer
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        previous = None if full or not self.exists() else self.watermark
+        if previous is None:
+            table = knowledgebase.load_table()
+            fetched = table.num_rows
+        else:
+            changes = knowledgebase.load_table(last_modified=previous)
+            fetched = changes.num_rows
+            table = self.read_table()
+            if fetched > 0:
+                changed_ids = pc.unique(changes["KnowledgeArticleId"])
+                keep = pc.invert(pc.is_in(table["KnowledgeArticleId"], changed_ids))
+                table = pa.concat_tables(
+                    [table.filter(keep), changes.cast(table.schema)]
+                )
+        # Fjern artikler som ikke lenger er aktive
+        active_ids = pa.array(
+            sorted(knowledgebase.get_active_article_ids()),
+            type=table.schema.field("KnowledgeArticleId").type,
+        )
+        num_rows = table.num_rows
+        table = table.filter(pc.is_in(table["KnowledgeArticleId"], active_ids))
+        removed = num_rows - table.num_rows
+        watermark = pc.max(table["LastModifiedBQ"]).as_py()
+        if previous is not None and (watermark is None or previous > watermark):
+            watermark = previous
+        self._write(table, watermark)
+        return SnapshotRefresh(
+            fetched=fetched,
+            removed=removed,
+            total=table.num_rows,
+            watermark=watermark,
+        )
+
+    def _write(self, table: "pa.Table", watermark: datetime | None) -> None:
+        """Skriv kopien til disk slik at en avbrutt skriving ikke ødelegger den."""
+        import pyarrow.parquet as pq
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_table = self.table_path.with_suffix(".tmp")
+        pq.write_table(table, tmp_table)
+        os.replace(tmp_table, self.table_path)
+        state = {
+            "watermark": watermark.isoformat() if watermark else None,
+            "refreshed": datetime.now().isoformat(),
+            "rows": table.num_rows,
+        }
+        tmp_state = self.state_path.with_suffix(".tmp")
+        tmp_state.write_text(json.dumps(state, indent=2), encoding="utf-8")
+        os.replace(tmp_state, self.state_path)
@@ -0,0 +1,258 @@
+"""Parallell opplasting av oppsplittede dokumenter til Azure AI Search.
+
+`BulkUploader` embedder og laster opp dokumenter i batcher der neste batch
+embeddes mens tidligere batcher lastes opp. ID-er til dokumenter som er
+lastet opp skrives fortløpende til en sjekkpunktfil slik at en avbrutt
+opplasting fortsetter der den stoppet.
+
+Eksempel:
+    ```python
+    from nks_kbs_analyse.azure_search import create_store
+    from nks_kbs_analyse.knowledgebase import clean_documents, load, split_documents
+    from nks_kbs_analyse.upload import BulkUploader
+
+    chunks = split_documents(clean_documents(load()), chunk_size=1500)
+    uploader = BulkUploader(create_store(), checkpoint="opplasting.txt")
+    result = uploader.upload(chunks)
+    ```
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterable
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from .index_sync import assign_chunk_ids
+
+if TYPE_CHECKING:
+    from .azure_search import AzureExtended, BatchResult
+
+
+@dataclass
+class UploadProgress:
+    """Status for en pågående opplasting."""
+
+    total: int
+    """Antall dokumenter som skal lastes opp i denne kjøringen"""
+
+    uploaded: int = 0
+    """Antall dokumenter lastet opp så langt"""
+
+    failed: int = 0
+    """Antall dokumenter som ikke kunne lastes opp"""
+
+    skipped: int = 0
+    """Antall dokumenter som allerede var lastet opp (fra sjekkpunkt)"""
+
+    elapsed: float = 0.0
+    """Sekunder siden opplastingen startet"""
+
+    @property
+    def docs_per_second(self) -> float:
+        """Antall dokumenter behandlet per sekund."""
+        done = self.uploaded + self.failed
+        return done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> float | None:
+        """Omtrentlig antall sekunder som gjenstår, `None` før første batch."""
+        rate = self.docs_per_second
+        if rate == 0:
+            return None
+        return (self.total - self.uploaded - self.failed) / rate
+
+
+@dataclass
+class UploadResult:
+    """Oppsummering av en opplasting."""
+
+    progress: UploadProgress
+    """Status da opplastingen var ferdig"""
+
+    failed: dict[str, str] = field(default_factory=dict)
+    """Feilmelding for hvert dokument som ikke kunne lastes opp"""
+
+    @property
+    def succeeded(self) -> bool:
+        """Om alle dokumentene ble lastet opp."""
+        return not self.failed
+
+
+class UploadCheckpoint:
+    """Fil med ID-er til dokumenter som er lastet opp, én per linje.
+
+    ID-er legges til på slutten av filen etter hver batch slik at en avbrutt
+    skriving i verste fall gjør at siste batch lastes opp på nytt.
+    """
+
+    def __init__(self, path: str | os.PathLike[str]):
+        """Bruk sjekkpunktfilen `path` (opprettes ved første skriving)."""
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def load(self) -> set[str]:
+        """Hent ID-er som er lastet opp."""
+        if not self.path.exists():
+            return set()
+        with self.path.open(encoding="utf-8") as fp:
+            # Siste linje kan være ufullstendig hvis skrivingen ble avbrutt
+            return {line[:-1] for line in fp if line.endswith("\n")}
+
+    def add(self, ids: Iterable[str]) -> None:
+        """Marker `ids` som lastet opp."""
+        lines = "".join(f"{key}\n" for key in ids)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as fp:
+                fp.write(lines)
+                fp.flush()
+                os.fsync(fp.fileno())
+
+    def clear(self) -> None:
+        """Glem alle opplastede ID-er."""
+        self.path.unlink(missing_ok=True)
+
+
+class BulkUploader:
+    """Opplasting med flere batcher samtidig og sjekkpunkt.
+
+    Embedding skjer i én tråd (embedding modellen kan selv gjøre samtidige
+    kall, se `embeddings.ConcurrentEmbeddings`) mens opptil `max_in_flight`
+    batcher lastes opp samtidig. Nye batcher embeddes bare når det er plass i
+    køen slik at embeddings som venter på opplasting ikke fyller opp minnet.
+    """
+
+    def __init__(
+        self,
+        store: "AzureExtended",
+        embedding: Embeddings | None = None,
+        batch_size: int = 500,
+        max_in_flight: int = 4,
+        max_retries: int = 5,
+        checkpoint: str | os.PathLike[str] | UploadCheckpoint | None = None,
+        progress: Callable[[UploadProgress], None] | None = None,
+    ):
+        """Lag opplaster for `store`.
+
+        Args:
+            store:
+                Indeksen det lastes opp til
+            embedding:
+                Embedding modell, hvis ikke oppgitt brukes default for
+                prosjektet med embeddings lagret på disk og samtidige kall
+            batch_size:
+                Antall dokumenter per opplasting
+            max_in_flight:
+                Maksimalt antall batcher som lastes opp samtidig
+            max_retries:
+                Antall nye forsøk for dokumenter som feiler
+            checkpoint:
+                Sjekkpunktfil for opplastede ID-er, hvis `None` kan ikke
+                opplastingen gjenopptas
+            progress:
+                Kalles med status etter hver batch
+        """
+        if embedding is None:
+            from .embeddings import get_embedding
+
+            embedding = get_embedding(cache=True, concurrent=True)
+        if checkpoint is not None and not isinstance(checkpoint, UploadCheckpoint):
+            checkpoint = UploadCheckpoint(checkpoint)
+        self.store = store
+        self.embedding = embedding
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.checkpoint = checkpoint
+        self.progress = progress
+
+    def _upload(
+        self,
+        batch: list[tuple[str, Document]],
+        embeddings: "Future[list[list[float]]]",
+        created: str,
+    ) -> "BatchResult":
+        """Vent på embeddings for `batch` og last den opp."""
+        return self.store.upload_batch(
+            ids=[key for key, _ in batch],
+            texts=[chunk.page_content for _, chunk in batch],
+            embeddings=embeddings.result(),
+            metadatas=[
+                chunk.metadata | {"EmbeddingCreation": created} for _, chunk in batch
+            ],
+            max_retries=self.max_retries,
+        )
+
+    def upload(self, chunks: Iterable[Document]) -> UploadResult:
+        """Embed og last opp `chunks` med ID fra `index_sync.assign_chunk_ids`.
+
+        Dokumenter som står i sjekkpunktfilen hoppes over.
+
+        Returns:
+            Oppsummering med dokumenter som ikke kunne lastes opp
+        """
+        chunk_ids = assign_chunk_ids(chunks)
+        done = self.checkpoint.load() if self.checkpoint is not None else set()
+        pending = [(key, chunk) for key, chunk in chunk_ids.items() if key not in done]
+        progress = UploadProgress(
+            total=len(pending), skipped=len(chunk_ids) - len(pending)
+        )
+        result = UploadResult(progress=progress)
+        created = datetime.now().isoformat()
+        started = time.monotonic()
+        # Begrens antall batcher som venter på embedding eller opplasting
+        slots = threading.BoundedSemaphore(2 * self.max_in_flight)
+        lock = threading.Lock()
+        errors: list[BaseException] = []
+
+        def finished(future: "Future[BatchResult]") -> None:
+            slots.release()
+            if future.cancelled():
+                return
+            if (error := future.exception()) is not None:
+                errors.append(error)
+                return
+            batch = future.result()
+            uploaded = [key for key in batch.keys if key not in batch.failed]
+            if self.checkpoint is not None:
+                self.checkpoint.add(uploaded)
+            with lock:
+                progress.uploaded += len(uploaded)
+                progress.failed += len(batch.failed)
+                progress.elapsed = time.monotonic() - started
+                result.failed.update(batch.failed)
+                if self.progress is not None:
+                    self.progress(progress)
+
+        futures: list[Future[BatchResult]] = []
+        with (
+            ThreadPoolExecutor(max_workers=1) as embed_executor,
+            ThreadPoolExecutor(max_workers=self.max_in_flight) as upload_executor,
+        ):
+            iterator = iter(pending)
+            while not errors and (batch := list(islice(iterator, self.batch_size))):
+                slots.acquire()
+                embeddings = embed_executor.submit(
+                    self.embedding.embed_documents,
+                    [chunk.page_content for _, chunk in batch],
+                )
+                future = upload_executor.submit(
+                    self._upload, batch, embeddings, created
+                )
+                future.add_done_callback(finished)
+                futures.append(future)
+            if errors:
+                for future in futures:
+                    future.cancel()
+        if errors:
+            raise errors[0]
+        progress.elapsed = time.monotonic() - started
+        return result
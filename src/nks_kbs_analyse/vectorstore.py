@@ -0,0 +1,860 @@
+"""Lokal og kompakt lagring av embeddings.
+
+`ExtendedVectorStore` er felles grensesnitt for vector stores i prosjektet.
+`LocalVectorStore` holder normaliserte vektorer som `float16` eller `int8`
+(med én skala per vektor) i stedet for Python lister med flyttall, og kan
+eventuelt kutte vektorene til færre dimensjoner (Matryoshka, støttes av
+`text-embedding-3-*`). En lagret katalog består av
+
+- `vectors.npy`: vektorene (og `scales.npy` for `int8`)
+- `documents.jsonl`: ID, tekst og metadata for hver vektor
+- `store.json`: format og antall dimensjoner
+
+Ved lasting leses vektorene som et minnekart (`numpy.load(mmap_mode="r")`)
+slik at de ikke kopieres inn i minnet før de brukes.
+
+Eksempel:
+    ```python
+    from nks_kbs_analyse.embeddings import get_embedding
+    from nks_kbs_analyse.vectorstore import LocalVectorStore
+
+    store = LocalVectorStore(get_embedding(cache=True), dtype="int8", dimensions=1024)
+    store.add_documents(chunks)
+    store.save("vektorer")
+
+    store = LocalVectorStore.load("vektorer", get_embedding(cache=True))
+    store.similarity_search("Hvordan søker jeg om dagpenger?", k=5)
+    ```
+"""
+
+import json
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Hashable,
+    Iterable,
+    Literal,
+    Mapping,
+    Sequence,
+)
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+if TYPE_CHECKING:
+    import numpy as np
+
+VectorDType = Literal["float32", "float16", "int8"]
+"""Formater vektorene kan lagres i"""
+
+MetadataFilter = Mapping[str, Any]
+"""Krav til metadata, en verdi eller en liste med godkjente verdier per felt"""
+
+STORE_VERSION = 1
+"""Versjon av formatet til en lagret `LocalVectorStore`"""
+
+EXACT_FILTER_FACTOR = 4
+"""Søk eksakt når et filter gir færre enn dette ganger `k` treff i listene
+indeksen forventes å besøke"""
+
+
+class ExtendedVectorStore(VectorStore):
+    """Utvidet VectorStore som støtter ekstra funksjonalitet."""
+
+    def clear(self) -> bool:
+        """Tøm alle dokumenter fra VectorStore.
+
+        Returns:
+            Indikasjon på at databasen ble tømt
+        """
+        return False
+
+
+def _top_indices(scores: "np.ndarray", k: int) -> "np.ndarray":
+    """Indekser til (usorterte) `k` høyeste verdier i hver rad av `scores`."""
+    import numpy as np
+
+    if k >= scores.shape[1]:
+        return np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+class QuantizedVectors:
+    """Normaliserte vektorer lagret kompakt.
+
+    For `int8` lagres hver vektor som `round(x / s)` der `s = max(|x|) / 127`
+    og `s` lagres i `scales`. Cosinus likhet blir da `s * (q · round(x / s))`
+    for en normalisert spørring `q`.
+    """
+
+    def __init__(self, vectors: "np.ndarray", scales: "np.ndarray | None" = None):
+        """Lag fra allerede normaliserte (og eventuelt kvantiserte) vektorer."""
+        self.vectors = vectors
+        self.scales = scales
+
+    @classmethod
+    def encode(
+        cls,
+        embeddings: Sequence[Sequence[float]] | "np.ndarray",
+        dtype: VectorDType = "float16",
+        dimensions: int | None = None,
+    ) -> "QuantizedVectors":
+        """Normaliser og komprimer `embeddings`.
+
+        Args:
+            embeddings:
+                Vektorer som f.eks. fra `Embeddings.embed_documents`
+            dtype:
+                Format vektorene lagres i
+            dimensions:
+                Behold bare de første `dimensions` dimensjonene før
+                normalisering
+        """
+        import numpy as np
+
+        x = _normalize(embeddings, dimensions)
+        if dtype == "int8":
+            scales = np.abs(x).max(axis=1) / 127
+            scales[scales == 0] = 1
+            quantized = np.rint(x / scales[:, None]).astype(np.int8)
+            return cls(quantized, scales.astype(np.float32))
+        return cls(x.astype(dtype))
+
+    @property
+    def dtype(self) -> str:
+        """Formatet vektorene er lagret i."""
+        return str(self.vectors.dtype)
+
+    @property
+    def dimensions(self) -> int:
+        """Antall dimensjoner i vektorene."""
+        return int(self.vectors.shape[1])
+
+    @property
+    def nbytes(self) -> int:
+        """Antall bytes vektorene (og skalaene) bruker."""
+        scales = 0 if self.scales is None else self.scales.nbytes
+        return int(self.vectors.nbytes + scales)
+
+    def __len__(self) -> int:
+        """Antall vektorer."""
+        return int(self.vectors.shape[0])
+
+    def append(self, other: "QuantizedVectors") -> "QuantizedVectors":
+        """Nye vektorer med `other` lagt til på slutten."""
+        import numpy as np
+
+        if other.dtype != self.dtype or other.dimensions != self.dimensions:
+            raise ValueError("Kan bare legge sammen vektorer med samme format")
+        scales = None
+        if self.scales is not None and other.scales is not None:
+            scales = np.concatenate([self.scales, other.scales])
+        return QuantizedVectors(np.concatenate([self.vectors, other.vectors]), scales)
+
+    def select(self, rows: "np.ndarray") -> "QuantizedVectors":
+        """Nye vektorer med bare radene `rows` (indekser eller boolsk maske)."""
+        return QuantizedVectors(
+            self.vectors[rows], None if self.scales is None else self.scales[rows]
+        )
+
+    def decode(self, rows: "np.ndarray | slice" = slice(None)) -> "np.ndarray":
+        """Vektorene i `rows` som `float32`."""
+        import numpy as np
+
+        x = self.vectors[rows].astype(np.float32)
+        if self.scales is not None:
+            x *= self.scales[rows][:, None]
+        return x
+
+    def scores(self, queries: "np.ndarray", rows: "np.ndarray | slice") -> "np.ndarray":
+        """Cosinus likhet mellom normaliserte `queries` og vektorene i `rows`."""
+        import numpy as np
+
+        scores = queries @ self.vectors[rows].T.astype(np.float32)
+        if self.scales is not None:
+            scores *= self.scales[rows]
+        return scores
+
+    def top_k(
+        self,
+        queries: Sequence[Sequence[float]] | "np.ndarray",
+        k: int,
+        block_size: int = 8192,
+        rows: "np.ndarray | None" = None,
+    ) -> tuple["np.ndarray", "np.ndarray"]:
+        """Finn de `k` vektorene med høyest cosinus likhet for hver spørring.
+
+        Vektorene gjennomgås i blokker på `block_size` rader slik at bare en
+        blokk om gangen konverteres til `float32`.
+
+        Args:
+            queries:
+                En eller flere spørringer (normaliseres og kuttes her)
+            k:
+                Antall vektorer per spørring
+            block_size:
+                Antall vektorer som sammenlignes om gangen
+            rows:
+                Søk bare blant disse radene (sortert)
+
+        Returns:
+            Indekser og likhet med form `(antall spørringer, k)`, sortert med
+            høyeste likhet først
+        """
+        import numpy as np
+
+        q = _normalize(queries, self.dimensions)
+        total = len(self) if rows is None else len(rows)
+        k = min(k, total)
+        if k <= 0:
+            empty = np.empty((len(q), 0))
+            return empty.astype(np.intp), empty.astype(np.float32)
+        best_indices: list[np.ndarray] = []
+        best_scores: list[np.ndarray] = []
+        for start in range(0, total, block_size):
+            block = (
+                slice(start, start + block_size)
+                if rows is None
+                else rows[start : start + block_size]
+            )
+            scores = self.scores(q, block)
+            top = _top_indices(scores, k)
+            best_indices.append(top + start)
+            best_scores.append(np.take_along_axis(scores, top, axis=1))
+        indices, scores = _merge_top_k(
+            np.concatenate(best_indices, axis=1), np.concatenate(best_scores, axis=1), k
+        )
+        return (indices if rows is None else rows[indices]), scores
+
+
+def _merge_top_k(
+    indices: "np.ndarray", scores: "np.ndarray", k: int
+) -> tuple["np.ndarray", "np.ndarray"]:
+    """Velg og sorter de `k` beste kandidatene i hver rad."""
+    import numpy as np
+
+    top = _top_indices(scores, k)
+    indices = np.take_along_axis(indices, top, axis=1)
+    scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return (
+        np.take_along_axis(indices, order, axis=1),
+        np.take_along_axis(scores, order, axis=1),
+    )
+
+
+class IVFIndex:
+    """Omtrentlig søk med invertert fil (IVF).
+
+    Vektorene grupperes med sfærisk k-means i `len(centroids)` lister. En
+    spørring sammenlignes bare med vektorene i de `n_probe` listene med
+    nærmest sentroide. Søk etter mange spørringer samtidig går gjennom hver
+    liste én gang med én matrisemultiplikasjon for alle spørringene som
+    besøker listen.
+    """
+
+    def __init__(
+        self, centroids: "np.ndarray", lists: list["np.ndarray"], n_probe: int = 8
+    ):
+        """Lag indeks fra sentroider og radene som hører til hver liste."""
+        self.centroids = centroids
+        self.lists = lists
+        self.n_probe = n_probe
+
+    @classmethod
+    def build(
+        cls,
+        vectors: QuantizedVectors,
+        n_lists: int | None = None,
+        n_probe: int = 8,
+        iterations: int = 10,
+        sample_size: int | None = None,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """Grupper `vectors` i lister.
+
+        Args:
+            vectors:
+                Vektorene som skal indekseres
+            n_lists:
+                Antall lister, standard er kvadratroten av antall vektorer
+            n_probe:
+                Antall lister som gjennomsøkes per spørring
+            iterations:
+                Antall iterasjoner med k-means
+            sample_size:
+                Antall vektorer sentroidene trenes på, standard er 40 per liste
+            seed:
+                Frø for tilfeldig utvalg
+        """
+        import numpy as np
+
+        rng = np.random.default_rng(seed)
+        n = len(vectors)
+        if n == 0:
+            raise ValueError("Kan ikke lage indeks uten vektorer")
+        n_lists = min(n_lists or max(1, round(np.sqrt(n))), n)
+        sample = np.sort(
+            rng.choice(n, size=min(n, sample_size or 40 * n_lists), replace=False)
+        )
+        data = vectors.decode(sample)
+        centroids = data[rng.choice(len(data), size=n_lists, replace=False)]
+        for _ in range(iterations):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            order = np.argsort(labels, kind="stable")
+            counts = np.bincount(labels, minlength=n_lists)
+            filled = counts > 0
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            centroids[filled] = np.add.reduceat(data[order], starts[filled], axis=0)
+            # Tomme lister får en tilfeldig vektor som ny sentroide
+            centroids[~filled] = data[rng.choice(len(data), size=(~filled).sum())]
+            centroids = _normalize(centroids, None)
+        # Tilordne alle vektorene til nærmeste sentroide, en blokk om gangen
+        labels = np.concatenate(
+            [
+                np.argmax(vectors.decode(slice(s, s + 8192)) @ centroids.T, axis=1)
+                for s in range(0, n, 8192)
+            ]
+        )
+        order = np.argsort(labels, kind="stable")
+        bounds = np.cumsum(np.bincount(labels, minlength=n_lists))[:-1]
+        return cls(centroids, np.split(order, bounds), n_probe=n_probe)
+
+    def search(
+        self,
+        vectors: QuantizedVectors,
+        queries: Sequence[Sequence[float]] | "np.ndarray",
+        k: int,
+        mask: "np.ndarray | None" = None,
+    ) -> tuple["np.ndarray", "np.ndarray"]:
+        """Finn omtrent de `k` vektorene med høyest cosinus likhet.
+
+        Args:
+            vectors:
+                Vektorene indeksen ble laget for
+            queries:
+                En eller flere spørringer
+            k:
+                Antall vektorer per spørring
+            mask:
+                Boolsk maske over radene som kan returneres
+
+        Returns:
+            Indekser og likhet med form `(antall spørringer, k)`, sortert med
+            høyeste likhet først. Hvis det er færre enn `k` kandidater er
+            indeksen `-1` og likheten `-inf`.
+        """
+        import numpy as np
+
+        q = _normalize(queries, vectors.dimensions)
+        n_probe = min(self.n_probe, len(self.lists))
+        probes = _top_indices(q @ self.centroids.T, n_probe)
+        best_indices = np.full((len(q), n_probe * k), -1, dtype=np.intp)
+        best_scores = np.full((len(q), n_probe * k), -np.inf, dtype=np.float32)
+        # Grupper par av (spørring, rang) etter listen de besøker
+        flat = probes.ravel()
+        order = np.argsort(flat, kind="stable")
+        bounds = np.cumsum(np.bincount(flat, minlength=len(self.lists)))[:-1]
+        for list_id, pairs in enumerate(np.split(order, bounds)):
+            rows = self.lists[list_id]
+            if mask is not None:
+                rows = rows[mask[rows]]
+            if len(pairs) == 0 or len(rows) == 0:
+                continue
+            query_ids, ranks = np.divmod(pairs, n_probe)
+            scores = vectors.scores(q[query_ids], rows)
+            top = _top_indices(scores, k)
+            columns = ranks[:, None] * k + np.arange(top.shape[1])
+            best_indices[query_ids[:, None], columns] = rows[top]
+            best_scores[query_ids[:, None], columns] = np.take_along_axis(
+                scores, top, axis=1
+            )
+        return _merge_top_k(best_indices, best_scores, k)
+
+
+def _normalize(
+    vectors: Sequence[Sequence[float]] | "np.ndarray", dimensions: int | None
+) -> "np.ndarray":
+    """Kutt til `dimensions` og normaliser hver rad til lengde 1 som `float32`."""
+    import numpy as np
+
+    x = np.asarray(vectors, dtype=np.float32)
+    if x.ndim == 1:
+        x = x[None, :]
+    if dimensions is not None:
+        if dimensions > x.shape[1]:
+            raise ValueError(
+                f"Kan ikke kutte vektorer med {x.shape[1]} dimensjoner"
+                f" til {dimensions}"
+            )
+        x = x[:, :dimensions]
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    normalized: "np.ndarray" = x / norms
+    return normalized
+
+
+def _json_default(value: Any) -> Any:
+    """Konverter metadata som ikke støttes av JSON."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class LocalVectorStore(ExtendedVectorStore):
+    """Vector store i minnet (eller et minnekart) med kompakte vektorer.
+
+    Alle vektorer normaliseres slik at cosinus likhet er et skalarprodukt.
+    Likheten som returneres fra `similarity_search_with_score` er derfor
+    mellom -1 og 1 der høyere er mer likt.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        dtype: VectorDType = "float16",
+        dimensions: int | None = None,
+    ):
+        """Lag en tom vector store.
+
+        Args:
+            embedding:
+                Embedding modell for tekster og spørringer
+            dtype:
+                Format vektorene lagres i
+            dimensions:
+                Behold bare de første `dimensions` dimensjonene av hver
+                embedding
+        """
+        self.embedding = embedding
+        self.dtype: VectorDType = dtype
+        self.dimensions = dimensions
+        self.vectors: QuantizedVectors | None = None
+        self.documents: list[Document] = []
+        self.index: IVFIndex | None = None
+        self.index_options: dict[str, Any] | None = None
+        self._positions: dict[str, int] = {}
+        self._facets: dict[str, dict[Any, list[int]]] = {}
+        self.version = 0
+
+    @property
+    def embeddings(self) -> Embeddings:
+        """Embedding modellen som benyttes."""
+        return self.embedding
+
+    def __len__(self) -> int:
+        """Antall dokumenter."""
+        return len(self.documents)
+
+    def _changed(self) -> None:
+        """Fjern indekser som ikke lenger stemmer med dokumentene.
+
+        `version` økes slik at andre (f.eks. `HybridRetriever`) kan se at
+        dokumentene er endret.
+        """
+        self.index = None
+        self._facets = {}
+        self.version += 1
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: list[dict[str, Any]] | None = None,
+        *,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        """Lag embeddings for `texts` og legg dem til.
+
+        Dokumenter med en ID som finnes fra før erstattes.
+        """
+        texts = list(texts)
+        embeddings = self.embedding.embed_documents(texts) if texts else []
+        return self.add_embeddings(texts, embeddings, metadatas=metadatas, ids=ids)
+
+    def add_embeddings(
+        self,
+        texts: Sequence[str],
+        embeddings: Sequence[Sequence[float]] | "np.ndarray",
+        metadatas: Sequence[dict[str, Any]] | None = None,
+        ids: Sequence[str | None] | None = None,
+    ) -> list[str]:
+        """Legg til tekster med ferdige embeddings.
+
+        Dokumenter med en ID som finnes fra før erstattes.
+
+        Returns:
+            ID til hvert dokument
+        """
+        if not texts:
+            return []
+        if ids is None:
+            ids = [None] * len(texts)
+        if metadatas is None:
+            metadatas = [{}] * len(texts)
+        if not len(texts) == len(embeddings) == len(metadatas) == len(ids):
+            raise ValueError("Like mange tekster, embeddings, metadata og ID-er kreves")
+        # Siste forekomst av en ID vinner, også innad i samme kall
+        unique: dict[str, int] = {}
+        for i, doc_id in enumerate(ids):
+            unique[doc_id or str(uuid.uuid4())] = i
+        rows = list(unique.values())
+        new = QuantizedVectors.encode(
+            [embeddings[i] for i in rows], self.dtype, self.dimensions
+        )
+        self.delete([doc_id for doc_id in unique if doc_id in self._positions])
+        self.vectors = new if self.vectors is None else self.vectors.append(new)
+        for doc_id, i in unique.items():
+            self._positions[doc_id] = len(self.documents)
+            self.documents.append(
+                Document(id=doc_id, page_content=texts[i], metadata=dict(metadatas[i]))
+            )
+        self._changed()
+        return list(unique)
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> bool | None:
+        """Fjern dokumentene med gitte ID-er.
+
+        Returns:
+            `True` hvis noen dokumenter ble fjernet
+        """
+        import numpy as np
+
+        remove = {
+            self._positions[doc_id] for doc_id in ids or [] if doc_id in self._positions
+        }
+        if not remove or self.vectors is None:
+            return False
+        keep = np.ones(len(self.documents), dtype=bool)
+        keep[list(remove)] = False
+        self.vectors = self.vectors.select(keep)
+        self.documents = [doc for i, doc in enumerate(self.documents) if keep[i]]
+        self._positions = {doc.id: i for i, doc in enumerate(self.documents)}  # type: ignore[misc]
+        self._changed()
+        return True
+
+    def clear(self) -> bool:
+        """Fjern alle dokumenter.
+
+        Returns:
+            Alltid `True`
+        """
+        self.vectors = None
+        self.documents = []
+        self._positions = {}
+        self._changed()
+        return True
+
+    def get_by_ids(self, ids: Sequence[str], /) -> list[Document]:
+        """Hent dokumentene med gitte ID-er (som finnes)."""
+        return [
+            self.documents[self._positions[doc_id]]
+            for doc_id in ids
+            if doc_id in self._positions
+        ]
+
+    def build_index(self, **options: Any) -> IVFIndex:
+        """Lag indeks for omtrentlig søk.
+
+        Indeksen bygges automatisk på nytt ved neste søk etter at dokumenter
+        er lagt til eller fjernet. Søk med `exact=True` benytter ikke
+        indeksen.
+
+        Args:
+            options:
+                Argumenter til `IVFIndex.build`, f.eks. `n_lists` og `n_probe`
+        """
+        if self.vectors is None:
+            raise ValueError("Kan ikke lage indeks uten dokumenter")
+        self.index_options = options
+        self.index = IVFIndex.build(self.vectors, **options)
+        return self.index
+
+    def _facet(self, field: str) -> dict[Any, list[int]]:
+        """Rader per verdi av metadata feltet `field`."""
+        if field not in self._facets:
+            facet: dict[Any, list[int]] = {}
+            for i, doc in enumerate(self.documents):
+                value = doc.metadata.get(field)
+                if isinstance(value, Hashable):
+                    facet.setdefault(value, []).append(i)
+            self._facets[field] = facet
+        return self._facets[field]
+
+    def filter_rows(self, filter: MetadataFilter | None) -> "np.ndarray | None":
+        """Sorterte rader som oppfyller `filter`, `None` hvis alle gjør det."""
+        import numpy as np
+
+        if not filter:
+            return None
+        rows: set[int] | None = None
+        for field, accepted in filter.items():
+            if not isinstance(accepted, (list, tuple, set, frozenset)):
+                accepted = [accepted]
+            facet = self._facet(field)
+            matches = {i for value in accepted for i in facet.get(value, [])}
+            rows = matches if rows is None else rows & matches
+        return np.fromiter(sorted(rows or ()), dtype=np.intp)
+
+    def batch_similarity_search_with_score_by_vector(
+        self,
+        embeddings: Sequence[Sequence[float]] | "np.ndarray",
+        k: int = 4,
+        filter: MetadataFilter | None = None,
+        exact: bool = False,
+    ) -> list[list[tuple[Document, float]]]:
+        """Finn de `k` mest like dokumentene for mange spørringer samtidig.
+
+        Med indeks og et filter som bare gir få dokumenter er det ikke sikkert
+        listene som besøkes har `k` av dem. Søket gjøres da eksakt, enten for
+        alle spørringene (når filteret gir færre enn `EXACT_FILTER_FACTOR`
+        ganger `k` dokumenter i listene som besøkes) eller for spørringene som
+        fikk for få treff.
+
+        Args:
+            embeddings:
+                Embedding for hver spørring
+            k:
+                Antall dokumenter per spørring
+            filter:
+                Krav til metadata, f.eks. `{"Tab": "Regelverk", "ArticleType":
+                ["Generelt", "Lokalt"]}`. En liste godtar alle verdiene i den.
+            exact:
+                Sammenlign med alle dokumenter selv om det finnes en indeks
+
+        Returns:
+            Dokumenter med cosinus likhet for hver spørring
+        """
+        import numpy as np
+
+        if self.vectors is None or len(self.vectors) == 0 or len(embeddings) == 0:
+            return [[] for _ in range(len(embeddings))]
+        rows = self.filter_rows(filter)
+        if self.index is None and self.index_options is not None:
+            self.index = IVFIndex.build(self.vectors, **self.index_options)
+        index = None if exact else self.index
+        if (
+            index is not None
+            and rows is not None
+            and len(rows) * index.n_probe < EXACT_FILTER_FACTOR * k * len(index.lists)
+        ):
+            index = None
+        if index is None:
+            indices, scores = self.vectors.top_k(embeddings, k, rows=rows)
+            return self._results(indices, scores)
+
+        mask = None
+        if rows is not None:
+            mask = np.zeros(len(self.vectors), dtype=bool)
+            mask[rows] = True
+        indices, scores = index.search(self.vectors, embeddings, k, mask)
+        results = self._results(indices, scores)
+        expected = min(k, len(self.vectors) if rows is None else len(rows))
+        short = [i for i, docs in enumerate(results) if len(docs) < expected]
+        if short:
+            queries = np.asarray(embeddings)[short]
+            indices, scores = self.vectors.top_k(queries, k, rows=rows)
+            for i, docs in zip(short, self._results(indices, scores), strict=True):
+                results[i] = docs
+        return results
+
+    def _results(
+        self, indices: "np.ndarray", scores: "np.ndarray"
+    ) -> list[list[tuple[Document, float]]]:
+        """Dokumenter og likhet for hver spørring, uten tomme plasser (`-1`)."""
+        return [
+            [
+                (self.documents[i], float(score))
+                for i, score in zip(row_indices, row_scores, strict=True)
+                if i >= 0
+            ]
+            for row_indices, row_scores in zip(indices, scores, strict=True)
+        ]
+
+    def batch_similarity_search_with_score(
+        self,
+        queries: Sequence[str],
+        k: int = 4,
+        filter: MetadataFilter | None = None,
+        exact: bool = False,
+    ) -> list[list[tuple[Document, float]]]:
+        """Finn de `k` mest like dokumentene for hver av `queries`.
+
+        Spørringene embeddes med ett kall til `embed_documents` (som gir samme
+        vektorer som `embed_query` for OpenAI modellene). Se
+        `batch_similarity_search_with_score_by_vector` for øvrige argumenter.
+        """
+        embeddings = self.embedding.embed_documents(list(queries)) if queries else []
+        return self.batch_similarity_search_with_score_by_vector(
+            embeddings, k, filter=filter, exact=exact
+        )
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: Sequence[float],
+        k: int = 4,
+        filter: MetadataFilter | None = None,
+        exact: bool = False,
+    ) -> list[tuple[Document, float]]:
+        """Finn de `k` dokumentene med høyest cosinus likhet til `embedding`."""
+        return self.batch_similarity_search_with_score_by_vector(
+            [embedding], k, filter=filter, exact=exact
+        )[0]
+
+    def similarity_search_by_vector(
+        self,
+        embedding: list[float],
+        k: int = 4,
+        filter: MetadataFilter | None = None,
+        exact: bool = False,
+        **kwargs: Any,
+    ) -> list[Document]:
+        """Finn de `k` dokumentene som ligner mest på `embedding`."""
+        return [
+            doc
+            for doc, _ in self.similarity_search_with_score_by_vector(
+                embedding, k, filter=filter, exact=exact
+            )
+        ]
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: MetadataFilter | None = None,
+        exact: bool = False,
+        **kwargs: Any,
+    ) -> list[tuple[Document, float]]:
+        """Finn de `k` dokumentene som ligner mest på `query` med likhet."""
+        return self.similarity_search_with_score_by_vector(
+            self.embedding.embed_query(query), k, filter=filter, exact=exact
+        )
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: MetadataFilter | None = None,
+        exact: bool = False,
+        **kwargs: Any,
+    ) -> list[Document]:
+        """Finn de `k` dokumentene som ligner mest på `query`.
+
+        Args:
+            query:
+                Teksten det søkes etter
+            k:
+                Antall dokumenter
+            filter:
+                Krav til metadata, f.eks. `{"Tab": "Regelverk"}`
+            exact:
+                Sammenlign med alle dokumenter selv om det finnes en indeks
+            kwargs:
+                Ignoreres
+        """
+        return [
+            doc
+            for doc, _ in self.similarity_search_with_score(
+                query, k, filter=filter, exact=exact
+            )
+        ]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        """Skaler cosinus likhet til mellom 0 og 1."""
+        return lambda score: (score + 1) / 2
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: list[dict[str, Any]] | None = None,
+        *,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        """Lag en vector store med embeddings for `texts`.
+
+        Øvrige argumenter sendes videre til `LocalVectorStore`.
+        """
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    def save(self, path: str | os.PathLike[str]) -> None:
+        """Lagre vektorer og dokumenter i katalogen `path`."""
+        import numpy as np
+
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        vectors = self.vectors or QuantizedVectors.encode(
+            np.zeros((0, self.dimensions or 1)), self.dtype
+        )
+        np.save(path / "vectors.npy", vectors.vectors)
+        if vectors.scales is not None:
+            np.save(path / "scales.npy", vectors.scales)
+        else:
+            (path / "scales.npy").unlink(missing_ok=True)
+        with (path / "documents.jsonl").open("w", encoding="utf-8") as fp:
+            for doc in self.documents:
+                record = {
+                    "id": doc.id,
+                    "page_content": doc.page_content,
+                    "metadata": doc.metadata,
+                }
+                fp.write(json.dumps(record, ensure_ascii=False, default=_json_default))
+                fp.write("\n")
+        info = {
+            "version": STORE_VERSION,
+            "dtype": self.dtype,
+            "dimensions": self.dimensions,
+            "count": len(self.documents),
+        }
+        (path / "store.json").write_text(json.dumps(info, indent=2), encoding="utf-8")
+
+    @classmethod
+    def load(
+        cls, path: str | os.PathLike[str], embedding: Embeddings, mmap: bool = True
+    ) -> "LocalVectorStore":
+        """Last en vector store lagret med `LocalVectorStore.save`.
+
+        Args:
+            path:
+                Katalogen vector store ble lagret i
+            embedding:
+                Embedding modell for spørringer (og nye tekster)
+            mmap:
+                Les vektorene som et minnekart i stedet for å kopiere dem inn i
+                minnet
+
+        Metadata som ikke kan lagres som JSON (f.eks. `datetime`) leses tilbake
+        som tekst.
+        """
+        import numpy as np
+
+        path = Path(path)
+        info = json.loads((path / "store.json").read_text(encoding="utf-8"))
+        if info["version"] != STORE_VERSION:
+            raise ValueError(
+                f"Ukjent versjon av lagret vector store: {info['version']}"
+            )
+        store = cls(embedding, dtype=info["dtype"], dimensions=info["dimensions"])
+        mmap_mode: Literal["r"] | None = "r" if mmap else None
+        vectors = np.load(path / "vectors.npy", mmap_mode=mmap_mode)
+        scales = None
+        if (path / "scales.npy").exists():
+            scales = np.load(path / "scales.npy", mmap_mode=mmap_mode)
+        with (path / "documents.jsonl").open(encoding="utf-8") as fp:
+            store.documents = [Document(**json.loads(line)) for line in fp]
+        if len(store.documents) != len(vectors):
+            raise ValueError(f"Antall dokumenter og vektorer stemmer ikke i '{path}'")
+        if store.documents:
+            store.vectors = QuantizedVectors(vectors, scales)
+        store._positions = {doc.id: i for i, doc in enumerate(store.documents)}  # type: ignore[misc]
+        return store
@@ -0,0 +1,124 @@
+"""Felles oppsett for tester."""
+
+import math
+import random
+from typing import TYPE_CHECKING, Callable
+
+import pytest
+from langchain_core.documents import Document
+
+if TYPE_CHECKING:
+    from pytest_benchmark.fixture import BenchmarkFixture
+
+_WORDS = (
+    "arbeidsgiver arbeidsavklaringspenger bruker dagpenger dokumentasjon "
+    "enhet folketrygden foreldrepenger frist Gosys henvendelse inntekt "
+    "klage kontaktsenter lege meldekort NAV oppgave pensjon periode "
+    "rettighet saksbehandler sykepenger søknad tiltak uføretrygd utbetaling "
+    "vedtak veileder ytelse og i på for til som med av er kan skal må ikke "
+    "har det en et den når hvis eller etter før"
+).split()
+"""Ordforråd for syntetiske artikler"""
+
+_HEADERS = (
+    "Hvem gjør hva",
+    "Slik sender du oppgave",
+    "Regelverk",
+    "Saksbehandlingstid",
+    "Til bruker",
+    "Kontakt med arbeidsgiver",
+)
+"""Overskrifter som ofte går igjen i kunnskapsbasen"""
+
+OUTLIER_LENGTH = 100_000
+"""Minste lengde (antall tegn) på de største syntetiske artiklene"""
+
+
+def synthetic_article(rng: random.Random, length: int) -> str:
+    """Lag en syntetisk markdown artikkel med omtrent `length` tegn.
+
+    Artikkelen har overskrifter på flere nivå, avsnitt, punktlister og ujevn
+    bruk av whitespace slik som i kunnskapsbasen.
+    """
+    parts: list[str] = []
+    size = 0
+    while size < length:
+        header = (
+            rng.choice(_HEADERS)
+            if rng.random() < 0.3
+            else " ".join(rng.choices(_WORDS, k=rng.randint(1, 5)))
+        )
+        section = ["#" * rng.randint(1, 4), " ", header, "\n" * rng.randint(1, 3)]
+        for _ in range(rng.randint(1, 4)):
+            if rng.random() < 0.25:
+                section.extend(
+                    f"- {' '.join(rng.choices(_WORDS, k=rng.randint(3, 12)))}\n"
+                    for _ in range(rng.randint(2, 6))
+                )
+            else:
+                section.append(" ".join(rng.choices(_WORDS, k=rng.randint(10, 80))))
+                section.append(".")
+            section.append(rng.choice(["\n", "\n\n", "\n\n\n", "\n \n\n"]))
+        text = "".join(section)
+        parts.append(text)
+        size += len(text)
+    return "".join(parts)
+
+
+def synthetic_corpus(size: int, seed: int = 0) -> list[Document]:
+    """Lag `size` syntetiske artikler med lengder omtrent som i kunnskapsbasen.
+
+    Lengdene følger en log-normal fordeling (median rundt 3000 tegn), og
+    omtrent hver hundrede artikkel (minst én) er over `OUTLIER_LENGTH` tegn.
+    Samme `size` og `seed` gir alltid samme artikler.
+    """
+    rng = random.Random(seed)
+    num_outliers = max(1, size // 100)
+    docs: list[Document] = []
+    for i in range(size):
+        if i % math.ceil(size / num_outliers) == 0:
+            length = rng.randint(OUTLIER_LENGTH, 2 * OUTLIER_LENGTH)
+        else:
+            length = int(rng.lognormvariate(math.log(3000), 0.9))
+        docs.append(
+            Document(
+                page_content=synthetic_article(rng, length),
+                metadata={
+                    "KnowledgeArticleId": f"ka{i:05d}",
+                    "ContentColumn": "Article__c",
+                    "Title": f"Syntetisk artikkel {i}",
+                },
+            )
+        )
+    return docs
+
+
+@pytest.fixture(scope="session")
+def corpus() -> Callable[[int], list[Document]]:
+    """Hent syntetisk korpus med gitt størrelse (gjenbrukes mellom tester)."""
+    cache: dict[int, list[Document]] = {}
+
+    def get(size: int) -> list[Document]:
+        if size not in cache:
+            cache[size] = synthetic_corpus(size)
+        return cache[size]
+
+    return get
+
+
+@pytest.fixture
+def throughput(benchmark: "BenchmarkFixture") -> Callable[..., None]:
+    """Legg til antall per sekund i rapporten, f.eks. `throughput(docs=100)`.
+
+    Med `--benchmark-disable` kjøres testene bare én gang uten målinger, og da
+    legges ingenting til.
+    """
+
+    def record(**counts: float) -> None:
+        if not benchmark.enabled or benchmark.stats is None:
+            return
+        mean = benchmark.stats["mean"]
+        for name, count in counts.items():
+            benchmark.extra_info[f"{name}_per_second"] = count / mean
+
+    return record
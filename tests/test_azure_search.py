@@ -0,0 +1,198 @@
+"""Tester for sletting i Azure AI Search uten nettverk."""
+
+import re
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, cast
+
+import pytest
+
+pytest.importorskip("azure.search.documents")
+
+from azure.core.exceptions import HttpResponseError  # noqa: E402
+
+from nks_kbs_analyse import azure_search  # noqa: E402
+from nks_kbs_analyse.azure_search import AzureExtended, odata_filter  # noqa: E402
+from nks_kbs_analyse.index_schema import METADATA_FIELDS  # noqa: E402
+
+
+class FakeClient:
+    """`SearchClient` der enkelte dokumenter feiler et antall ganger."""
+
+    def __init__(self, ids: list[str], flaky: dict[str, int]) -> None:
+        """Lag klient med dokumentene `ids`."""
+        self.ids = set(ids)
+        self.flaky = flaky
+        self.calls: list[list[str]] = []
+        self.filters: list[str | None] = []
+
+    def delete_documents(self, documents: list[dict[str, Any]]) -> list[Any]:
+        """Slett dokumenter, svar med 503 for dokumenter som skal feile."""
+        keys = [doc["id"] for doc in documents]
+        self.calls.append(keys)
+        if self.flaky.get("*", 0) > 0:
+            self.flaky["*"] -= 1
+            error = HttpResponseError("Throttled")
+            error.status_code = 429
+            raise error
+        results = []
+        for key in keys:
+            if self.flaky.get(key, 0) > 0:
+                self.flaky[key] -= 1
+                results.append(
+                    SimpleNamespace(
+                        key=key, succeeded=False, status_code=503, error_message="Busy"
+                    )
+                )
+            elif key == "ugyldig":
+                results.append(
+                    SimpleNamespace(
+                        key=key, succeeded=False, status_code=400, error_message="Bad"
+                    )
+                )
+            else:
+                self.ids.discard(key)
+                results.append(SimpleNamespace(key=key, succeeded=True))
+        return results
+
+    def close(self) -> None:
+        """Ingen tilkobling å lukke."""
+
+    def search(
+        self,
+        search_text: str,
+        filter: str | None,
+        select: list[str],
+        order_by: list[str] | None = None,
+        top: int | None = None,
+    ) -> list[Any]:
+        """Returner dokumenter som begynner med 'a', etter ID i `id gt '...'`."""
+        self.filters.append(filter)
+        ids = sorted(key for key in self.ids if key.startswith("a"))
+        if order_by is None:
+            ids.reverse()
+        after = re.search(r"id gt '(.*)'$", filter or "")
+        if after is not None:
+            ids = [key for key in ids if key > after.group(1)]
+        return [{"id": key} for key in ids[:top]]
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Ikke vent mellom nye forsøk."""
+    monkeypatch.setattr("nks_kbs_analyse.azure_search.time.sleep", lambda _: None)
+
+
+def _new_store() -> AzureExtended:
+    store: AzureExtended = object.__new__(cast(Any, AzureExtended))
+    return store
+
+
+def _store(client: FakeClient, id_pageable: bool = True) -> AzureExtended:
+    store = _new_store()
+    store.client = cast(Any, client)
+    store.index_name = "kb"
+    store._id_pageable = id_pageable
+    return store
+
+
+def test_odata_filter() -> None:
+    """Sjekk at filter får riktig syntaks og escaping."""
+    assert odata_filter({"KnowledgeArticleId": "a'b"}) == "KnowledgeArticleId eq 'a''b'"
+    assert odata_filter({"Tab": ["x", "y"], "ContentColumn": "Article__c"}) == (
+        "(Tab eq 'x' or Tab eq 'y') and ContentColumn eq 'Article__c'"
+    )
+    since = datetime(2024, 9, 1, tzinfo=timezone.utc)
+    assert odata_filter(
+        {"DataCategories": ["Dagpenger", "Sykepenger"], "LastModifiedBQ": {"ge": since}}
+    ) == (
+        "DataCategories/any(c: c eq 'Dagpenger' or c eq 'Sykepenger') "
+        "and LastModifiedBQ ge 2024-09-01T00:00:00+00:00"
+    )
+    with pytest.raises(ValueError, match="Ugyldig sammenligning"):
+        odata_filter({"LastModifiedBQ": {"after": since}})
+
+
+def test_index_fields() -> None:
+    """Sjekk typer og flagg for metadata-feltene i indeksen."""
+    fields = {
+        name: azure_search._search_field(field)
+        for name, field in METADATA_FIELDS.items()
+    }
+    assert fields["LastModifiedBQ"].type == "Edm.DateTimeOffset"
+    assert fields["LastModifiedBQ"].sortable
+    assert fields["DataCategories"].type == "Collection(Edm.String)"
+    assert fields["DataCategories"].facetable
+    assert fields["Title"].searchable
+
+
+def test_delete_by_ids_retries() -> None:
+    """Sjekk at bare dokumenter som feilet forbigående sendes på nytt."""
+    ids = [f"a{i}" for i in range(10)] + ["ugyldig"]
+    client = FakeClient(ids, flaky={"a3": 2, "*": 1})
+    results = _store(client).delete_by_ids(
+        ids, batch_size=4, max_concurrency=2, max_retries=3
+    )
+    assert [result.keys for result in results] == [ids[0:4], ids[4:8], ids[8:]]
+    assert [result.succeeded for result in results] == [True, True, False]
+    assert list(results[2].failed) == ["ugyldig"]
+    assert "a3" not in client.ids and client.ids == {"ugyldig"}
+    assert results[0].attempts >= 3
+    assert ["a3"] in client.calls, "Bare feilede dokumenter skal sendes på nytt"
+
+
+def test_delete_gives_up() -> None:
+    """Sjekk at feil rapporteres etter siste forsøk."""
+    client = FakeClient(["a1", "a2"], flaky={"a1": 10})
+    (result,) = _store(client).delete_by_ids(["a1", "a2"], max_retries=2)
+    assert result.attempts == 3
+    assert result.failed == {"a1": "503: Busy"}
+    assert not _store(client).delete(["a1"], max_retries=0)
+
+
+def test_delete_by_filter() -> None:
+    """Sjekk at dokumentene som oppfyller filteret slettes."""
+    client = FakeClient(["a1", "a2", "b1"], flaky={})
+    results = _store(client).delete_by_filter({"KnowledgeArticleId": "a"})
+    assert client.filters == ["(KnowledgeArticleId eq 'a')"]
+    assert all(result.succeeded for result in results)
+    assert client.ids == {"b1"}
+
+
+def test_search_all_pages_by_id() -> None:
+    """Sjekk at alle dokumenter hentes side for side etter ID."""
+    ids = [f"a{i:02d}" for i in range(25)] + ["b1"]
+    client = FakeClient(ids, flaky={})
+    results = list(_store(client)._search_all(["id"], page_size=10))
+    assert [result["id"] for result in results] == ids[:25]
+    assert client.filters == [None, "id gt 'a09'", "id gt 'a19'"]
+
+
+def test_search_all_old_index(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Sjekk at indekser der `id` ikke kan sorteres hentes uten sortering."""
+    ids = [f"a{i:02d}" for i in range(25)] + ["b1"]
+    client = FakeClient(ids, flaky={})
+    results = list(_store(client, id_pageable=False)._search_all(["id"]))
+    assert sorted(result["id"] for result in results) == ids[:25]
+    assert client.filters == [None]
+
+    monkeypatch.setattr(azure_search, "_MAX_SKIP", 20)
+    with pytest.raises(RuntimeError, match="azure rebuild"):
+        list(_store(client, id_pageable=False)._search_all(["id"]))
+
+
+def test_id_pageable(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Sjekk at indeksens felter avgjør om det hentes sortert på ID."""
+    fields = {
+        "ny": [SimpleNamespace(name="id", sortable=True, filterable=True)],
+        "gammel": [SimpleNamespace(name="id", sortable=False, filterable=True)],
+    }
+    index_client = SimpleNamespace(
+        get_index=lambda name: SimpleNamespace(fields=fields[name])
+    )
+    monkeypatch.setattr(azure_search, "index_admin_client", lambda: index_client)
+    store = _new_store()
+    for name, expected in [("ny", True), ("gammel", False)]:
+        store.__dict__.pop("_id_pageable", None)
+        store.index_name = name
+        assert store._id_pageable is expected
@@ -0,0 +1,147 @@
+"""Ytelsestester for prosessering av kunnskapsbasen uten nettverk.
+
+Testene benytter et syntetisk korpus (se `conftest.py`) og rapporterer
+gjennomstrømning og maksimalt minnebruk i `extra_info` for hver korpusstørrelse.
+Sammenlign kjøringer med f.eks.:
+
+    uv run pytest tests/test_benchmark_pipeline.py --benchmark-autosave
+    uv run pytest-benchmark compare
+
+Testene er merket med `benchmark` og hoppes over av `just test`.
+"""
+
+import tracemalloc
+from typing import Any, Callable
+
+import pytest
+from langchain_core.documents import Document
+from pytest_benchmark.fixture import BenchmarkFixture
+
+from nks_kbs_analyse import knowledgebase
+
+pytestmark = pytest.mark.benchmark
+
+CORPUS_SIZES = [20, 100]
+"""Antall artikler i korpusene det måles på"""
+
+
+def _run(
+    benchmark: BenchmarkFixture,
+    throughput: Callable[..., None],
+    docs: list[Document],
+    func: Callable[[], Any],
+) -> Any:
+    """Mål `func` og legg til gjennomstrømning og minnebruk i rapporten."""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    result = benchmark(func)
+    throughput(docs=len(docs), chars=sum(len(doc.page_content) for doc in docs))
+    benchmark.extra_info["docs"] = len(docs)
+    benchmark.extra_info["peak_memory_mb"] = peak / 2**20
+    return result
+
+
+def test_synthetic_corpus(corpus: Callable[[int], list[Document]]) -> None:
+    """Sjekk at korpuset har lengder som kunnskapsbasen og veldig lange artikler."""
+    docs = corpus(100)
+    lengths = sorted(len(doc.page_content) for doc in docs)
+    assert lengths[-1] >= 100_000
+    assert 1_000 < lengths[len(lengths) // 2] < 10_000
+
+
+@pytest.mark.parametrize("size", CORPUS_SIZES)
+def test_clean_document(
+    benchmark: BenchmarkFixture,
+    throughput: Callable[..., None],
+    corpus: Callable[[int], list[Document]],
+    size: int,
+) -> None:
+    """Mål rensing av dokumenter."""
+    docs = corpus(size)
+    result = _run(
+        benchmark,
+        throughput,
+        docs,
+        lambda: [knowledgebase._clean_document(doc) for doc in docs],
+    )
+    assert len(result) == size
+
+
+@pytest.mark.parametrize("size", CORPUS_SIZES)
+def test_header_splitter(
+    benchmark: BenchmarkFixture,
+    throughput: Callable[..., None],
+    corpus: Callable[[int], list[Document]],
+    size: int,
+) -> None:
+    """Mål splitting av tekst på markdown overskrifter."""
+    docs = corpus(size)
+    splitter = knowledgebase.CustomMarkdownHeaderSplitter()
+    result = _run(
+        benchmark,
+        throughput,
+        docs,
+        lambda: [splitter.split_text(doc.page_content) for doc in docs],
+    )
+    assert len(result) == size
+
+
+@pytest.mark.parametrize("size", CORPUS_SIZES)
+def test_split_documents_on_headers(
+    benchmark: BenchmarkFixture,
+    throughput: Callable[..., None],
+    corpus: Callable[[int], list[Document]],
+    size: int,
+) -> None:
+    """Mål splitting av dokumenter på markdown overskrifter."""
+    docs = corpus(size)
+    result = _run(
+        benchmark,
+        throughput,
+        docs,
+        lambda: knowledgebase._split_documents_on_headers(docs),
+    )
+    assert len(result) > size
+
+
+@pytest.mark.parametrize("chunk_size", [1500, 4000])
+@pytest.mark.parametrize("size", CORPUS_SIZES)
+def test_split_documents(
+    benchmark: BenchmarkFixture,
+    throughput: Callable[..., None],
+    corpus: Callable[[int], list[Document]],
+    size: int,
+    chunk_size: int,
+) -> None:
+    """Mål hele splittingen med innstillingene som brukes for indeksene."""
+    docs = corpus(size)
+    result = _run(
+        benchmark,
+        throughput,
+        docs,
+        lambda: knowledgebase.split_documents(docs, chunk_size=chunk_size),
+    )
+    assert len(result) > size
+
+
+@pytest.mark.parametrize("size", CORPUS_SIZES)
+def test_combine_headers_and_content(
+    benchmark: BenchmarkFixture,
+    throughput: Callable[..., None],
+    corpus: Callable[[int], list[Document]],
+    size: int,
+) -> None:
+    """Mål sammenslåing av overskrifter og innhold."""
+    docs = corpus(size)
+    header_split_docs = knowledgebase._split_documents_on_headers(docs)
+    result = _run(
+        benchmark,
+        throughput,
+        docs,
+        lambda: knowledgebase._combine_headers_and_content(header_split_docs),
+    )
+    assert len(result) == len(header_split_docs)
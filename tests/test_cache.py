@@ -0,0 +1,112 @@
+"""Tester for mellomlagring på disk."""
+
+from pathlib import Path
+
+import pytest
+from langchain_core.documents import Document
+
+from nks_kbs_analyse import knowledgebase
+from nks_kbs_analyse.cache import ChunkCache, DiskCache, RetrieverCache
+
+
+def test_disk_cache_lru(tmp_path: Path) -> None:
+    """Sjekk at minst nylig brukte verdier fjernes når lagringen er full."""
+    cache = DiskCache(tmp_path / "cache.sqlite", max_bytes=30)
+    cache.set("a", b"a" * 10)
+    cache.set("b", b"b" * 10)
+    cache.set("c", b"c" * 10)
+    assert cache.get("a") == b"a" * 10
+    cache.set("d", b"d" * 10)
+    assert "b" not in cache, "'b' er minst nylig brukt og skal fjernes"
+    assert cache.get("b") is None
+    assert all(key in cache for key in "acd")
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.entries) == (1, 1, 3)
+    assert stats.size_bytes == 30
+    cache.close()
+
+    # Verdiene er tilgjengelige etter at lagringen åpnes på nytt
+    cache = DiskCache(tmp_path / "cache.sqlite", max_bytes=30)
+    assert cache.get("d") == b"d" * 10
+    assert cache.stats().size_bytes == 30
+
+
+def test_split_documents_with_cache(tmp_path: Path) -> None:
+    """Sjekk at lagrede resultat gir samme dokumenter som splitting."""
+    docs = [
+        Document(
+            page_content=f"# Tittel {i}\n\n\nInnhold {i}\n## Del\n" + "tekst " * 100,
+            metadata={"KnowledgeArticleId": str(i), "ContentColumn": "Article__c"},
+        )
+        for i in range(5)
+    ]
+    expected = knowledgebase.split_documents(
+        knowledgebase.clean_documents(docs), chunk_size=200, overlap=20
+    )
+    cache = ChunkCache(tmp_path / "chunks.sqlite")
+    result = knowledgebase.split_documents(
+        docs, chunk_size=200, overlap=20, clean=True, cache=cache
+    )
+    assert result == expected
+    assert cache.stats().misses == 5
+
+    # Endre én artikkel, bare denne skal splittes på nytt
+    docs[2] = Document(page_content="# Ny\nTekst", metadata=docs[2].metadata)
+    result = knowledgebase.split_documents(
+        docs, chunk_size=200, overlap=20, clean=True, cache=cache
+    )
+    stats = cache.stats()
+    assert (stats.hits, stats.misses) == (4, 6)
+    assert result == knowledgebase.split_documents(
+        knowledgebase.clean_documents(docs), chunk_size=200, overlap=20
+    )
+
+    # Andre innstillinger skal ikke gi treff
+    knowledgebase.split_documents(docs, chunk_size=300, cache=cache)
+    assert cache.stats().hits == 4
+
+
+def test_retriever_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Sjekk LRU, utløp, lagring på disk og invalidering."""
+    now = [1000.0]
+    monkeypatch.setattr("nks_kbs_analyse.cache.time.time", lambda: now[0])
+    url = "https://nks-vdb.test"
+    docs = [Document(page_content="Dagpenger", metadata={"Score": 0.5})]
+    cache = RetrieverCache(max_entries=2, ttl=60, disk=tmp_path / "vdb.sqlite")
+    keys = [cache.key(url, {"query": f"q{i}", "num_results": 5}) for i in range(3)]
+    assert cache.key(url + "/", {"num_results": "5", "query": "q0"}) == keys[0]
+    assert cache.key(url, {"query": "q0", "num_results": 4}) != keys[0]
+    for key in keys:
+        cache.set(key, url, docs)
+    assert len(cache._memory) == 2
+    # Eldste resultat er bare på disk, men hentes derfra
+    assert cache.get(keys[0]) == docs
+    cached = cache.get(keys[0])
+    assert cached is not None
+    cached[0].metadata["Score"] = 1.0
+    assert cache.get(keys[0]) == docs
+
+    # En annen prosess ser samme resultater og invalidering
+    other = RetrieverCache(disk=tmp_path / "vdb.sqlite")
+    assert other.get(keys[1]) == docs
+    now[0] += 1
+    cache.invalidate(url + "/")
+    assert other.get(keys[1]) is None
+    assert cache.get(keys[2]) is None
+    key = cache.key(url, {"query": "ny"})
+    now[0] += 1
+    cache.set(key, url, docs)
+    assert other.get(key) == docs
+
+    # Utløpt etter 'ttl'
+    now[0] += 61
+    assert cache.get(key) is None
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.entries) == (3, 2, 0)
+    assert stats.size_bytes > 0
+
+    memory = RetrieverCache()
+    memory.set(key, url, docs)
+    assert memory.get(key) == docs
+    memory.invalidate()
+    assert memory.get(key) is None
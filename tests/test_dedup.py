@@ -0,0 +1,53 @@
+"""Tester for fjerning av nesten like dokumenter."""
+
+import random
+
+import pytest
+from langchain_core.documents import Document
+
+from nks_kbs_analyse.dedup import deduplicate_documents, minhash_signatures
+
+np = pytest.importorskip("numpy")
+
+_BOILERPLATE = (
+    "Slik sender du oppgave til riktig enhet. Velg tema og underkategori i "
+    "Gosys, skriv en kort beskrivelse av henvendelsen og legg ved relevant "
+    "dokumentasjon før oppgaven sendes til enheten som eier saken. "
+)
+
+
+def _text(seed: int, words: int = 80) -> str:
+    rng = random.Random(seed)
+    vocabulary = [f"ord{i}" for i in range(2000)]
+    return " ".join(rng.choices(vocabulary, k=words))
+
+
+def test_minhash_estimates_jaccard() -> None:
+    """Sjekk at like tekster gir lik signatur og ulike tekster lav likhet."""
+    signatures = minhash_signatures([_BOILERPLATE, _BOILERPLATE, _text(1)])
+    assert signatures.shape == (3, 128)
+    assert (signatures[0] == signatures[1]).all()
+    assert (signatures[0] == signatures[2]).mean() < 0.1
+
+
+def test_deduplicate_documents() -> None:
+    """Sjekk at nesten like dokumenter slås sammen med det første."""
+    docs = [
+        Document(page_content=_BOILERPLATE * 3, metadata={"KnowledgeArticleId": "a"}),
+        Document(page_content=_text(1), metadata={"KnowledgeArticleId": "a"}),
+        Document(
+            page_content=_BOILERPLATE * 3 + "Hvem gjør hva",
+            metadata={"KnowledgeArticleId": "b"},
+        ),
+        Document(page_content=_text(2), metadata={"KnowledgeArticleId": "c"}),
+        Document(page_content=_BOILERPLATE * 3, metadata={"KnowledgeArticleId": "c"}),
+    ]
+    result = deduplicate_documents(docs)
+    assert [doc.page_content for doc in result] == [
+        docs[0].page_content,
+        docs[1].page_content,
+        docs[3].page_content,
+    ]
+    assert result[0].metadata["DuplicateArticleIds"] == ["b", "c"]
+    assert "DuplicateArticleIds" not in result[1].metadata
+    assert "DuplicateArticleIds" not in docs[0].metadata
@@ -0,0 +1,242 @@
+"""Tester for embeddings."""
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Iterator
+
+import httpx
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from nks_kbs_analyse.cache import DiskCache
+from nks_kbs_analyse.embeddings import CachedEmbeddings, ConcurrentEmbeddings
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    """Embedding som teller antall tekster som embeddes."""
+
+    calls: list[list[str]] = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed og husk tekstene."""
+        self.calls.append(list(texts))
+        return super().embed_documents(texts)
+
+
+def test_cached_embeddings(tmp_path: Path) -> None:
+    """Sjekk at bare nye tekster sendes til modellen."""
+    model = CountingEmbedding(size=8, calls=[])
+    cache = DiskCache(tmp_path / "embeddings.sqlite")
+    embedding = CachedEmbeddings(model, cache, namespace="fake:8")
+
+    first = embedding.embed_documents(["a", "b", "a"])
+    assert model.calls == [["a", "b"]], "Like tekster skal bare embeddes én gang"
+    assert first[0] == first[2]
+    assert len(first[0]) == 8
+    expected = model.embed_documents(["a"])[0]
+    assert all(abs(x - y) < 1e-6 for x, y in zip(first[0], expected))
+
+    model.calls.clear()
+    assert embedding.embed_documents(["b", "c"])[0] == first[1]
+    assert embedding.embed_query("a") == first[0]
+    assert asyncio.run(embedding.aembed_documents(["a", "b", "c"]))[1] == first[1]
+    assert model.calls == [["c"]]
+    stats = embedding.stats()
+    assert (stats.hits, stats.misses, stats.entries) == (5, 4, 3)
+
+    # Ny modell (namespace) skal ikke gjenbruke vektorene
+    other = CachedEmbeddings(model, cache, namespace="fake:8:v2")
+    other.embed_documents(["a"])
+    assert model.calls[-1] == ["a"]
+
+
+class RateLimitError(Exception):
+    """Feil som ligner på 429 fra OpenAI."""
+
+    def __init__(self) -> None:
+        """Lag feil med `Retry-After` header."""
+        super().__init__("Too many requests")
+        self.status_code = 429
+        self.response = SimpleNamespace(headers={"retry-after-ms": "10"})
+
+
+class FlakyEmbedding(DeterministicFakeEmbedding):
+    """Embedding som gir 429 når det er for mange samtidige kall."""
+
+    in_flight: int = 0
+    max_in_flight: int = 0
+    batches: list[int] = []
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed asynkront, men feil hvis mer enn tre kall samtidig."""
+        self.in_flight += 1
+        try:
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.001)
+            if self.in_flight > 3:
+                raise RateLimitError()
+            self.batches.append(len(texts))
+            return self.embed_documents(texts)
+        finally:
+            self.in_flight -= 1
+
+
+def test_concurrent_embeddings() -> None:
+    """Sjekk batching etter tokens, rekkefølge og håndtering av 429."""
+    model = FlakyEmbedding(size=4, batches=[])
+    embedding = ConcurrentEmbeddings(
+        model,
+        max_batch_size=10,
+        max_batch_tokens=40,
+        max_concurrency=8,
+        initial_concurrency=4,
+        token_counter=len,
+    )
+    texts = [f"tekst {i}" for i in range(200)] + ["x" * 100]
+    batches = embedding.batches(texts)
+    assert batches[0] == (0, 5, 35), "Begrenset av antall tokens"
+    assert batches[-1] == (200, 201, 100), "Lange tekster får egen batch"
+
+    vectors = embedding.embed_documents(texts)
+    assert vectors == model.embed_documents(texts)
+    assert sum(model.batches) == len(texts)
+    assert embedding.stats.rate_limited > 0
+    assert embedding.stats.requests == len(batches)
+    assert embedding.stats.tokens == sum(len(text) for text in texts)
+    assert embedding.stats.tokens_per_second > 0
+
+
+def test_concurrent_embeddings_gives_up() -> None:
+    """Sjekk at vi gir opp etter for mange 429."""
+
+    class AlwaysLimited(DeterministicFakeEmbedding):
+        async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+            raise RateLimitError()
+
+    embedding = ConcurrentEmbeddings(AlwaysLimited(size=4), max_retries=2)
+    with pytest.raises(RateLimitError):
+        embedding.embed_documents(["a"])
+    assert embedding.stats.rate_limited == 2
+
+
+class APITimeoutError(Exception):
+    """Feil som ligner på tidsavbrudd fra OpenAI."""
+
+
+def test_concurrent_embeddings_transient_errors() -> None:
+    """Sjekk at tidsavbrudd og 5xx prøves på nytt, men ikke andre feil."""
+    server_error = Exception("Internal server error")
+    server_error.status_code = 503  # type: ignore[attr-defined]
+    errors: list[Exception] = [APITimeoutError(), server_error]
+
+    class Unstable(DeterministicFakeEmbedding):
+        async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+            if errors:
+                raise errors.pop(0)
+            return self.embed_documents(texts)
+
+    model = Unstable(size=4)
+    embedding = ConcurrentEmbeddings(model, max_retries=2, backoff=0.001)
+    assert embedding.embed_documents(["a"]) == model.embed_documents(["a"])
+    assert (embedding.stats.retried, embedding.stats.requests) == (2, 1)
+
+    errors.append(ValueError("Ugyldig forespørsel"))
+    with pytest.raises(ValueError, match="Ugyldig"):
+        embedding.embed_documents(["a"])
+    assert embedding.stats.retried == 2
+
+
+def test_concurrent_embeddings_checks_length() -> None:
+    """Sjekk at for få vektorer fra modellen gir feil."""
+
+    class Truncating(DeterministicFakeEmbedding):
+        async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+            return self.embed_documents(texts[1:])
+
+    embedding = ConcurrentEmbeddings(Truncating(size=4))
+    with pytest.raises(ValueError, match="1 vektorer for 2 tekster"):
+        embedding.embed_documents(["a", "b"])
+
+
+class _VectorHandler(BaseHTTPRequestHandler):
+    """Svarer med én vektor per tekst og holder forbindelsen åpen."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:
+        """Embed tekstene i forespørselen."""
+        texts = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        body = json.dumps([[float(len(text)), 1.0] for text in texts]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        """Ikke skriv til stderr."""
+
+
+class HttpEmbedding(Embeddings):
+    """Embedding over HTTP med én felles asynkron klient, som i `openai`."""
+
+    def __init__(self, url: str) -> None:
+        """Send tekster til `url`."""
+        self.url = url
+        self.client: httpx.AsyncClient | None = None
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed synkront (brukes ikke)."""
+        raise AssertionError("Skal embedde asynkront")
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed en tekst synkront (brukes ikke)."""
+        raise AssertionError("Skal embedde asynkront")
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed med en klient som gjenbruker forbindelser."""
+        if self.client is None:
+            self.client = httpx.AsyncClient()
+        response = await self.client.post(self.url, json=texts)
+        vectors: list[list[float]] = response.raise_for_status().json()
+        return vectors
+
+    async def aembed_query(self, text: str) -> list[float]:
+        """Embed en tekst med samme klient."""
+        return (await self.aembed_documents([text]))[0]
+
+
+@pytest.fixture
+def vector_server() -> Iterator[str]:
+    """Lokal HTTP server som svarer med vektorer."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _VectorHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_concurrent_embeddings_reuses_connections(vector_server: str) -> None:
+    """Sjekk at flere synkrone kall kan dele forbindelser i modellen."""
+    embedding = ConcurrentEmbeddings(HttpEmbedding(vector_server))
+    assert embedding.embed_documents(["a", "bb", "ccc"]) == [
+        [1.0, 1.0],
+        [2.0, 1.0],
+        [3.0, 1.0],
+    ]
+    assert embedding.embed_documents(["dddd"]) == [[4.0, 1.0]]
+
+    async def both() -> list[list[float]]:
+        return await embedding.aembed_documents(["ee"]) + [
+            await embedding.aembed_query("f")
+        ]
+
+    assert asyncio.run(both()) == [[2.0, 1.0], [1.0, 1.0]]
+    embedding.close()
@@ -0,0 +1,156 @@
+"""Tester for evaluering med mange spørsmål."""
+
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from nks_kbs_analyse.evaluation import (
+    EvaluationProgress,
+    RateLimiter,
+    evaluate,
+    load_queries,
+)
+
+
+class FakeRetriever(BaseRetriever):
+    """Retriever med litt ventetid der enkelte spørsmål feiler."""
+
+    fail: set[str] = set()
+    active: int = 0
+    max_active: int = 0
+
+    def _documents(self, query: str, k: int) -> list[Document]:
+        if query in self.fail:
+            raise ConnectionError("Mistet forbindelsen")
+        return [
+            Document(
+                page_content=f"{query} {i}",
+                metadata={"KnowledgeArticleId": f"ka{i}", "Title": "T", "Score": 1.0},
+            )
+            for i in range(k)
+        ]
+
+    def _get_relevant_documents(self, query: str, **kwargs: Any) -> list[Document]:
+        return self._documents(query, kwargs.get("k", 5))
+
+    async def _aget_relevant_documents(
+        self, query: str, **kwargs: Any
+    ) -> list[Document]:
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return self._documents(query, kwargs.get("k", 5))
+
+
+def test_load_queries(tmp_path: Path) -> None:
+    """Sjekk lesing av CSV og JSONL med og uten ID."""
+    csv_path = tmp_path / "spørsmål.csv"
+    csv_path.write_text("query,expected\nHva er dagpenger?,ka1\nSykepenger?,\n")
+    queries = load_queries(csv_path)
+    assert [(q.id, q.query, q.extra) for q in queries] == [
+        ("0", "Hva er dagpenger?", {"expected": "ka1"}),
+        ("1", "Sykepenger?", {"expected": ""}),
+    ]
+    jsonl_path = tmp_path / "spørsmål.jsonl"
+    jsonl_path.write_text('{"id": "q1", "query": "Hva er AAP?"}\n\n')
+    assert load_queries(jsonl_path)[0].id == "q1"
+    jsonl_path.write_text('{"id": "q1"}\n')
+    with pytest.raises(ValueError, match="mangler 'query'"):
+        load_queries(jsonl_path)
+
+
+def test_evaluate_resume(tmp_path: Path) -> None:
+    """Sjekk samtidige kall, resultater og at feilede spørsmål kjøres på nytt."""
+    path = tmp_path / "spørsmål.jsonl"
+    path.write_text(
+        "".join(
+            json.dumps({"query": f"spørsmål {i}", "expected": f"ka{i % 3}"}) + "\n"
+            for i in range(40)
+        )
+    )
+    queries = load_queries(path)
+    output = tmp_path / "resultater.jsonl"
+    retriever = FakeRetriever(fail={"spørsmål 3", "spørsmål 7"})
+    reports: list[EvaluationProgress] = []
+    summary = evaluate(
+        retriever,
+        queries,
+        output,
+        max_concurrency=8,
+        progress=reports.append,
+        k=2,
+    )
+    assert (summary.completed, summary.failed, summary.skipped) == (38, 2, 0)
+    assert 1 < retriever.max_active <= 8
+    assert len(reports) == 40
+    assert summary.latency_p50 is not None and summary.latency_p50 >= 0.01
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert len(records) == 40
+    record = next(r for r in records if r["id"] == "4")
+    assert record["expected"] == "ka1"
+    assert record["error"] is None
+    assert [doc["KnowledgeArticleId"] for doc in record["documents"]] == [
+        "ka0",
+        "ka1",
+    ]
+    assert {r["id"] for r in records if r["error"]} == {"3", "7"}
+
+    # Fortsett med en ufullstendig siste linje som etter et avbrudd
+    with output.open("a") as fp:
+        fp.write('{"id": "5", "qu')
+    retriever.fail = set()
+    summary = evaluate(retriever, queries, output, k=2)
+    assert (summary.completed, summary.skipped) == (2, 38)
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert len(records) == 42
+
+    summary = evaluate(retriever, queries, output, restart=True, k=2)
+    assert (summary.completed, summary.skipped) == (40, 0)
+
+
+def test_evaluate_parquet(tmp_path: Path) -> None:
+    """Sjekk at Parquet skrives i delfiler med samme skjema."""
+    pq = pytest.importorskip("pyarrow.parquet")
+    from nks_kbs_analyse.evaluation import ParquetResults
+
+    queries = load_queries(_jsonl(tmp_path, 25))
+    retriever = FakeRetriever(fail={"spørsmål 1"})
+    output = ParquetResults(tmp_path / "resultater.parquet", batch_size=10)
+    summary = evaluate(retriever, queries, output, k=3)
+    assert summary.failed == 1
+    assert len(list(output.path.glob("part-*.parquet"))) == 3
+
+    retriever.fail = set()
+    summary = evaluate(retriever, queries, tmp_path / "resultater.parquet")
+    assert (summary.completed, summary.skipped) == (1, 24)
+    table = pq.read_table(tmp_path / "resultater.parquet")
+    assert table.num_rows == 26
+    assert table.schema.field("error").type == "string"
+
+
+def test_rate_limiter() -> None:
+    """Sjekk at kallene spres utover."""
+
+    async def run() -> float:
+        limiter = RateLimiter(100)
+        start = time.monotonic()
+        for _ in range(11):
+            await limiter.wait()
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.09
+
+
+def _jsonl(tmp_path: Path, n: int) -> Path:
+    path = tmp_path / "spørsmål.jsonl"
+    path.write_text(
+        "".join(json.dumps({"query": f"spørsmål {i}"}) + "\n" for i in range(n))
+    )
+    return path
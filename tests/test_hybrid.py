@@ -0,0 +1,95 @@
+"""Tester for lokalt hybrid søk."""
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from nks_kbs_analyse.hybrid import BM25Index, HybridRetriever, stem, tokenize
+from nks_kbs_analyse.vectorstore import LocalVectorStore
+
+np = pytest.importorskip("numpy")
+
+_TEXTS = [
+    "Dagpenger er en ytelse til den som har mistet arbeidet.",
+    "Sykepenger erstatter tapt inntekt når du er syk.",
+    "Samordning av dagpengene med sykepengene skjer etter egne regler.",
+    "Meldekortet må sendes hver fjortende dag.",
+]
+
+
+@pytest.mark.parametrize(
+    "word, expected",
+    [
+        ("dagpengene", "dagpeng"),
+        ("dagpenger", "dagpeng"),
+        ("arbeidsgiverens", "arbeidsgiver"),
+        ("meldekortet", "meldekort"),
+        ("konstruert", "konstruer"),
+        ("bildt", "bild"),
+    ],
+)
+def test_stem(word: str, expected: str) -> None:
+    """Sjekk at bøyde former får samme stamme."""
+    assert stem(word) == expected
+
+
+def test_tokenize() -> None:
+    """Sjekk at stoppord fjernes og at ord stammes."""
+    assert tokenize("Hva er samordning mellom DAGPENGER og sykepenger?") == [
+        "samordning",
+        "dagpeng",
+        "sykepeng",
+    ]
+
+
+def test_bm25() -> None:
+    """Sjekk at dokumenter med sjeldne ord fra spørringen rangeres høyest."""
+    index = BM25Index(_TEXTS)
+    scores = index.scores(["dagpengene", "meldekort", "ukjent"])
+    assert scores.shape == (3, 4)
+    assert set(np.flatnonzero(scores[0])) == {0, 2}
+    assert np.argmax(scores[1]) == 3
+    assert not scores[2].any()
+
+
+def test_hybrid_retriever() -> None:
+    """Sjekk vekting og metadata som fra NKS-VDB."""
+    embedding = DeterministicFakeEmbedding(size=16)
+    store = LocalVectorStore(embedding, dtype="float32")
+    store.add_texts(_TEXTS, [{"Tab": str(i % 2)} for i in range(len(_TEXTS))])
+    retriever = HybridRetriever(store=store, k=2)
+
+    docs = retriever.invoke("dagpengene", semantic_weight=0.0)
+    assert {doc.page_content for doc in docs} == {_TEXTS[0], _TEXTS[2]}
+    assert docs[0].metadata["Score"] == pytest.approx(1.0)
+
+    # Bare semantisk søk skal gi synkende `SemanticSimilarity`
+    docs = retriever.invoke(_TEXTS[3], k=4, fts_weight=0.0, timeout=1.0)
+    assert docs[0].page_content == _TEXTS[3]
+    similarity = [doc.metadata["SemanticSimilarity"] for doc in docs]
+    assert similarity == sorted(similarity, reverse=True)
+    assert similarity[0] == pytest.approx(1.0, abs=1e-5)
+    assert [doc.metadata["Score"] for doc in docs] == similarity
+
+    results = retriever.batch_search(
+        ["dagpenger", "sykepenger", "meldekort"], k=3, filter={"Tab": "0"}
+    )
+    assert [len(docs) for docs in results] == [2, 2, 2]
+    assert all(doc.metadata["Tab"] == "0" for docs in results for doc in docs)
+
+
+def test_hybrid_retriever_replaced_document() -> None:
+    """Sjekk at ordsøket bygges på nytt når et dokument erstattes."""
+    store = LocalVectorStore(DeterministicFakeEmbedding(size=16))
+    store.add_texts(["dagpenger søknad", "meldekort"], ids=["a", "b"])
+    retriever = HybridRetriever(store=store, k=2)
+
+    def fts(query: str) -> dict[str | None, float]:
+        docs = retriever.invoke(query, semantic_weight=0.0)
+        return {doc.id: doc.metadata["Score"] for doc in docs}
+
+    assert fts("dagpenger") == {"a": 1.0, "b": 0.0}
+
+    # Samme antall dokumenter, men "a" har fått nytt innhold og ny plass
+    store.add_texts(["sykepenger"], ids=["a"])
+    assert fts("dagpenger") == {"a": 0.0, "b": 0.0}
+    assert fts("sykepenger") == {"a": 1.0, "b": 0.0}
@@ -0,0 +1,43 @@
+"""Tester for typer i søkeindeksen."""
+
+from datetime import datetime, timezone
+
+from nks_kbs_analyse.index_schema import METADATA_FIELDS, to_index_values
+
+
+def test_metadata_fields() -> None:
+    """Sjekk at feltene utledes fra kunnskapsbasen med riktige typer."""
+    assert METADATA_FIELDS["LastModifiedBQ"].type == "datetime"
+    assert METADATA_FIELDS["LastModifiedBQ"].sortable
+    assert METADATA_FIELDS["DataCategories"].type == "collection"
+    assert METADATA_FIELDS["Tab"].facetable
+    assert METADATA_FIELDS["KnowledgeArticleId"].type == "string"
+    # Fra 'METADATA_MAPPING'
+    assert "Fragment" in METADATA_FIELDS
+
+
+def test_to_index_values() -> None:
+    """Sjekk konvertering av en batch med metadata."""
+    rows = to_index_values(
+        [
+            {
+                "KnowledgeArticleId": 42,
+                "DataCategories": "Dagpenger, Sykepenger,",
+                "LastModifiedBQ": datetime(2024, 9, 9, tzinfo=timezone.utc),
+                "EmbeddingCreation": "2024-09-10T12:00:00+02:00",
+                "Ukjent": datetime(2024, 1, 1),
+            },
+            {"DataCategories": None, "Title": "Tittel"},
+        ]
+    )
+    assert rows[0] == {
+        "KnowledgeArticleId": "42",
+        "DataCategories": ["Dagpenger", "Sykepenger"],
+        "LastModifiedBQ": "2024-09-09T00:00:00+00:00",
+        "EmbeddingCreation": "2024-09-10T12:00:00+02:00",
+        "Ukjent": "2024-01-01T00:00:00",
+    }
+    assert rows[1] == {"DataCategories": [], "Title": "Tittel"}
+    # Uten tidssone tolkes tidspunktet som lokal tid
+    (row,) = to_index_values([{"EmbeddingCreation": "2024-09-10T12:00:00"}])
+    assert datetime.fromisoformat(row["EmbeddingCreation"]).tzinfo is not None
@@ -0,0 +1,97 @@
+"""Tester for inkrementell synkronisering av indeks."""
+
+from types import SimpleNamespace
+from typing import Any, Sequence
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from nks_kbs_analyse.index_sync import assign_chunk_ids, sync_index
+
+
+class FakeStore:
+    """Enkel indeks i minnet med samme grensesnitt som `AzureExtended`."""
+
+    def __init__(self) -> None:
+        """Lag tom indeks."""
+        self.documents: dict[str, dict[str, Any]] = {}
+        self.uploaded = 0
+
+    def get_chunk_ids(self) -> dict[str, str | None]:
+        """Hent ID-er i indeksen."""
+        return {
+            key: doc["metadata"]["KnowledgeArticleId"]
+            for key, doc in self.documents.items()
+        }
+
+    def upsert_chunks(
+        self,
+        ids: Sequence[str],
+        texts: Sequence[str],
+        embeddings: Sequence[list[float]],
+        metadatas: Sequence[dict[str, Any]],
+    ) -> list[Any]:
+        """Legg til dokumenter i indeksen."""
+        for key, text, metadata in zip(ids, texts, metadatas):
+            self.documents[key] = {"content": text, "metadata": metadata}
+        self.uploaded += len(ids)
+        return [SimpleNamespace(key=key, succeeded=True) for key in ids]
+
+    def delete_by_ids(self, ids: Sequence[str]) -> list[Any]:
+        """Slett dokumenter fra indeksen."""
+        for key in ids:
+            del self.documents[key]
+        return [SimpleNamespace(keys=list(ids), failed={})]
+
+
+def _chunk(article_id: str, content: str, column: str = "Article__c") -> Document:
+    return Document(
+        page_content=content,
+        metadata={"KnowledgeArticleId": article_id, "ContentColumn": column},
+    )
+
+
+def test_chunk_ids_are_stable() -> None:
+    """Sjekk at ID-er er stabile og bare endres når innholdet endres."""
+    chunks = [_chunk("a", "første"), _chunk("a", "andre"), _chunk("b", "første")]
+    ids = list(assign_chunk_ids(chunks))
+    assert len(set(ids)) == 3
+    assert ids == list(assign_chunk_ids(chunks))
+    changed = list(assign_chunk_ids([chunks[0], _chunk("a", "endret"), chunks[2]]))
+    assert changed[0] == ids[0] and changed[2] == ids[2]
+    assert changed[1] != ids[1]
+
+
+def test_sync_index() -> None:
+    """Sjekk at synkronisering bare laster opp endringer."""
+    store: Any = FakeStore()
+    embedding = DeterministicFakeEmbedding(size=4)
+    chunks = [
+        _chunk("a", "a1"),
+        _chunk("a", "a2"),
+        _chunk("b", "b1"),
+        _chunk("c", "c1"),
+    ]
+    plan = sync_index(store, chunks, {"a", "b", "c"}, embedding=embedding)
+    assert len(plan.upsert) == 4 and not plan.delete
+    assert store.uploaded == 4
+
+    # Ingen endringer skal ikke gi noen opplastinger
+    plan = sync_index(store, chunks, {"a", "b", "c"}, embedding=embedding)
+    assert not plan.upsert and not plan.delete and plan.unchanged == 4
+
+    # Endre 'a', fjern siste del av 'a' og deaktiver 'c'. Synkroniser bare 'a'
+    # slik at 'b' ikke skal slettes selv om den ikke er med
+    plan = sync_index(
+        store, [_chunk("a", "a1 endret")], {"a", "b"}, embedding=embedding
+    )
+    assert len(plan.upsert) == 1
+    assert len(plan.delete) == 3
+    assert store.uploaded == 5
+    assert sorted(doc["content"] for doc in store.documents.values()) == [
+        "a1 endret",
+        "b1",
+    ]
+    assert all(
+        "EmbeddingCreation" in doc["metadata"] for doc in store.documents.values()
+    )
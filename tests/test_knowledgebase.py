@@ -0,0 +1,261 @@
+"""Tester for innlasting og prosessering av kunnskapsbasen."""
+
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterator
+
+import pytest
+from langchain_core.documents import Document
+from pytest_benchmark.fixture import BenchmarkFixture
+
+from nks_kbs_analyse import knowledgebase
+
+
+def _row(article_id: str, column: str, title: str, article_type: str) -> dict[str, Any]:
+    """Hjelpemetode for å lage en rad slik den kommer fra BigQuery."""
+    return {
+        "ArticleType": article_type,
+        "DataCategories": "Dagpenger,Sykepenger",
+        "KnowledgeArticleId": article_id,
+        "KnowledgeArticle_QuartoUrl": f"https://quarto/{article_id}",
+        "LastModifiedBQ": datetime(2024, 9, 9, tzinfo=timezone.utc),
+        "Title": title,
+        "ContentColumn": column,
+        "Content": f"# Overskrift\n\nInnhold i {column} for {article_id}",
+    }
+
+
+def test_documents_from_batch() -> None:
+    """Sjekk at dokumenter fra Arrow er like dokumenter fra rader."""
+    pa = pytest.importorskip("pyarrow")
+    rows = [
+        _row("a", "Article__c", "Dagpenger", "Kunnskapsartikkel"),
+        _row("a", "NKS_User__c", "Dagpenger", "Kunnskapsartikkel"),
+        _row("b", "Article__c", "Felles rutiner", "Kunnskapsartikkel"),
+        _row("c", "Article__c", "Rutine", "Intern rutine"),
+        _row("c", "WhoDoesWhat__c", "Rutine", "Intern rutine"),
+    ]
+    batch = pa.RecordBatch.from_pylist(rows)
+    expected = [
+        knowledgebase._row_to_document(row, row["ContentColumn"]) for row in rows
+    ]
+    assert list(knowledgebase.documents_from_batch(batch)) == expected
+
+
+def _reference_clean(text: str) -> str:
+    """Rensing slik den var implementert med tre separate erstatninger."""
+    import re
+
+    text = re.sub(r"(#{1,6}.*\n)\n+", r"\1", text)
+    text = re.sub(r"(\n\n)\s+", r"\1", text)
+    return re.sub(r"^#{1,6}\s*\n", "", text, flags=re.MULTILINE)
+
+
+def test_clean_document(corpus: Callable[[int], list[Document]]) -> None:
+    """Sjekk at rensing gir samme resultat som de opprinnelige erstatningene."""
+    for doc in corpus(50):
+        cleaned = knowledgebase._clean_document(doc)
+        assert cleaned.page_content == _reference_clean(doc.page_content), doc.metadata[
+            "KnowledgeArticleId"
+        ]
+        assert cleaned.metadata == doc.metadata
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "#Tittel\n\n\nTekst\r\n\n  Mer tekst",
+        "# \n##\nTekst\n \n\n# Slutt\n\n",
+        "Tekst\n\n\t\n# Tittel\r\n\r\nTekst",
+    ],
+)
+def test_clean_document_whitespace(text: str) -> None:
+    """Sjekk tomme overskrifter, tabulator og Windows linjeskift."""
+    doc = Document(page_content=text, metadata={"Title": "Test"})
+    assert knowledgebase._clean_document(doc).page_content == _reference_clean(text)
+
+
+def test_iter_clean_documents_is_lazy() -> None:
+    """Sjekk at rensing ikke leser alle dokumentene på forhånd."""
+
+    def docs() -> Iterator[Document]:
+        yield Document(page_content="# Tittel\n\n\nTekst")
+        raise AssertionError("Skal ikke lese mer enn ett dokument")
+
+    first = next(knowledgebase.iter_clean_documents(docs()))
+    assert first.page_content == "# Tittel\nTekst"
+
+
+@pytest.mark.benchmark
+def test_clean_benchmark(
+    benchmark: BenchmarkFixture,
+    throughput: Callable[..., None],
+    corpus: Callable[[int], list[Document]],
+) -> None:
+    """Mål hvor mange dokumenter per sekund som kan renses."""
+    docs = corpus(100)
+    result = benchmark(lambda: list(knowledgebase.iter_clean_documents(docs)))
+    assert len(result) == len(docs)
+    throughput(docs=len(docs))
+
+
+def _reference_split(
+    text: str, headers: dict[str, str]
+) -> list[tuple[str, dict[str, str]]]:
+    """Splitting slik `CustomMarkdownHeaderSplitter` var implementert med `pop(0)`."""
+    import re
+
+    chunks: list[tuple[str, dict[str, str]]] = []
+    content = ""
+    stack: list[tuple[int, str]] = []
+
+    def complete() -> None:
+        if content and not content.isspace():
+            chunks.append((content, {headers["#" * d]: value for d, value in stack}))
+
+    lines = text.splitlines(keepends=True)
+    while lines:
+        line = lines.pop(0)
+        match = re.match(r"^(#{1,6}) (.*)", line)
+        if match and match.group(1) in headers:
+            complete()
+            content = ""
+            depth, title = len(match.group(1)), match.group(2)
+            for i, (d, _) in enumerate(stack):
+                if d == depth:
+                    stack = stack[:i] + [(depth, title)]
+                    break
+            else:
+                stack.append((depth, title))
+        else:
+            content += line
+    complete()
+    return chunks
+
+
+_SPLIT_LINES = [
+    "# Tittel\n",
+    "## Del\n",
+    "### Underdel\n",
+    "#### Dypere\n",
+    "####### For dypt\n",
+    "#Uten mellomrom\n",
+    "# \n",
+    "## Del\r\n",
+    "Tekst om dagpenger\n",
+    "- punkt\n",
+    "\n",
+    "  \n",
+    "\r\n",
+    "Tekst uten linjeskift",
+]
+"""Linjer som kombineres til tilfeldige tekster i `test_header_splitter_equivalence`"""
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [None, [("#", "H1"), ("###", "H3")]],
+    ids=["standard", "egne"],
+)
+def test_header_splitter_equivalence(
+    corpus: Callable[[int], list[Document]],
+    headers: list[tuple[str, str]] | None,
+) -> None:
+    """Sjekk at splitteren gir det samme som den opprinnelige implementasjonen."""
+    import random
+
+    rng = random.Random(0)
+    texts = [doc.page_content for doc in corpus(20)] + [
+        "".join(rng.choices(_SPLIT_LINES, k=rng.randint(0, 30))) for _ in range(2000)
+    ]
+    keys = dict(
+        headers or knowledgebase.CustomMarkdownHeaderSplitter.DEFAULT_HEADER_KEYS
+    )
+    splitter = knowledgebase.CustomMarkdownHeaderSplitter(headers_to_split_on=headers)
+    for text in texts:
+        docs = splitter.split_text(text)
+        assert [(doc.page_content, doc.metadata) for doc in docs] == _reference_split(
+            text, keys
+        ), repr(text)
+
+
+def test_markdown_header_splitter() -> None:
+    """Sjekk at tekst splittes på overskrifter og at overskriftene blir metadata."""
+    text = (
+        "Innledning\n"
+        "# Dagpenger\n"
+        "Om dagpenger\n\n"
+        "## Søknad\n"
+        "Slik søker du\n"
+        "#### Ikke splitt\n"
+        "Mer tekst\n"
+        "## Vedtak\n"
+        "   \n"
+        "# Sykepenger\n"
+        "Om sykepenger"
+    )
+    splitter = knowledgebase.CustomMarkdownHeaderSplitter()
+    docs = splitter.split_text(text)
+    assert [(doc.page_content, doc.metadata) for doc in docs] == [
+        ("Innledning\n", {}),
+        ("Om dagpenger\n\n", {"#": "Dagpenger"}),
+        (
+            "Slik søker du\n#### Ikke splitt\nMer tekst\n",
+            {"#": "Dagpenger", "##": "Søknad"},
+        ),
+        ("Om sykepenger", {"#": "Sykepenger"}),
+    ]
+    spans = splitter.split_spans(text)
+    assert [span.text(text) for span in spans] == [doc.page_content for doc in docs]
+
+    splitter = knowledgebase.CustomMarkdownHeaderSplitter(strip_headers=False)
+    docs = splitter.split_text(text)
+    assert docs[1].page_content == "# Dagpenger\nOm dagpenger\n\n"
+    assert docs[3].page_content == "## Vedtak\n   \n"
+    # Samme splitter kan brukes flere ganger
+    assert splitter.split_text(text) == docs
+
+
+@pytest.mark.benchmark
+def test_markdown_header_splitter_benchmark(
+    benchmark: BenchmarkFixture,
+    throughput: Callable[..., None],
+    corpus: Callable[[int], list[Document]],
+) -> None:
+    """Mål tiden det tar å splitte en veldig lang artikkel."""
+    text = "".join(doc.page_content for doc in corpus(20))
+    assert len(text) > 100_000
+    splitter = knowledgebase.CustomMarkdownHeaderSplitter()
+    docs = benchmark(splitter.split_text, text)
+    assert docs
+    throughput(chars=len(text))
+
+
+def test_split_documents_in_parallel(
+    corpus: Callable[[int], list[Document]],
+) -> None:
+    """Sjekk at splitting i parallell gir samme resultat som serielt."""
+    docs = corpus(20)
+    serial = knowledgebase.split_documents(docs, chunk_size=300, overlap=30)
+    parallel = knowledgebase.split_documents(
+        iter(docs), chunk_size=300, overlap=30, num_workers=2, batch_size=4
+    )
+    assert len(serial) > len(docs)
+    assert parallel == serial
+
+
+def test_sweep_split_documents(corpus: Callable[[int], list[Document]]) -> None:
+    """Sjekk at splitting med flere konfigurasjoner gir samme som hver for seg."""
+    docs = corpus(20)
+    configs = [(300, 30), (800, 80)]
+    results = knowledgebase.sweep_split_documents(docs, configs, clean=True)
+    assert list(results) == configs
+    for (chunk_size, overlap), result in results.items():
+        expected = knowledgebase.split_documents(
+            docs, chunk_size=chunk_size, overlap=overlap, clean=True
+        )
+        assert result.chunks == expected
+        assert result.stats.count == len(expected)
+        # Overskriftene (opptil fire nivå i korpuset) kommer i tillegg
+        assert result.stats.max_length <= chunk_size + 200
+    assert results[(300, 30)].name == "chunk_size_300_overlap_30"
+    assert results[(300, 30)].stats.count > results[(800, 80)].stats.count
@@ -0,0 +1,50 @@
+"""Tester for profilering av tekstlengder."""
+
+import random
+from typing import Callable
+
+from langchain_core.documents import Document
+
+from nks_kbs_analyse.profiling import LengthSketch, profile_corpus
+
+
+def test_length_sketch() -> None:
+    """Sjekk at kvantiler er innenfor relativ nøyaktighet og at histogram slås sammen."""
+    rng = random.Random(0)
+    values = [int(rng.lognormvariate(7, 1.2)) for _ in range(10_000)]
+    first, second, combined = LengthSketch(), LengthSketch(), LengthSketch()
+    for i, value in enumerate(values):
+        (first if i % 2 else second).add(value)
+        combined.add(value)
+    first.merge(second)
+    assert first.to_dict() == combined.to_dict()
+
+    values.sort()
+    for q in (0.1, 0.5, 0.9, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(first.quantile(q) - exact) <= 0.01 * exact + 1
+    assert first.count == len(values)
+    assert (first.min, first.max) == (values[0], values[-1])
+    assert first.ecdf()[-1][1] == 1.0
+
+
+def test_profile_corpus(corpus: Callable[[int], list[Document]]) -> None:
+    """Sjekk at profilen grupperer etter nivå og metadata."""
+    docs = [
+        Document(
+            page_content=doc.page_content,
+            metadata=doc.metadata | {"ArticleType": ["Rutine", "Intern"][i % 2]},
+        )
+        for i, doc in enumerate(corpus(20))
+    ]
+    profile = profile_corpus(iter(docs), chunk_size=1500, batch_size=7).to_dict()
+    assert set(profile) == {"section", "article", "chunk"}
+    assert profile["section"]["Alle"]["Alle"]["count"] == len(docs)
+    assert profile["article"]["ArticleType"]["Rutine"]["count"] == 10
+    assert profile["section"]["ContentColumn"]["Article__c"]["max"] == max(
+        len(doc.page_content) for doc in docs
+    )
+    assert profile["chunk"]["Alle"]["Alle"]["count"] > len(docs)
+
+    profile = profile_corpus(docs, chunk_size=None).to_dict()
+    assert "chunk" not in profile
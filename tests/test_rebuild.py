@@ -0,0 +1,174 @@
+"""Tester for blå/grønn ombygging av indeksen."""
+
+import json
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+from langchain_core.documents import Document
+
+from nks_kbs_analyse import rebuild
+from nks_kbs_analyse.rebuild import (
+    IndexPointer,
+    ValidationQuery,
+    is_versioned_index_name,
+    load_validation_queries,
+    rebuild_index,
+    validate_store,
+    versioned_index_name,
+)
+
+
+class FakeStore:
+    """Indeks som finner artiklene som har ordet i spørringen."""
+
+    def __init__(self, articles: dict[str, str]):
+        """Lag indeks med tekst per `KnowledgeArticleId`."""
+        self.articles = articles
+
+    def similarity_search(self, query: str, k: int = 4) -> list[Document]:
+        """Finn artikler som inneholder `query`."""
+        return [
+            Document(page_content=text, metadata={"KnowledgeArticleId": key})
+            for key, text in self.articles.items()
+            if query in text
+        ][:k]
+
+
+def test_versioned_index_name() -> None:
+    """Sjekk at navnet er gyldig i Azure AI Search."""
+    name = versioned_index_name("Chunk_Size 1500", datetime(2024, 10, 17, 12, 0, 5))
+    assert name == "chunk-size-1500-v20241017t120005"
+    assert is_versioned_index_name("Chunk_Size 1500", name)
+    assert not is_versioned_index_name("chunk_size", name)
+    assert not is_versioned_index_name("chunk_size_1500", "chunk_size_1500")
+    assert not is_versioned_index_name("kb", "kb-v1")
+
+
+def test_index_pointer(tmp_path: Path) -> None:
+    """Sjekk bytte av aktiv versjon og rollback."""
+    pointer = IndexPointer(tmp_path / "indekser.json")
+    assert pointer.active("kb") is None
+    assert pointer.switch("kb", "kb-v1") == "kb", "Indeksen selv er aktiv først"
+    assert pointer.switch("kb", "kb-v2") == "kb-v1"
+    pointer.switch("kb", "kb-v3")
+    assert pointer.previous("kb") == ["kb-v2", "kb-v1", "kb"]
+
+    # En ny peker leser samme fil
+    other = IndexPointer(tmp_path / "indekser.json")
+    assert other.active("kb") == "kb-v3"
+    assert other.rollback("kb") == "kb-v2"
+    assert pointer.active("kb") == "kb-v2"
+    assert pointer.previous("kb") == ["kb-v1", "kb"]
+    assert pointer.rolled_back("kb") == ["kb-v3"]
+
+    # Tilbake til versjonen man gikk tilbake fra
+    assert pointer.switch("kb", "kb-v3") == "kb-v2"
+    assert pointer.previous("kb") == ["kb-v2", "kb-v1", "kb"]
+    assert pointer.rolled_back("kb") == []
+
+    pointer.rollback("kb")
+    pointer.forget("kb", ["kb-v1", "kb", "kb-v3"])
+    assert pointer.rolled_back("kb") == []
+    with pytest.raises(ValueError, match="Ingen tidligere versjon"):
+        pointer.rollback("kb")
+    assert pointer.active("annen") is None
+
+
+def test_validate_store(tmp_path: Path) -> None:
+    """Sjekk at tomme svar og manglende forventede artikler rapporteres."""
+    path = tmp_path / "sjekk.jsonl"
+    path.write_text(
+        "\n".join(
+            json.dumps(row)
+            for row in [
+                {"query": "dagpenger", "expected": ["a1"]},
+                {"query": "sykepenger", "expected": ["a1"]},
+                {"query": "meldekort"},
+                {"query": "barnetrygd"},
+            ]
+        ),
+        encoding="utf-8",
+    )
+    queries = load_validation_queries(path)
+    assert queries[0] == ValidationQuery("dagpenger", ["a1"])
+
+    store: Any = FakeStore(
+        {
+            "a1": "Om dagpenger",
+            "a2": "Om sykepenger og meldekort",
+        }
+    )
+    report = validate_store(store, queries, documents=2)
+    assert report.empty == ["barnetrygd"]
+    assert report.misses == ["sykepenger"]
+    assert report.hit_rate == 0.5
+
+
+class FakeIndexClient:
+    """`SearchIndexClient` som husker slettede indekser."""
+
+    def __init__(self) -> None:
+        """Lag klient uten slettede indekser."""
+        self.deleted: list[str] = []
+
+    def get_index_statistics(self, name: str) -> dict[str, int]:
+        """Alle indekser har like mange dokumenter."""
+        return {"document_count": 10}
+
+    def delete_index(self, name: str) -> None:
+        """Husk at `name` er slettet."""
+        self.deleted.append(name)
+
+
+@pytest.mark.parametrize("shared", [True, False])
+def test_rebuild_deletes_own_versions(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, shared: bool
+) -> None:
+    """Sjekk at bare egne versjoner slettes, og bare med delt peker."""
+    pytest.importorskip("azure.search.documents")
+    from nks_kbs_analyse import azure_search, upload
+
+    index_client = FakeIndexClient()
+    monkeypatch.setattr(azure_search, "index_admin_client", lambda: index_client)
+    monkeypatch.setattr(
+        azure_search,
+        "create_store",
+        lambda embedding, index_name: SimpleNamespace(
+            client=SimpleNamespace(get_document_count=lambda: 10)
+        ),
+    )
+    monkeypatch.setattr(
+        upload,
+        "BulkUploader",
+        lambda store, embedding: SimpleNamespace(
+            upload=lambda chunks: SimpleNamespace(succeeded=True)
+        ),
+    )
+    monkeypatch.setattr(
+        rebuild,
+        "get_settings",
+        lambda: SimpleNamespace(
+            index_pointer=tmp_path / "indekser.json" if shared else None,
+            cache_dir=tmp_path,
+        ),
+    )
+
+    pointer = IndexPointer()
+    assert pointer.shared is shared
+    v1 = versioned_index_name("kb", datetime(2024, 1, 1))
+    v2 = versioned_index_name("kb", datetime(2024, 2, 1))
+    for name in [v1, "kb-manuell", v2]:
+        pointer.switch("kb", name)
+    assert pointer.previous("kb") == ["kb-manuell", v1, "kb"]
+
+    result = rebuild_index([], base="kb", keep=0, pointer=pointer)
+    assert result.switched and pointer.active("kb") == result.name
+    if shared:
+        assert result.deleted == index_client.deleted == [v2, v1]
+        assert pointer.previous("kb") == ["kb-manuell", "kb"]
+    else:
+        assert result.deleted == index_client.deleted == []
+        assert pointer.previous("kb") == [v2, "kb-manuell", v1, "kb"]
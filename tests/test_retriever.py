@@ -1,13 +1,22 @@
 """Test NKS LangChain retrieveren."""
 
+import asyncio
+import datetime
+import functools
 import os
-from typing import cast
+import threading
+import time
+from pathlib import Path
+from typing import Any, cast
 
+import httpx
 import pytest
+from langchain_core.documents import Document
 from pydantic import HttpUrl
 from pytest_benchmark.fixture import BenchmarkFixture
 
 from nks_kbs_analyse.auth import BrowserSessionAuthentication, BrowserType
+from nks_kbs_analyse.cache import RetrieverCache
 from nks_kbs_analyse.retriever import NKSRetriever
 
 
@@ -65,3 +74,158 @@ def test_nks_bench(benchmark: BenchmarkFixture, retriever: NKSRetriever) -> None
     docs = benchmark(retriever.invoke, "Hva er dagpenger?")
     assert docs
     assert len(docs) == retriever.k
+
+
+class FakeAuth(BrowserSessionAuthentication):
+    """Autentisering som lager sesjonen selv i stedet for å bruke nettleser."""
+
+    def __init__(self) -> None:
+        """Lag autentisering uten sesjon."""
+        super().__init__(HttpUrl("https://nks-vdb.test"))
+        self.refreshes = 0
+
+    def _check_session(self) -> bool:
+        """Lag en ny sesjon hvis den mellomlagrede har gått ut."""
+        if self._cached_valid():
+            return True
+        time.sleep(0.05)
+        self.refreshes += 1
+        self.client.cookies.set("session", f"token-{self.refreshes}")
+        self.ends_at = datetime.datetime.now(datetime.UTC) + datetime.timedelta(hours=1)
+        return True
+
+
+def test_async_retriever(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Sjekk samtidige asynkrone kall med delt klient og én fornyelse av sesjon."""
+    active = 0
+    max_active = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal active, max_active
+        assert request.headers["cookie"] == "session=token-1"
+        active += 1
+        max_active = max(max_active, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        k = int(request.url.params["num_results"])
+        query = request.url.params["query"]
+        return httpx.Response(
+            200,
+            json=[
+                {
+                    "content": f"{query} {i}",
+                    "metadata": {"KnowledgeArticleId": str(i)},
+                    "semantic_similarity": 1 - i / 10,
+                    "score": 1 - i / 10,
+                }
+                for i in range(k)
+            ],
+        )
+
+    monkeypatch.setattr(
+        httpx,
+        "AsyncClient",
+        functools.partial(httpx.AsyncClient, transport=httpx.MockTransport(handler)),
+    )
+    auth = FakeAuth()
+    retriever = NKSRetriever(
+        auth=auth, base_url="https://nks-vdb.test", max_connections=8
+    )
+
+    async def run() -> list[list[Document]]:
+        results = await retriever.abatch([f"spørsmål {i}" for i in range(50)], k=3)
+        docs = await retriever.ainvoke("dagpenger", k=2)
+        assert len(retriever._aconns) == 1
+        await retriever.aclose()
+        return results + [docs]
+
+    results = asyncio.run(run())
+    assert [len(docs) for docs in results] == [3] * 50 + [2]
+    assert results[0][0].page_content == "spørsmål 0 0"
+    assert results[-1][1].metadata["Score"] == pytest.approx(0.9)
+    assert auth.refreshes == 1
+    assert max_active > 1
+
+    # Ny event loop gir ny klient
+    asyncio.run(retriever.ainvoke("sykepenger"))
+    assert len(retriever._aconns) == 1
+
+
+def test_retriever_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Sjekk at like søk hentes fra mellomlagringen."""
+    requests: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(
+            200, json=[{"content": "Dagpenger", "metadata": {}, "score": 1.0}]
+        )
+
+    monkeypatch.setattr(
+        httpx,
+        "Client",
+        functools.partial(httpx.Client, transport=httpx.MockTransport(handler)),
+    )
+    monkeypatch.setattr(
+        httpx,
+        "AsyncClient",
+        functools.partial(httpx.AsyncClient, transport=httpx.MockTransport(handler)),
+    )
+    retriever = NKSRetriever(
+        auth=FakeAuth(), base_url="https://nks-vdb.test", cache=RetrieverCache()
+    )
+    docs = retriever.invoke("dagpenger", k=3)
+    assert retriever.invoke("dagpenger", k=3) == docs
+    assert asyncio.run(retriever.ainvoke("dagpenger", k=3)) == docs
+    assert len(requests) == 1
+    retriever.invoke("dagpenger", k=3, fts_weight=0.0)
+    assert len(requests) == 2
+
+    assert retriever.cache is not None
+    retriever.cache.invalidate("https://nks-vdb.test/")
+    retriever.invoke("dagpenger", k=3)
+    assert len(requests) == 3
+    stats = retriever.cache.stats()
+    assert (stats.hits, stats.misses) == (2, 3)
+
+
+def test_async_retriever_disk_cache(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Sjekk at mellomlagring på disk ikke gjøres i tråden til event loop."""
+    monkeypatch.setattr(
+        httpx,
+        "AsyncClient",
+        functools.partial(
+            httpx.AsyncClient,
+            transport=httpx.MockTransport(
+                lambda _: httpx.Response(
+                    200, json=[{"content": "Dagpenger", "metadata": {}, "score": 1.0}]
+                )
+            ),
+        ),
+    )
+    cache = RetrieverCache(disk=tmp_path / "vdb.sqlite")
+    assert cache.disk is not None
+    threads: list[int] = []
+    for name in ("get", "set"):
+        method = getattr(cache.disk, name)
+
+        def record(*args: Any, method: Any = method) -> Any:
+            threads.append(threading.get_ident())
+            return method(*args)
+
+        monkeypatch.setattr(cache.disk, name, record)
+    retriever = NKSRetriever(
+        auth=FakeAuth(), base_url="https://nks-vdb.test", cache=cache
+    )
+
+    async def search() -> list[Document]:
+        await retriever.ainvoke("dagpenger")
+        cache._memory.clear()
+        return await retriever.ainvoke("dagpenger")
+
+    docs = asyncio.run(search())
+    assert [doc.page_content for doc in docs] == ["Dagpenger"]
+    assert len(threads) == 3, "Oppslag, lagring og oppslag igjen"
+    assert threading.get_ident() not in threads
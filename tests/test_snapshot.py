@@ -0,0 +1,78 @@
+"""Tester for lokal kopi av kunnskapsbasen."""
+
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pytest
+
+from nks_kbs_analyse import knowledgebase
+from nks_kbs_analyse.snapshot import KnowledgeBaseSnapshot
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+pa = pytest.importorskip("pyarrow")
+
+
+def _rows(*rows: tuple[str, str, str, int]) -> "pa.Table":
+    """Hjelpemetode for å lage rader slik de kommer fra BigQuery."""
+    return pa.Table.from_pylist(
+        [
+            {
+                "ArticleType": "Kunnskapsartikkel",
+                "DataCategories": "Dagpenger",
+                "KnowledgeArticleId": article_id,
+                "KnowledgeArticle_QuartoUrl": f"https://quarto/{article_id}",
+                "LastModifiedBQ": datetime(2024, 9, day, tzinfo=timezone.utc),
+                "Title": f"Artikkel {article_id}",
+                "ContentColumn": column,
+                "Content": content,
+            }
+            for article_id, column, content, day in rows
+        ]
+    )
+
+
+def test_refresh(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Sjekk at oppdatering henter endringer og fjerner inaktive artikler."""
+    calls: list[datetime | None] = []
+    tables = [
+        _rows(
+            ("a", "Article__c", "Første versjon av a", 1),
+            ("a", "NKS_User__c", "Til bruker for a", 1),
+            ("b", "Article__c", "Artikkel b", 2),
+            ("c", "Article__c", "Artikkel c", 3),
+        ),
+        _rows(("a", "Article__c", "Andre versjon av a", 5)),
+    ]
+
+    def fake_load_table(last_modified: datetime | None = None) -> "pa.Table":
+        calls.append(last_modified)
+        return tables[len(calls) - 1]
+
+    active = [{"a", "b", "c"}, {"a", "b"}]
+    monkeypatch.setattr(knowledgebase, "load_table", fake_load_table)
+    monkeypatch.setattr(
+        knowledgebase, "get_active_article_ids", lambda: active[len(calls) - 1]
+    )
+
+    snapshot = KnowledgeBaseSnapshot(tmp_path)
+    result = snapshot.refresh()
+    assert result.total == 4
+    assert snapshot.watermark == datetime(2024, 9, 3, tzinfo=timezone.utc)
+
+    result = snapshot.refresh()
+    assert calls[-1] == datetime(2024, 9, 3, tzinfo=timezone.utc)
+    assert result.fetched == 1
+    assert result.removed == 1, "Artikkel 'c' skal fjernes"
+    assert snapshot.watermark == datetime(2024, 9, 5, tzinfo=timezone.utc)
+
+    docs = {
+        (doc.metadata["KnowledgeArticleId"], doc.metadata["ContentColumn"]): doc
+        for doc in snapshot.load()
+    }
+    # Alle rader for en endret artikkel erstattes
+    assert set(docs) == {("a", "Article__c"), ("b", "Article__c")}
+    assert docs[("a", "Article__c")].page_content == "Andre versjon av a"
+    assert docs[("b", "Article__c")].metadata["Tab"] == "Personbruker"
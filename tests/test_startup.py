@@ -0,0 +1,58 @@
+"""Tester for oppstartstid for kommandolinjeverktøyet og biblioteket."""
+
+import json
+import subprocess
+import sys
+from typing import Any, Callable
+
+import pytest
+from pytest_benchmark.fixture import BenchmarkFixture
+
+HEAVY_MODULES = [
+    "browser_cookie3",
+    "httpx",
+    "pydantic_settings",
+    "rich.console",
+    "langchain_text_splitters",
+]
+"""Moduler som ikke skal importeres før en kommando trenger dem"""
+
+
+def _imported(module: str) -> set[str]:
+    """Importer `module` i en ny prosess og returner tunge moduler som ble lastet."""
+    code = (
+        "import json, sys\n"
+        f"import {module}\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return set(json.loads(result.stdout))
+
+
+def test_cli_imports_are_lazy() -> None:
+    """Sjekk at oppstart av CLI ikke importerer tunge moduler."""
+    assert _imported("nks_kbs_analyse.cli.main") == set()
+
+
+@pytest.mark.parametrize(
+    "module",
+    ["nks_kbs_analyse.knowledgebase", "nks_kbs_analyse.settings"],
+)
+def test_library_imports_are_lazy(module: str) -> None:
+    """Sjekk at biblioteket ikke leser innstillinger eller importerer klienter."""
+    assert _imported(module) <= {"pydantic_settings"}
+
+
+@pytest.mark.benchmark
+def test_cli_startup_benchmark(benchmark: BenchmarkFixture) -> None:
+    """Mål tiden det tar å starte en ny prosess og importere CLI."""
+    # 'pedantic' mangler typer i pytest-benchmark
+    pedantic: Callable[..., Any] = benchmark.pedantic
+    pedantic(
+        subprocess.run,
+        args=([sys.executable, "-c", "import nks_kbs_analyse.cli.main"],),
+        kwargs={"check": True},
+        rounds=5,
+    )
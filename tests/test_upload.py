@@ -0,0 +1,109 @@
+"""Tester for parallell opplasting."""
+
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Sequence
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from nks_kbs_analyse.upload import BulkUploader, UploadCheckpoint, UploadProgress
+
+
+class FakeStore:
+    """Indeks i minnet med samme `upload_batch` som `AzureExtended`."""
+
+    def __init__(self, fail: Sequence[str] = (), crash_after: int | None = None):
+        """Lag indeks der innholdet i `fail` alltid feiler."""
+        self.documents: dict[str, dict[str, Any]] = {}
+        self.fail = set(fail)
+        self.crash_after = crash_after
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def upload_batch(
+        self,
+        ids: Sequence[str],
+        texts: Sequence[str],
+        embeddings: Sequence[list[float]],
+        metadatas: Sequence[dict[str, Any]],
+        max_retries: int = 5,
+    ) -> Any:
+        """Last opp dokumentene som ikke skal feile."""
+        with self._lock:
+            self.calls += 1
+            if self.crash_after is not None and self.calls > self.crash_after:
+                raise ConnectionError("Mistet forbindelsen")
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.01)
+        failed = {}
+        for key, text, embedding, metadata in zip(ids, texts, embeddings, metadatas):
+            if text in self.fail:
+                failed[key] = "400: Ugyldig dokument"
+            else:
+                self.documents[key] = {"content": text, "metadata": metadata}
+        with self._lock:
+            self.in_flight -= 1
+        return SimpleNamespace(keys=list(ids), failed=failed)
+
+
+def _chunks(n: int) -> list[Document]:
+    return [
+        Document(
+            page_content=f"Tekst {i}",
+            metadata={"KnowledgeArticleId": f"a{i // 3}", "ContentColumn": "Article"},
+        )
+        for i in range(n)
+    ]
+
+
+def test_upload(tmp_path: Path) -> None:
+    """Sjekk parallell opplasting, feil og status."""
+    store: Any = FakeStore(fail=["Tekst 7"])
+    reports: list[UploadProgress] = []
+    uploader = BulkUploader(
+        store,
+        embedding=DeterministicFakeEmbedding(size=4),
+        batch_size=5,
+        max_in_flight=3,
+        checkpoint=tmp_path / "sjekkpunkt.txt",
+        progress=lambda progress: reports.append(UploadProgress(**vars(progress))),
+    )
+    result = uploader.upload(_chunks(42))
+    assert len(store.documents) == 41
+    assert list(result.failed.values()) == ["400: Ugyldig dokument"]
+    assert (result.progress.uploaded, result.progress.failed) == (41, 1)
+    assert 1 < store.max_in_flight <= 3
+    assert len(reports) == 9
+    assert reports[-1].uploaded + reports[-1].failed == 42
+    assert reports[-1].eta == 0
+    assert all(
+        "EmbeddingCreation" in doc["metadata"] for doc in store.documents.values()
+    )
+    assert len(UploadCheckpoint(tmp_path / "sjekkpunkt.txt").load()) == 41
+
+
+def test_resume_upload(tmp_path: Path) -> None:
+    """Sjekk at en avbrutt opplasting fortsetter der den stoppet."""
+    checkpoint = tmp_path / "sjekkpunkt.txt"
+    store: Any = FakeStore(crash_after=2)
+    embedding = DeterministicFakeEmbedding(size=4)
+    with pytest.raises(ConnectionError):
+        BulkUploader(
+            store, embedding, batch_size=10, max_in_flight=1, checkpoint=checkpoint
+        ).upload(_chunks(100))
+    assert len(store.documents) == 20
+
+    store.crash_after = None
+    result = BulkUploader(
+        store, embedding, batch_size=10, checkpoint=checkpoint
+    ).upload(_chunks(100))
+    assert result.succeeded
+    assert (result.progress.skipped, result.progress.uploaded) == (20, 80)
+    assert len(store.documents) == 100
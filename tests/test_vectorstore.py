@@ -0,0 +1,203 @@
+"""Tester for lokal vector store."""
+
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from pytest_benchmark.fixture import BenchmarkFixture
+
+from nks_kbs_analyse import vectorstore
+from nks_kbs_analyse.vectorstore import LocalVectorStore, QuantizedVectors
+
+if TYPE_CHECKING:
+    import numpy as np
+
+np = pytest.importorskip("numpy")
+
+
+def _exact_top_k(vectors: "np.ndarray", queries: "np.ndarray", k: int) -> "np.ndarray":
+    x = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    q = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.argsort(-(q @ x.T), axis=1)[:, :k]
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_quantized_top_k(dtype: str) -> None:
+    """Sjekk at komprimerte vektorer gir nesten samme topp k som `float64`."""
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(2000, 64))
+    queries = vectors[:20] + rng.normal(scale=0.5, size=(20, 64))
+    encoded = QuantizedVectors.encode(vectors, dtype=dtype)  # type: ignore[arg-type]
+    assert encoded.dtype == dtype
+
+    indices, scores = encoded.top_k(queries, k=10, block_size=300)
+    assert indices.shape == scores.shape == (20, 10)
+    assert (np.diff(scores, axis=1) <= 0).all(), "Høyeste likhet skal komme først"
+    assert (indices[:, 0] == np.arange(20)).all()
+    expected = _exact_top_k(vectors, queries, 10)
+    overlap = np.mean(
+        [len(set(a) & set(b)) / 10 for a, b in zip(indices, expected, strict=True)]
+    )
+    assert overlap >= 0.95
+
+
+def test_truncate_dimensions() -> None:
+    """Sjekk at vektorer kuttes og normaliseres på nytt."""
+    encoded = QuantizedVectors.encode([[3.0, 4.0, 100.0]], "float32", dimensions=2)
+    assert encoded.dimensions == 2
+    assert np.allclose(encoded.vectors, [[0.6, 0.8]])
+    with pytest.raises(ValueError):
+        QuantizedVectors.encode([[1.0, 2.0]], dimensions=3)
+
+
+def test_local_vector_store(tmp_path: Path) -> None:
+    """Sjekk søk, erstatning, sletting og lagring som minnekart."""
+    embedding = DeterministicFakeEmbedding(size=32)
+    store = LocalVectorStore(embedding, dtype="int8", dimensions=16)
+    texts = [f"Tekst nummer {i}" for i in range(50)]
+    ids = store.add_documents(
+        [
+            Document(
+                id=f"id-{i}",
+                page_content=text,
+                metadata={"Tab": str(i % 3), "LastModifiedBQ": datetime(2024, 1, 1)},
+            )
+            for i, text in enumerate(texts)
+        ]
+    )
+    assert ids == [f"id-{i}" for i in range(50)]
+    assert store.vectors is not None
+    assert store.vectors.nbytes == 50 * (16 + 4)
+
+    (doc, score), *_ = store.similarity_search_with_score("Tekst nummer 7", k=3)
+    assert doc.id == "id-7"
+    assert score == pytest.approx(1.0, abs=0.02)
+
+    store.add_texts(["Ny tekst"], [{"Tab": "x"}], ids=["id-7"])
+    assert len(store) == 50
+    assert store.get_by_ids(["id-7"])[0].page_content == "Ny tekst"
+    assert store.delete(["id-0", "mangler"])
+    assert not store.get_by_ids(["id-0"])
+
+    store.save(tmp_path / "store")
+    loaded = LocalVectorStore.load(tmp_path / "store", embedding)
+    assert loaded.vectors is not None
+    assert isinstance(loaded.vectors.vectors, np.memmap)
+    assert len(loaded) == 49
+    assert loaded.similarity_search("Ny tekst", k=1)[0].id == "id-7"
+    assert loaded.get_by_ids(["id-3"])[0].metadata == {
+        "Tab": "0",
+        "LastModifiedBQ": "2024-01-01T00:00:00",
+    }
+    assert loaded.clear()
+    assert loaded.similarity_search("Ny tekst") == []
+
+
+def _clustered_store(
+    n: int = 4000, dim: int = 32
+) -> tuple[LocalVectorStore, "np.ndarray"]:
+    """Vector store med vektorer rundt 40 tilfeldige sentre."""
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(40, dim))
+    vectors = centers[rng.integers(40, size=n)] + rng.normal(scale=0.3, size=(n, dim))
+    store = LocalVectorStore(DeterministicFakeEmbedding(size=dim))
+    store.add_embeddings(
+        [f"Tekst {i}" for i in range(n)],
+        vectors,
+        metadatas=[
+            {"Tab": ["Regelverk", "Til bruker"][i % 2], "ArticleType": str(i % 5)}
+            for i in range(n)
+        ],
+        ids=[str(i) for i in range(n)],
+    )
+    return store, vectors
+
+
+def test_metadata_filter() -> None:
+    """Sjekk at bare dokumenter som oppfyller filteret returneres."""
+    store, vectors = _clustered_store(n=500)
+    results = store.batch_similarity_search_with_score_by_vector(
+        vectors[:10], k=20, filter={"Tab": "Regelverk", "ArticleType": ["1", "2"]}
+    )
+    assert all(len(docs) == 20 for docs in results)
+    for docs in results:
+        for doc, _ in docs:
+            assert doc.metadata["Tab"] == "Regelverk"
+            assert doc.metadata["ArticleType"] in ("1", "2")
+    assert (
+        store.similarity_search_by_vector(list(vectors[0]), filter={"Tab": "x"}) == []
+    )
+
+
+def test_ivf_index() -> None:
+    """Sjekk at omtrentlig søk finner nesten de samme dokumentene som eksakt."""
+    store, vectors = _clustered_store()
+    queries = vectors[:200] + np.random.default_rng(2).normal(scale=0.1, size=(200, 32))
+    exact = store.batch_similarity_search_with_score_by_vector(queries, k=10)
+    index = store.build_index(n_lists=60, n_probe=6)
+    assert sum(len(rows) for rows in index.lists) == len(store)
+    approximate = store.batch_similarity_search_with_score_by_vector(queries, k=10)
+    recall = np.mean(
+        [
+            len({doc.id for doc, _ in a} & {doc.id for doc, _ in e}) / 10
+            for a, e in zip(approximate, exact, strict=True)
+        ]
+    )
+    assert recall >= 0.9
+
+    filtered = store.batch_similarity_search_with_score_by_vector(
+        queries, k=5, filter={"ArticleType": "3"}
+    )
+    assert all(
+        doc.metadata["ArticleType"] == "3" for docs in filtered for doc, _ in docs
+    )
+
+    # Indeksen bygges på nytt når dokumenter legges til
+    store.add_embeddings(["Ny"], [queries[0] * 10], ids=["ny"])
+    assert store.index is None
+    (doc, score), *_ = store.similarity_search_with_score_by_vector(list(queries[0]))
+    assert doc.id == "ny"
+    assert store.index is not None
+
+
+@pytest.mark.parametrize(
+    "factor", [vectorstore.EXACT_FILTER_FACTOR, 0], ids=["eksakt", "indeks"]
+)
+def test_ivf_rare_filter(monkeypatch: pytest.MonkeyPatch, factor: int) -> None:
+    """Sjekk at et filter med få dokumenter gir `k` treff også med indeks."""
+    monkeypatch.setattr(vectorstore, "EXACT_FILTER_FACTOR", factor)
+    store, vectors = _clustered_store()
+    rare = vectors[[5, 1500, 3000]] + 0.1
+    store.add_embeddings(
+        ["Sjelden 1", "Sjelden 2", "Sjelden 3"],
+        rare,
+        metadatas=[{"Tab": "Sjelden"}] * 3,
+    )
+    store.build_index(n_probe=2)
+    results = store.batch_similarity_search_with_score_by_vector(
+        vectors[:50], k=3, filter={"Tab": "Sjelden"}
+    )
+    assert all(
+        sorted(doc.page_content for doc, _ in docs)
+        == ["Sjelden 1", "Sjelden 2", "Sjelden 3"]
+        for docs in results
+    )
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("exact", [True, False])
+def test_batch_search_speed(
+    benchmark: BenchmarkFixture, throughput: Callable[..., None], exact: bool
+) -> None:
+    """Mål antall spørringer per sekund med og uten indeks."""
+    store, vectors = _clustered_store(n=20_000, dim=256)
+    store.build_index()
+    queries = vectors[:1000]
+    result = benchmark(
+        store.batch_similarity_search_with_score_by_vector, queries, k=10, exact=exact
+    )
+    throughput(queries=len(queries))
+    assert len(result) == len(queries)